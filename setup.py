@@ -3,6 +3,17 @@ from setuptools.command.build_ext import build_ext
 import pybind11
 import os
 
+# 编译选项
+#   -flto / -funroll-loops：跨文件内联 + 循环展开，便于扫描循环自动向量化
+#   PMCAD_MARCH：可选的目标指令集（如 native / x86-64-v3）。
+#     默认不加 -march，保证编译出的 wheel 可以在其他机器上运行。
+extra_compile_args = ["-std=c++17", "-O3", "-fPIC", "-flto", "-funroll-loops"]
+extra_link_args = ["-flto"]
+
+march = os.environ.get("PMCAD_MARCH")
+if march:
+    extra_compile_args.append(f"-march={march}")
+
 # 定义C++扩展
 ext_modules = [
     Extension(
@@ -12,18 +23,21 @@ ext_modules = [
             "src/cpp/reader.cpp",
             "src/cpp/gene_match.cpp",
             "src/cpp/uniprot_importer.cpp",
+            "src/cpp/pg_copy.cpp",
+            "src/cpp/dict_builder.cpp",
         ],
         include_dirs=[
             "src/cpp",
             pybind11.get_include(),
             os.path.expanduser("~/pgsql/include"),
         ],
-        libraries=["pqxx", "pq", "z"],
+        libraries=["pq", "z"],
         library_dirs=[
             os.path.expanduser("~/pgsql/lib")
-        ],  # libpqxx/libpq library path
+        ],  # libpq library path
         language="c++",
-        extra_compile_args=["-std=c++17", "-O3", "-fPIC"],
+        extra_compile_args=extra_compile_args,
+        extra_link_args=extra_link_args,
     ),
 ]
 
@@ -1,6 +1,7 @@
 #include <pybind11/pybind11.h>
 #include <pybind11/stl.h>
 
+#include "dict_builder.h"
 #include "gene_match.h"
 #include "reader.h"
 #include "uniprot_importer.h"
@@ -12,41 +13,85 @@ PYBIND11_MODULE(_core, m) {
 
     // ================= Reader =================
     m.def("read_tsv_file", &pmcad::Reader::read_tsv_file,
-          "Read a single TSV file", py::arg("filename"));
+          "Read a single TSV file", py::arg("filename"),
+          py::call_guard<py::gil_scoped_release>());
 
     m.def("read_multi_tsv", &pmcad::Reader::read_multi_tsv,
-          "Read multiple TSV files", py::arg("filelist"));
+          "Read multiple TSV files", py::arg("filelist"),
+          py::call_guard<py::gil_scoped_release>());
+
+    m.def("read_multi_tsv_columns", &pmcad::Reader::read_multi_tsv_columns,
+          "Read multiple TSV files column-wise, returning (header, columns)",
+          py::arg("filelist"),
+          py::call_guard<py::gil_scoped_release>());
 
     m.def("read_tsv_safe", &pmcad::Reader::read_tsv_safe,
           "Read TSV file with error handling",
-          py::arg("filename"), py::arg("skip_errors") = true);
+          py::arg("filename"), py::arg("skip_errors") = true,
+          py::call_guard<py::gil_scoped_release>());
 
     m.def("read_tsv_as_double", &pmcad::Reader::read_tsv_as_double,
           "Read TSV file and convert to double",
-          py::arg("filename"));
+          py::arg("filename"),
+          py::call_guard<py::gil_scoped_release>());
 
     m.def("read_tsv_as_int", &pmcad::Reader::read_tsv_as_int,
           "Read TSV file and convert to int",
-          py::arg("filename"));
+          py::arg("filename"),
+          py::call_guard<py::gil_scoped_release>());
 
     m.def("find_files", &pmcad::Reader::find_files,
           "Find files with given pattern in a directory",
-          py::arg("foldername"), py::arg("pattern"));
+          py::arg("foldername"), py::arg("pattern"),
+          py::arg("threads") = 0,
+          py::call_guard<py::gil_scoped_release>());
+
+    m.def("find_files_many", &pmcad::Reader::find_files_many,
+          "Find files matching each of several patterns in one directory walk",
+          py::arg("foldername"), py::arg("patterns"),
+          py::arg("threads") = 0,
+          py::call_guard<py::gil_scoped_release>());
 
     m.def("insert_files_to_pgdb", &pmcad::Reader::insert_files_to_pgdb,
           py::arg("filelist"), py::arg("table_name"),
           py::arg("dbname"), py::arg("user"),
           py::arg("password"), py::arg("host") = "localhost",
           py::arg("port") = "5432", py::arg("verbose") = false,
-          "Insert TSV files into PostgreSQL database");
+          py::arg("staging") = false,
+          py::call_guard<py::gil_scoped_release>(),
+          "Insert TSV (or .tsv.gz) files into PostgreSQL database");
+
+    m.def("copy_gz_table", &pmcad::Reader::copy_gz_table,
+          py::arg("gz_file"), py::arg("table_name"),
+          py::arg("dbname"), py::arg("user"),
+          py::arg("password"), py::arg("host") = "localhost",
+          py::arg("port") = "5432", py::arg("delimiter") = "\t",
+          py::arg("skip_header") = true, py::arg("verbose") = false,
+          py::call_guard<py::gil_scoped_release>(),
+          "Stream a (gzip) text table into an existing PostgreSQL table via COPY");
 
     // ================= GeneMatch =================
     m.def("match_reference", &pmcad::GeneMatch::match_reference,
           "Match the gene query to reference data",
           py::arg("query"), py::arg("reference"),
-          py::arg("verbose"));
+          py::arg("verbose"),
+          py::call_guard<py::gil_scoped_release>());
+
+    m.def("create_dict",
+          [](py::object x, py::object y,
+             const std::vector<std::string>& splitx_by, bool intern_keys) {
+              PyObject* res = pmcad::DictBuilder::create_dict(
+                  x.ptr(), y.ptr(), splitx_by, intern_keys);
+              if (!res) throw py::error_already_set();
+              return py::reinterpret_steal<py::dict>(res);
+          },
+          "Map each (split, stripped, lowercased) x to the list of matching y",
+          py::arg("x"), py::arg("y"),
+          py::arg("splitx_by") = std::vector<std::string>{},
+          py::arg("intern_keys") = false);
 
     // ================= UniprotImporter =================
+    // 解析 + COPY 全程只用 C++ 对象，释放 GIL 后多个导入可在 Python 线程中并行
     py::class_<pmcad::UniprotImporter>(m, "UniprotImporter")
         // -------- FT parser binding --------
         .def_static(
@@ -61,6 +106,7 @@ PYBIND11_MODULE(_core, m) {
             py::arg("port") = "5432",
             py::arg("batch_commit") = 200000,
             py::arg("verbose") = true,
+            py::call_guard<py::gil_scoped_release>(),
             R"doc(
 Stream-parse UniProt .dat.gz Feature Table (FT) records and import directly into PostgreSQL.
 
@@ -109,6 +155,7 @@ Table schema created automatically:
             py::arg("port") = "5432",
             py::arg("batch_commit") = 200000,
             py::arg("verbose") = true,
+            py::call_guard<py::gil_scoped_release>(),
             R"doc(
 Stream-parse UniProt .dat.gz Database Reference (DR) records and import directly into PostgreSQL.
 
@@ -161,6 +208,7 @@ Table schema created automatically:
             py::arg("port") = "5432",
             py::arg("batch_commit") = 20000,
             py::arg("verbose") = true,
+            py::call_guard<py::gil_scoped_release>(),
             R"doc(
 Stream-parse UniProt .dat.gz Sequence (SQ) records and import directly into PostgreSQL.
 
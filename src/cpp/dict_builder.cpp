@@ -0,0 +1,269 @@
+#include "dict_builder.h"
+
+#include <algorithm>
+#include <string_view>
+
+namespace pmcad {
+
+namespace {
+
+// ASCII 查找表：大写转小写；以及 Python str.isspace() 在 ASCII 内为真的字符
+// （\t \n \v \f \r、\x1c-\x1f、空格），保证与 str.strip().lower() 结果一致
+struct AsciiTables {
+    unsigned char lower[256];
+    bool space[256];
+
+    AsciiTables() {
+        for (int c = 0; c < 256; ++c) {
+            lower[c] = (c >= 'A' && c <= 'Z') ? static_cast<unsigned char>(c + 32)
+                                              : static_cast<unsigned char>(c);
+            space[c] = (c >= 0x09 && c <= 0x0d) || (c >= 0x1c && c <= 0x20);
+        }
+    }
+};
+
+const AsciiTables kTables;
+
+std::string_view ascii_strip(std::string_view s) {
+    size_t b = 0, e = s.size();
+    while (b < e && kTables.space[static_cast<unsigned char>(s[b])]) ++b;
+    while (e > b && kTables.space[static_cast<unsigned char>(s[e - 1])]) --e;
+    return s.substr(b, e - b);
+}
+
+// strip + lower 一次完成：直接写入新建 str 的 1 字节缓冲区，不产生中间字符串
+PyObject* ascii_strip_lower(std::string_view s) {
+    std::string_view v = ascii_strip(s);
+    PyObject* out = PyUnicode_New(static_cast<Py_ssize_t>(v.size()), 127);
+    if (!out) return nullptr;
+    Py_UCS1* buf = PyUnicode_1BYTE_DATA(out);
+    for (size_t i = 0; i < v.size(); ++i) {
+        buf[i] = kTables.lower[static_cast<unsigned char>(v[i])];
+    }
+    return out;
+}
+
+// 持有一个 Python 对象的强引用
+struct PyRef {
+    PyObject* p = nullptr;
+    explicit PyRef(PyObject* o = nullptr) : p(o) {}
+    PyRef(const PyRef&) = delete;
+    PyRef& operator=(const PyRef&) = delete;
+    ~PyRef() { Py_XDECREF(p); }
+    PyObject* get() const { return p; }
+    PyObject* release() {
+        PyObject* o = p;
+        p = nullptr;
+        return o;
+    }
+    explicit operator bool() const { return p != nullptr; }
+};
+
+// 累加到结果 dict：已有键则 append，否则新建 [yi]。
+// 直接使用 Python dict（插入顺序与 Python 版一致，且 str 自带缓存的哈希），
+// 实测比 std::unordered_map<std::string, ...> 再整体转换更快。
+// intern_keys 时只对新插入的键做 intern（每个不同的键一次），
+// 之后与其它 intern 过的字符串比较可走指针相等的快路径。
+bool add_key(PyObject* result, PyObject* key, PyObject* yi, bool intern_keys) {
+    if (!key) return false;
+    PyObject* lst = PyDict_GetItemWithError(result, key);
+    if (lst) return PyList_Append(lst, yi) == 0;
+    if (PyErr_Occurred()) return false;
+    PyRef fresh(PyList_New(1));
+    if (!fresh) return false;
+    Py_INCREF(yi);
+    PyList_SET_ITEM(fresh.get(), 0, yi);
+    Py_INCREF(key);
+    PyRef owned(key);
+    if (intern_keys) PyUnicode_InternInPlace(&owned.p);
+    return PyDict_SetItem(result, owned.get(), fresh.get()) == 0;
+}
+
+bool add_ascii_token(PyObject* result, std::string_view token, PyObject* yi,
+                     bool intern_keys) {
+    PyRef key(ascii_strip_lower(token));
+    return add_key(result, key.get(), yi, intern_keys);
+}
+
+// 非 ASCII 字符串：交给 Python 的 strip()/lower() 处理 Unicode 空白与大小写
+bool add_unicode_token(PyObject* result, PyObject* token, PyObject* yi,
+                       bool intern_keys) {
+    PyRef stripped(PyObject_CallMethod(token, "strip", nullptr));
+    if (!stripped) return false;
+    PyRef lowered(PyObject_CallMethod(stripped.get(), "lower", nullptr));
+    return add_key(result, lowered.get(), yi, intern_keys);
+}
+
+#if PY_VERSION_HEX < 0x030D0000
+#define PMCAD_HAVE_DICT_PRESIZED 1
+#endif
+
+// 处理完前 kSampleRows 行后，按“不同键数 / 行数”外推总键数，换成预分配好的 dict，
+// 避免大输入在增长过程中反复 rehash。输入不足 4 倍采样量时不值得
+constexpr Py_ssize_t kSampleRows = 4096;
+
+bool presize_from_sample(PyRef& result, Py_ssize_t total_rows) {
+#ifdef PMCAD_HAVE_DICT_PRESIZED
+    const Py_ssize_t sampled = PyDict_GET_SIZE(result.get());
+    const Py_ssize_t hint = static_cast<Py_ssize_t>(
+        static_cast<double>(sampled) / kSampleRows * total_rows);
+    if (hint <= sampled * 2) return true;
+    PyRef presized(_PyDict_NewPresized(hint));
+    if (!presized) return false;
+    if (PyDict_Update(presized.get(), result.get()) < 0) return false;
+    std::swap(result.p, presized.p);
+#else
+    (void)result;
+    (void)total_rows;
+#endif
+    return true;
+}
+
+// 分隔符集合：一次扫描即可按其中任意一个拆分。
+// 同一位置有多个分隔符能匹配时取最长的（与 Python 侧正则交替“长的优先”一致）。
+// 对 UTF-8 字节串同样适用：UTF-8 自同步，完整字符的编码不会在别的字符中间匹配。
+class DelimiterSet {
+public:
+    explicit DelimiterSet(const std::vector<std::string>& delims) {
+        for (const auto& d : delims) {
+            if (std::find(delims_.begin(), delims_.end(), d) == delims_.end()) {
+                delims_.push_back(d);
+            }
+        }
+        std::stable_sort(delims_.begin(), delims_.end(),
+                         [](const std::string& a, const std::string& b) {
+                             return a.size() > b.size();
+                         });
+        for (const auto& d : delims_) first_byte_[static_cast<unsigned char>(d[0])] = true;
+    }
+
+    // 依次回调每一段（含空段），语义同 str.split；回调返回 false 时中止并返回 false
+    template <class Fn>
+    bool for_each_part(std::string_view sv, Fn&& fn) const {
+        size_t start = 0;
+        size_t i = 0;
+        while (true) {
+            size_t pos = std::string_view::npos, len = 0;
+            if (delims_.size() == 1) {
+                pos = sv.find(delims_[0], i);
+                len = delims_[0].size();
+            } else {
+                for (; i < sv.size(); ++i) {
+                    if (!first_byte_[static_cast<unsigned char>(sv[i])]) continue;
+                    for (const auto& d : delims_) {
+                        if (sv.compare(i, d.size(), d) == 0) {
+                            len = d.size();
+                            break;
+                        }
+                    }
+                    if (len) {
+                        pos = i;
+                        break;
+                    }
+                }
+            }
+            if (pos == std::string_view::npos) return fn(sv.substr(start));
+            if (!fn(sv.substr(start, pos - start))) return false;
+            start = i = pos + len;
+        }
+    }
+
+private:
+    std::vector<std::string> delims_;
+    bool first_byte_[256] = {};
+};
+
+} // namespace
+
+PyObject* DictBuilder::create_dict(PyObject* x, PyObject* y,
+                                   const std::vector<std::string>& splitx_by,
+                                   bool intern_keys) {
+    for (const auto& d : splitx_by) {
+        if (d.empty()) {
+            PyErr_SetString(PyExc_ValueError, "empty separator");
+            return nullptr;
+        }
+    }
+
+    const DelimiterSet delims(splitx_by);
+
+    PyRef itx(PyObject_GetIter(x));
+    if (!itx) return nullptr;
+    PyRef ity(PyObject_GetIter(y));
+    if (!ity) return nullptr;
+
+    PyRef result(PyDict_New());
+    if (!result) return nullptr;
+
+    // list/tuple 等能给出长度时才做预分配
+    const Py_ssize_t total_rows = PyObject_LengthHint(x, -1);
+    if (total_rows < 0 && PyErr_Occurred()) return nullptr;
+    Py_ssize_t rows = 0;
+
+    // 与 zip(x, y) 一致：任一侧耗尽即停止
+    while (true) {
+        if (++rows == kSampleRows + 1 && total_rows >= 4 * kSampleRows) {
+            if (!presize_from_sample(result, total_rows)) return nullptr;
+        }
+
+        PyRef xi(PyIter_Next(itx.get()));
+        if (!xi) {
+            if (PyErr_Occurred()) return nullptr;
+            break;
+        }
+        PyRef yi(PyIter_Next(ity.get()));
+        if (!yi) {
+            if (PyErr_Occurred()) return nullptr;
+            break;
+        }
+
+        PyRef xs(PyUnicode_Check(xi.get()) ? (Py_INCREF(xi.get()), xi.get())
+                                            : PyObject_Str(xi.get()));
+        if (!xs) return nullptr;
+
+        if (PyUnicode_IS_ASCII(xs.get())) {
+            Py_ssize_t len = 0;
+            const char* data = PyUnicode_AsUTF8AndSize(xs.get(), &len);
+            if (!data) return nullptr;
+            std::string_view sv(data, static_cast<size_t>(len));
+            if (sv == "nan") continue;
+
+            if (splitx_by.empty()) {
+                if (!add_ascii_token(result.get(), sv, yi.get(), intern_keys)) return nullptr;
+                continue;
+            }
+            // 按任一分隔符一次性拆分，每段 strip + lower 后计入
+            if (!delims.for_each_part(sv, [&](std::string_view part) {
+                    return add_ascii_token(result.get(), part, yi.get(), intern_keys);
+                })) {
+                return nullptr;
+            }
+            continue;
+        }
+
+        if (splitx_by.empty()) {
+            if (!add_unicode_token(result.get(), xs.get(), yi.get(), intern_keys)) {
+                return nullptr;
+            }
+            continue;
+        }
+        // 非 ASCII：在 UTF-8 字节上拆分，各段解码后交给 str.strip()/lower()
+        PyRef utf8(PyUnicode_AsEncodedString(xs.get(), "utf-8", "surrogatepass"));
+        if (!utf8) return nullptr;
+        std::string_view bytes(PyBytes_AS_STRING(utf8.get()),
+                               static_cast<size_t>(PyBytes_GET_SIZE(utf8.get())));
+        if (!delims.for_each_part(bytes, [&](std::string_view part) {
+                PyRef token(PyUnicode_DecodeUTF8(part.data(),
+                                                 static_cast<Py_ssize_t>(part.size()),
+                                                 "surrogatepass"));
+                return token && add_unicode_token(result.get(), token.get(), yi.get(),
+                                                  intern_keys);
+            })) {
+            return nullptr;
+        }
+    }
+
+    return result.release();
+}
+
+} // namespace pmcad
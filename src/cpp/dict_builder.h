@@ -0,0 +1,22 @@
+#pragma once
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+
+#include <string>
+#include <vector>
+
+namespace pmcad {
+
+class DictBuilder {
+public:
+    // 与 core.create_dict 语义一致：x 的每个元素按 splitx_by 中任一分隔符
+    // 一次性拆分，子串 strip + lower 后作为键，映射到 y 中对应元素组成的 list。
+    // 返回新引用的 dict；出错时设置 Python 异常并返回 nullptr。
+    // intern_keys 为 true 时对结果中的键做 sys.intern。
+    // 调用方需持有 GIL。
+    static PyObject* create_dict(PyObject* x, PyObject* y,
+                                 const std::vector<std::string>& splitx_by,
+                                 bool intern_keys = false);
+};
+
+} // namespace pmcad
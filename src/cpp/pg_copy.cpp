@@ -0,0 +1,208 @@
+// src/cpp/pg_copy.cpp
+#include "pg_copy.h"
+
+#include <arpa/inet.h>
+
+#include <cstring>
+
+namespace pmcad {
+
+namespace {
+
+// PGCOPY\n\377\r\n\0 + flags(int32 0) + header extension length(int32 0)
+constexpr char kBinaryHeader[] = "PGCOPY\n\377\r\n\0\0\0\0\0\0\0\0\0";
+constexpr std::size_t kBinaryHeaderLen = 19;
+
+std::string quote_ident(const std::string& name) {
+    std::string out = "\"";
+    for (char c : name) {
+        if (c == '"') out += '"';
+        out += c;
+    }
+    out += '"';
+    return out;
+}
+
+std::string result_sqlstate(const PGresult* res) {
+    const char* s = res ? PQresultErrorField(res, PG_DIAG_SQLSTATE) : nullptr;
+    return s ? s : "";
+}
+
+} // namespace
+
+// ================= PgConnection =================
+
+PgConnection::PgConnection(const std::string& conn_str) {
+    conn_ = PQconnectdb(conn_str.c_str());
+    if (conn_ == nullptr || PQstatus(conn_) != CONNECTION_OK) {
+        std::string msg = conn_ ? PQerrorMessage(conn_) : "out of memory";
+        if (conn_) PQfinish(conn_);
+        conn_ = nullptr;
+        throw PgError("❌ Cannot connect to PostgreSQL: " + msg);
+    }
+}
+
+PgConnection::~PgConnection() {
+    if (conn_) PQfinish(conn_);
+}
+
+void PgConnection::exec(const std::string& sql) {
+    PGresult* res = PQexec(conn_, sql.c_str());
+    ExecStatusType st = PQresultStatus(res);
+    if (st != PGRES_COMMAND_OK && st != PGRES_TUPLES_OK) {
+        std::string msg = PQerrorMessage(conn_);
+        std::string state = result_sqlstate(res);
+        PQclear(res);
+        throw PgError("SQL failed: " + msg, state);
+    }
+    PQclear(res);
+}
+
+// ================= PgConnectionPool =================
+
+PgConnectionPool& PgConnectionPool::instance() {
+    // 故意泄漏：避免进程退出时与 libpq 的析构顺序问题
+    static PgConnectionPool* pool = new PgConnectionPool();
+    return *pool;
+}
+
+std::unique_ptr<PgConnection> PgConnectionPool::acquire(const std::string& conn_str) {
+    {
+        std::lock_guard<std::mutex> lock(mutex_);
+        auto it = idle_.find(conn_str);
+        while (it != idle_.end() && !it->second.empty()) {
+            std::unique_ptr<PgConnection> conn = std::move(it->second.back());
+            it->second.pop_back();
+            if (PQstatus(conn->get()) == CONNECTION_OK) return conn;
+            // 服务端已断开（重启/超时）：丢弃，继续找
+        }
+    }
+    return std::make_unique<PgConnection>(conn_str);
+}
+
+void PgConnectionPool::release(const std::string& conn_str,
+                               std::unique_ptr<PgConnection> conn) {
+    if (!conn) return;
+    PGconn* c = conn->get();
+    if (PQstatus(c) != CONNECTION_OK || PQtransactionStatus(c) != PQTRANS_IDLE) {
+        return; // unique_ptr 析构即关闭
+    }
+    std::lock_guard<std::mutex> lock(mutex_);
+    auto& bucket = idle_[conn_str];
+    if (bucket.size() < kMaxIdlePerKey) bucket.push_back(std::move(conn));
+}
+
+// ================= PgCopyIn =================
+
+PgCopyIn::PgCopyIn(PGconn* conn, const std::string& copy_sql)
+    : conn_(conn) {
+    PGresult* res = PQexec(conn_, copy_sql.c_str());
+    if (PQresultStatus(res) != PGRES_COPY_IN) {
+        std::string msg = PQerrorMessage(conn_);
+        std::string state = result_sqlstate(res);
+        PQclear(res);
+        throw PgError("COPY start failed: " + msg, state);
+    }
+    PQclear(res);
+
+    buf_.reserve(kFlushBytes + 4096);
+}
+
+PgCopyIn::~PgCopyIn() {
+    if (!finished_) {
+        // 异常路径：放弃本次 COPY，服务端会回滚该语句
+        PQputCopyEnd(conn_, "aborted by client");
+        while (PGresult* res = PQgetResult(conn_)) PQclear(res);
+    }
+}
+
+void PgCopyIn::put(const char* data, std::size_t n) {
+    if (PQputCopyData(conn_, data, static_cast<int>(n)) != 1) {
+        throw PgError(std::string("PQputCopyData failed: ") +
+                      PQerrorMessage(conn_));
+    }
+}
+
+void PgCopyIn::flush() {
+    if (buf_.empty()) return;
+    put(buf_.data(), buf_.size());
+    buf_.clear();
+}
+
+void PgCopyIn::finish() {
+    if (finished_) return;
+    flush();
+    finished_ = true;
+
+    if (PQputCopyEnd(conn_, nullptr) != 1) {
+        throw PgError(std::string("PQputCopyEnd failed: ") +
+                      PQerrorMessage(conn_));
+    }
+
+    std::string error, state;
+    while (PGresult* res = PQgetResult(conn_)) {
+        if (PQresultStatus(res) != PGRES_COMMAND_OK && error.empty()) {
+            error = PQresultErrorMessage(res);
+            state = result_sqlstate(res);
+        }
+        PQclear(res);
+    }
+    if (!error.empty()) throw PgError("COPY failed: " + error, state);
+}
+
+// ================= PgBinaryCopy =================
+
+static std::string binary_copy_sql(const std::string& table_name,
+                                   const std::vector<std::string>& columns) {
+    std::string sql = "COPY " + table_name + " (";
+    for (std::size_t i = 0; i < columns.size(); ++i) {
+        if (i) sql += ", ";
+        sql += quote_ident(columns[i]);
+    }
+    sql += ") FROM STDIN WITH (FORMAT binary)";
+    return sql;
+}
+
+PgBinaryCopy::PgBinaryCopy(PGconn* conn,
+                           const std::string& table_name,
+                           const std::vector<std::string>& columns)
+    : PgCopyIn(conn, binary_copy_sql(table_name, columns)) {
+    buf_.append(kBinaryHeader, kBinaryHeaderLen);
+}
+
+void PgBinaryCopy::put_int16(int16_t v) {
+    uint16_t n = htons(static_cast<uint16_t>(v));
+    buf_.append(reinterpret_cast<const char*>(&n), sizeof(n));
+}
+
+void PgBinaryCopy::put_int32(int32_t v) {
+    uint32_t n = htonl(static_cast<uint32_t>(v));
+    buf_.append(reinterpret_cast<const char*>(&n), sizeof(n));
+}
+
+void PgBinaryCopy::begin_row(int16_t ncols) {
+    if (buf_.size() >= kFlushBytes) flush();
+    put_int16(ncols);
+}
+
+void PgBinaryCopy::field_text(std::string_view value) {
+    put_int32(static_cast<int32_t>(value.size()));
+    buf_.append(value.data(), value.size());
+}
+
+void PgBinaryCopy::field_int4(int32_t value) {
+    put_int32(4);
+    put_int32(value);
+}
+
+void PgBinaryCopy::field_null() {
+    put_int32(-1);
+}
+
+void PgBinaryCopy::finish() {
+    if (finished_) return;
+    put_int16(-1);
+    PgCopyIn::finish();
+}
+
+} // namespace pmcad
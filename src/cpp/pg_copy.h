@@ -0,0 +1,182 @@
+// src/cpp/pg_copy.h
+#ifndef PMC_PG_COPY_H
+#define PMC_PG_COPY_H
+
+#include <libpq-fe.h>
+
+#include <cstdint>
+#include <memory>
+#include <mutex>
+#include <stdexcept>
+#include <string>
+#include <string_view>
+#include <unordered_map>
+#include <vector>
+
+namespace pmcad {
+
+/**
+ * @class PgError
+ * @brief libpq 错误，附带 SQLSTATE（可能为空）。
+ */
+class PgError : public std::runtime_error {
+public:
+    PgError(const std::string& msg, std::string sqlstate = "")
+        : std::runtime_error(msg), sqlstate_(std::move(sqlstate)) {}
+
+    const std::string& sqlstate() const { return sqlstate_; }
+
+    /// 40xxx：deadlock_detected / serialization_failure 等，可整事务重试
+    bool is_transient() const { return sqlstate_.rfind("40", 0) == 0; }
+
+private:
+    std::string sqlstate_;
+};
+
+/**
+ * @class PgConnection
+ * @brief libpq 连接的 RAII 封装（COPY 写入需要直接访问 PGconn）。
+ */
+class PgConnection {
+public:
+    explicit PgConnection(const std::string& conn_str);
+    ~PgConnection();
+
+    PgConnection(const PgConnection&) = delete;
+    PgConnection& operator=(const PgConnection&) = delete;
+
+    PGconn* get() const { return conn_; }
+
+    /// 执行一条不返回数据的 SQL，失败时抛出 PgError
+    void exec(const std::string& sql);
+
+private:
+    PGconn* conn_ = nullptr;
+};
+
+/**
+ * @class PgConnectionPool
+ * @brief 进程级连接池：按连接串缓存空闲连接，避免每次导入都重新握手/认证。
+ *
+ * 只回收状态正常且不在事务中的连接；线程安全。
+ */
+class PgConnectionPool {
+public:
+    static PgConnectionPool& instance();
+
+    /// 取一个空闲连接（失效的直接丢弃），没有则新建
+    std::unique_ptr<PgConnection> acquire(const std::string& conn_str);
+
+    /// 归还连接；状态异常或仍在事务中则直接关闭
+    void release(const std::string& conn_str, std::unique_ptr<PgConnection> conn);
+
+private:
+    static constexpr std::size_t kMaxIdlePerKey = 16;
+
+    std::mutex mutex_;
+    std::unordered_map<std::string, std::vector<std::unique_ptr<PgConnection>>> idle_;
+};
+
+/**
+ * @class PooledConnection
+ * @brief RAII：构造时从 PgConnectionPool 借出连接，析构时归还。
+ */
+class PooledConnection {
+public:
+    explicit PooledConnection(std::string conn_str)
+        : conn_str_(std::move(conn_str)),
+          conn_(PgConnectionPool::instance().acquire(conn_str_)) {}
+
+    ~PooledConnection() {
+        PgConnectionPool::instance().release(conn_str_, std::move(conn_));
+    }
+
+    PooledConnection(const PooledConnection&) = delete;
+    PooledConnection& operator=(const PooledConnection&) = delete;
+
+    PgConnection& operator*() const { return *conn_; }
+    PgConnection* operator->() const { return conn_.get(); }
+
+private:
+    std::string conn_str_;
+    std::unique_ptr<PgConnection> conn_;
+};
+
+/**
+ * @class PgCopyIn
+ * @brief COPY ... FROM STDIN 的原始字节写入器。
+ *
+ * write() 只追加到本地缓冲区，满 1 MiB 才调用一次 PQputCopyData；
+ * 单次写入不小于 512 KiB 时跳过本地缓冲区直接发送。
+ * 析构时若尚未 finish()，则放弃本次 COPY（服务端回滚该语句）。
+ */
+class PgCopyIn {
+public:
+    /// copy_sql: 完整的 "COPY ... FROM STDIN ..." 语句
+    PgCopyIn(PGconn* conn, const std::string& copy_sql);
+    virtual ~PgCopyIn();
+
+    PgCopyIn(const PgCopyIn&) = delete;
+    PgCopyIn& operator=(const PgCopyIn&) = delete;
+
+    void write(std::string_view data) {
+        // 大块数据（如 copy_gz_table 的整块解压结果）不再先拷进 buf_：
+        // 先把已缓冲的部分发出去保证顺序，再直接交给 libpq
+        if (data.size() >= kDirectBytes) {
+            flush();
+            put(data.data(), data.size());
+            return;
+        }
+        buf_.append(data.data(), data.size());
+        if (buf_.size() >= kFlushBytes) flush();
+    }
+
+    /// 结束 COPY；检查服务端结果，失败时抛出 PgError
+    virtual void finish();
+
+protected:
+    static constexpr std::size_t kFlushBytes = 1 << 20; // 1 MiB
+    static constexpr std::size_t kDirectBytes = kFlushBytes / 2;
+
+    void flush();
+    void put(const char* data, std::size_t n);
+
+    PGconn* conn_;
+    std::string buf_;
+    bool finished_ = false;
+};
+
+/**
+ * @class PgBinaryCopy
+ * @brief COPY ... FROM STDIN WITH (FORMAT binary) 写入器。
+ *
+ * 二进制格式跳过服务端的文本解析与数值转换：
+ *   文件头: "PGCOPY\n\377\r\n\0" + int32 flags + int32 扩展长度
+ *   每行:   int16 列数，随后每列 int32 长度 + 原始字节（NULL 长度为 -1）
+ *   文件尾: int16 -1
+ * 所有整数均为网络字节序。
+ *
+ * 每个 PgBinaryCopy 对应一条 COPY 语句；在自动提交模式下即一个事务。
+ */
+class PgBinaryCopy : public PgCopyIn {
+public:
+    PgBinaryCopy(PGconn* conn,
+                 const std::string& table_name,
+                 const std::vector<std::string>& columns);
+
+    void begin_row(int16_t ncols);
+    void field_text(std::string_view value);
+    void field_int4(int32_t value);
+    void field_null();
+
+    /// 写文件尾并结束 COPY
+    void finish() override;
+
+private:
+    void put_int16(int16_t v);
+    void put_int32(int32_t v);
+};
+
+} // namespace pmcad
+
+#endif // PMC_PG_COPY_H
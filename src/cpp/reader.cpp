@@ -1,42 +1,394 @@
 #include "reader.h"
-
+#include "pg_copy.h"
+
+#include <dirent.h>
+#include <fcntl.h>
+#include <sys/stat.h>
+#include <zlib.h>
+
+#include <algorithm>
+#include <cctype>
+#include <condition_variable>
+#include <cstring>
+#include <exception>
 #include <filesystem>
 #include <fstream>
+#include <functional>
+#include <iomanip>
 #include <iostream>
-#include <pqxx/pqxx>
+#include <memory>
+#include <mutex>
 #include <regex>
-#include <sstream>
 #include <stdexcept>
+#include <string_view>
+#include <thread>
+#include <unordered_map>
+
+#if defined(__x86_64__) || defined(__i386__)
+#include <immintrin.h>
+#define PMCAD_HAVE_X86 1
+#endif
 
 namespace fs = std::filesystem;
 
 namespace pmcad {
 
-std::vector<std::string> Reader::find_files(
-    const std::string& foldername, const std::string& pattern) {
-    std::vector<std::string> result;
-
-    // 创建正则表达式
-    std::regex regex_pattern(pattern);
-
-    // 使用递归遍历目录
-    for (const auto& entry :
-         fs::recursive_directory_iterator(foldername)) {
-        if (entry.is_regular_file()) {
-            std::string filename =
-                entry.path().filename().string();
-
-            // 检查文件名是否匹配正则表达式
-            if (std::regex_match(filename, regex_pattern)) {
-                // 如果文件名匹配正则表达式，记录路径
-                result.push_back(entry.path().string());
+// ================= 分隔符扫描 =================
+
+static inline std::size_t find_any3_scalar(const char* p, std::size_t n,
+                                           char a, char b, char c) {
+    for (std::size_t i = 0; i < n; ++i) {
+        if (p[i] == a || p[i] == b || p[i] == c) return i;
+    }
+    return n;
+}
+
+#ifdef PMCAD_HAVE_X86
+// 一次比较 32 字节：三个 cmpeq 结果 OR 后 movemask，最低置位即第一个命中
+__attribute__((target("avx2")))
+static std::size_t find_any3_avx2(const char* p, std::size_t n,
+                                  char a, char b, char c) {
+    const __m256i va = _mm256_set1_epi8(a);
+    const __m256i vb = _mm256_set1_epi8(b);
+    const __m256i vc = _mm256_set1_epi8(c);
+
+    std::size_t i = 0;
+    for (; i + 32 <= n; i += 32) {
+        __m256i v = _mm256_loadu_si256(reinterpret_cast<const __m256i*>(p + i));
+        __m256i m = _mm256_or_si256(
+            _mm256_or_si256(_mm256_cmpeq_epi8(v, va), _mm256_cmpeq_epi8(v, vb)),
+            _mm256_cmpeq_epi8(v, vc));
+        unsigned mask = static_cast<unsigned>(_mm256_movemask_epi8(m));
+        if (mask) return i + __builtin_ctz(mask);
+    }
+    return i + find_any3_scalar(p + i, n - i, a, b, c);
+}
+#endif
+
+// 返回 [p, p+n) 中第一个等于 a/b/c 的字节偏移，找不到返回 n。
+// 运行时检测 AVX2，不支持时退回逐字节扫描。
+static std::size_t find_any3(const char* p, std::size_t n,
+                             char a, char b, char c) {
+#ifdef PMCAD_HAVE_X86
+    static const bool has_avx2 = __builtin_cpu_supports("avx2");
+    if (has_avx2) return find_any3_avx2(p, n, a, b, c);
+#endif
+    return find_any3_scalar(p, n, a, b, c);
+}
+
+// 按 '\t' 切分一行，语义与 std::getline(ss, value, '\t') 循环一致：
+// 行尾的一个 '\t' 不产生空字段，空行得到空 row。
+// 单字符查找用 memchr（glibc 已按 SIMD 实现）。
+static void split_tsv_line(const std::string& line,
+                           std::vector<std::string>& row) {
+    const char* data = line.data();
+    const std::size_t n = line.size();
+    std::size_t pos = 0;
+    while (pos < n) {
+        const void* hit = std::memchr(data + pos, '\t', n - pos);
+        if (!hit) {
+            row.emplace_back(data + pos, n - pos);
+            break;
+        }
+        std::size_t t = static_cast<const char*>(hit) - data;
+        row.emplace_back(data + pos, t - pos);
+        pos = t + 1;
+    }
+}
+
+static bool is_regex_meta(char c) {
+    return std::strchr(".[](){}*+?^$|\\", c) != nullptr;
+}
+
+// 从正则中提取"必须出现"的字面前缀 / 后缀，例如
+//   ^final_file_old_(\d+)\.tsv$  →  prefix = "final_file_old_", suffix = ".tsv"
+// 文件名不满足前后缀时可直接跳过，不必进入 regex 引擎。
+// 含 '|' 的模式不做提取（保守起见）。
+void Reader::literal_affixes(const std::string& pattern,
+                             std::string& prefix, std::string& suffix) {
+    prefix.clear();
+    suffix.clear();
+
+    const std::size_t n = pattern.size();
+    for (std::size_t i = 0; i < n; ++i) {
+        if (pattern[i] == '\\') { ++i; continue; }
+        if (pattern[i] == '|') return;
+    }
+
+    // ---- 前缀：从头向后扫描 ----
+    std::size_t i = (n > 0 && pattern[0] == '^') ? 1 : 0;
+    while (i < n) {
+        char c = pattern[i];
+        char lit;
+        std::size_t next;
+        if (c == '\\') {
+            if (i + 1 >= n || std::isalnum(static_cast<unsigned char>(pattern[i + 1])))
+                break; // \d \w \b 等字符类
+            lit = pattern[i + 1];
+            next = i + 2;
+        } else if (is_regex_meta(c)) {
+            break;
+        } else {
+            lit = c;
+            next = i + 1;
+        }
+        if (next < n && std::strchr("?*{", pattern[next])) break; // 可选/可为 0 次
+        prefix += lit;
+        if (next < n && pattern[next] == '+') break;
+        i = next;
+    }
+
+    // ---- 后缀：从尾向前扫描 ----
+    auto escaped = [&](std::size_t pos) {
+        std::size_t nb = 0;
+        while (pos > nb && pattern[pos - 1 - nb] == '\\') ++nb;
+        return nb % 2 == 1;
+    };
+    std::size_t j = n;
+    if (j > 0 && pattern[j - 1] == '$' && !escaped(j - 1)) --j;
+    std::string rev;
+    while (j > 0) {
+        char c = pattern[j - 1];
+        if (escaped(j - 1)) {
+            if (std::isalnum(static_cast<unsigned char>(c))) break;
+            rev += c;
+            j -= 2;
+            continue;
+        }
+        if (is_regex_meta(c)) break;
+        rev += c;
+        --j;
+    }
+    suffix.assign(rev.rbegin(), rev.rend());
+}
+
+// 文件名匹配器：编译好的正则 + 字面前后缀预过滤，构造后只读，可跨线程共享
+struct NameMatcher {
+    std::regex regex;
+    std::string prefix, suffix;
+
+    explicit NameMatcher(const std::string& pattern)
+        : regex(pattern, std::regex::ECMAScript | std::regex::optimize) {
+        Reader::literal_affixes(pattern, prefix, suffix);
+    }
+
+    bool matches(std::string_view filename) const {
+        if (filename.size() < prefix.size() || filename.size() < suffix.size())
+            return false;
+        if (filename.compare(0, prefix.size(), prefix) != 0) return false;
+        if (filename.compare(filename.size() - suffix.size(), suffix.size(), suffix) != 0)
+            return false;
+        return std::regex_match(filename.begin(), filename.end(), regex);
+    }
+};
+
+// 按模式缓存编译结果：同一模式反复扫描不同目录时不必重新编译 std::regex
+static std::shared_ptr<const NameMatcher> get_name_matcher(const std::string& pattern) {
+    static std::mutex cache_mtx;
+    static std::unordered_map<std::string, std::shared_ptr<const NameMatcher> > cache;
+    constexpr std::size_t kMaxCached = 64;
+
+    {
+        std::lock_guard<std::mutex> lock(cache_mtx);
+        auto it = cache.find(pattern);
+        if (it != cache.end()) return it->second;
+    }
+    auto matcher = std::make_shared<const NameMatcher>(pattern);
+    std::lock_guard<std::mutex> lock(cache_mtx);
+    if (cache.size() >= kMaxCached) cache.clear();
+    cache.emplace(pattern, matcher);
+    return matcher;
+}
+
+// 目录项类型：直接用 readdir 返回的 d_type，只有 DT_UNKNOWN（部分文件系统）
+// 和符号链接才需要 fstatat
+enum class EntryKind { kFile, kDir, kOther };
+
+static EntryKind stat_kind(int dir_fd, const char* name) {
+    struct stat st;
+    if (fstatat(dir_fd, name, &st, AT_SYMLINK_NOFOLLOW) != 0) return EntryKind::kOther;
+    if (S_ISREG(st.st_mode)) return EntryKind::kFile;
+    if (S_ISDIR(st.st_mode)) return EntryKind::kDir;
+    if (S_ISLNK(st.st_mode)) {
+        // 与 recursive_directory_iterator 一致：指向普通文件的链接算文件，目录链接不跟随
+        if (fstatat(dir_fd, name, &st, 0) == 0 && S_ISREG(st.st_mode)) return EntryKind::kFile;
+    }
+    return EntryKind::kOther;
+}
+
+static EntryKind entry_kind(int dir_fd, const struct dirent* ent) {
+    switch (ent->d_type) {
+        case DT_REG: return EntryKind::kFile;
+        case DT_DIR: return EntryKind::kDir;
+        case DT_LNK:
+        case DT_UNKNOWN: return stat_kind(dir_fd, ent->d_name);
+        default: return EntryKind::kOther;
+    }
+}
+
+// 读取一层目录（readdir → getdents64），普通文件回调 on_file(name, path)，
+// 子目录回调 on_dir(path)。不为每一项构造 fs::path，也不做多余的 stat。
+template <class OnFile, class OnDir>
+static void scan_dir(const std::string& dir, OnFile&& on_file, OnDir&& on_dir) {
+    DIR* d = opendir(dir.c_str());
+    if (!d) {
+        throw fs::filesystem_error("cannot open directory", dir,
+                                   std::error_code(errno, std::generic_category()));
+    }
+    struct DirCloser {
+        DIR* d;
+        ~DirCloser() { closedir(d); }
+    } closer{d};
+
+    const int fd = dirfd(d);
+    const bool has_slash = !dir.empty() && dir.back() == '/';
+    while (true) {
+        errno = 0;
+        const struct dirent* ent = readdir(d);
+        if (!ent) {
+            if (errno != 0) {
+                throw fs::filesystem_error("cannot read directory", dir,
+                                           std::error_code(errno, std::generic_category()));
             }
+            break;
+        }
+        const char* name = ent->d_name;
+        if (name[0] == '.' && (name[1] == '\0' || (name[1] == '.' && name[2] == '\0')))
+            continue;
+
+        EntryKind kind = entry_kind(fd, ent);
+        if (kind == EntryKind::kOther) continue;
+
+        std::string path = dir;
+        if (!has_slash) path += '/';
+        path += name;
+        if (kind == EntryKind::kFile) {
+            on_file(std::string_view(name), path);
+        } else {
+            on_dir(std::move(path));
+        }
+    }
+}
+
+// 遍历一次目录树，把每个普通文件与所有 matcher 比较；result[k] 为第 k 个模式的匹配
+static std::vector<std::vector<std::string> > find_files_multi(
+    const std::string& foldername,
+    const std::vector<std::shared_ptr<const NameMatcher> >& matchers,
+    int threads) {
+    std::vector<std::vector<std::string> > result(matchers.size());
+
+    auto collect = [&](std::string_view filename, const std::string& path,
+                       std::vector<std::vector<std::string> >& out) {
+        for (std::size_t k = 0; k < matchers.size(); ++k) {
+            if (matchers[k]->matches(filename)) out[k].push_back(path);
         }
+    };
+
+    if (threads <= 0) {
+        threads = static_cast<int>(
+            std::max(1u, std::thread::hardware_concurrency()));
     }
 
+    if (threads == 1) {
+        // 深度优先递归遍历（遇到子目录立即进入，顺序与 recursive_directory_iterator 相同）
+        std::function<void(const std::string&)> walk = [&](const std::string& dir) {
+            scan_dir(
+                dir,
+                // 检查文件名是否匹配正则表达式，匹配则记录路径
+                [&](std::string_view name, const std::string& path) {
+                    collect(name, path, result);
+                },
+                [&](std::string sub) { walk(sub); });
+        };
+        walk(foldername);
+        return result;
+    }
+
+    // ---------- 多线程遍历 ----------
+    // 共享一个目录栈：每个线程取出一个目录，只读它这一层，
+    // 子目录压回栈中，文件就地做正则匹配。
+    // pending = 栈中 + 正在处理的目录数，为 0 时全部完成。
+    std::vector<std::string> dir_stack{foldername};
+    std::size_t pending = 1;
+    std::mutex mtx;
+    std::condition_variable cv;
+    std::exception_ptr error;
+
+    auto worker = [&]() {
+        std::vector<std::vector<std::string> > local_files(matchers.size());
+        std::vector<std::string> local_dirs;
+
+        while (true) {
+            std::string dir;
+            {
+                std::unique_lock<std::mutex> lock(mtx);
+                cv.wait(lock, [&] { return !dir_stack.empty() || pending == 0 || error; });
+                if (dir_stack.empty() || error) break;
+                dir = std::move(dir_stack.back());
+                dir_stack.pop_back();
+            }
+
+            local_dirs.clear();
+            try {
+                // 与 recursive_directory_iterator 一致：不跟随目录符号链接
+                scan_dir(
+                    dir,
+                    [&](std::string_view name, const std::string& path) {
+                        collect(name, path, local_files);
+                    },
+                    [&](std::string sub) { local_dirs.push_back(std::move(sub)); });
+            } catch (...) {
+                std::lock_guard<std::mutex> lock(mtx);
+                if (!error) error = std::current_exception();
+                cv.notify_all();
+                break;
+            }
+
+            {
+                std::lock_guard<std::mutex> lock(mtx);
+                for (auto& d : local_dirs) dir_stack.push_back(std::move(d));
+                pending += local_dirs.size();
+                --pending;
+            }
+            cv.notify_all();
+        }
+
+        std::lock_guard<std::mutex> lock(mtx);
+        for (std::size_t k = 0; k < matchers.size(); ++k) {
+            result[k].insert(result[k].end(),
+                             std::make_move_iterator(local_files[k].begin()),
+                             std::make_move_iterator(local_files[k].end()));
+        }
+    };
+
+    std::vector<std::thread> pool;
+    pool.reserve(threads);
+    for (int i = 0; i < threads; ++i) pool.emplace_back(worker);
+    for (auto& t : pool) t.join();
+
+    if (error) std::rethrow_exception(error);
+
+    // 多线程下遍历顺序不确定，排序保证结果稳定
+    for (auto& files : result) std::sort(files.begin(), files.end());
     return result;
 }
 
+std::vector<std::string> Reader::find_files(
+    const std::string& foldername, const std::string& pattern,
+    int threads) {
+    return std::move(
+        find_files_multi(foldername, {get_name_matcher(pattern)}, threads)[0]);
+}
+
+std::vector<std::vector<std::string> > Reader::find_files_many(
+    const std::string& foldername, const std::vector<std::string>& patterns,
+    int threads) {
+    std::vector<std::shared_ptr<const NameMatcher> > matchers;
+    matchers.reserve(patterns.size());
+    for (const auto& pattern : patterns) matchers.push_back(get_name_matcher(pattern));
+    return find_files_multi(foldername, matchers, threads);
+}
+
 std::vector<std::vector<std::string> > Reader::read_tsv_file(
     const std::string& filename) {
     std::vector<std::vector<std::string> > data;
@@ -51,14 +403,9 @@ std::vector<std::vector<std::string> > Reader::read_tsv_file(
     while (std::getline(file, line)) {
         if (line.empty()) continue; // 跳过空行
 
-        std::stringstream ss(line);
-        std::string value;
         std::vector<std::string> row;
-
-        while (std::getline(ss, value, '\t')) {
-            row.push_back(value);
-        }
-        data.push_back(row);
+        split_tsv_line(line, row);
+        data.push_back(std::move(row));
     }
 
     return data;
@@ -92,6 +439,55 @@ std::vector<std::vector<std::string> > Reader::read_multi_tsv(
     return all_data; // 返回合并后的数据
 }
 
+std::pair<std::vector<std::string>,
+          std::vector<std::vector<std::optional<std::string> > > >
+Reader::read_multi_tsv_columns(const std::vector<std::string>& filelist) {
+    std::vector<std::string> header;
+    std::vector<std::vector<std::optional<std::string> > > columns;
+    bool have_header = false;
+
+    std::vector<std::string> row;
+    std::string line;
+    for (const auto& file : filelist) {
+        std::ifstream in(file);
+        if (!in.is_open()) {
+            std::cerr << "Warning: Failed to read " << file
+                      << ": Cannot open file: " << file << std::endl;
+            continue;
+        }
+
+        // 与 read_multi_tsv 一致：每个文件的第一行非空行是表头，只保留第一个文件的
+        bool skip_header = true;
+        while (std::getline(in, line)) {
+            if (line.empty()) continue; // 跳过空行
+
+            row.clear();
+            split_tsv_line(line, row);
+
+            if (skip_header) {
+                skip_header = false;
+                if (!have_header) {
+                    header = row;
+                    columns.resize(header.size());
+                    have_header = true;
+                }
+                continue;
+            }
+
+            if (row.size() > header.size()) {
+                throw std::runtime_error(
+                    std::to_string(header.size()) + " columns passed, " + file +
+                    " has a row with " + std::to_string(row.size()) + " columns");
+            }
+            size_t i = 0;
+            for (; i < row.size(); ++i) columns[i].emplace_back(std::move(row[i]));
+            for (; i < header.size(); ++i) columns[i].emplace_back(std::nullopt);
+        }
+    }
+
+    return {std::move(header), std::move(columns)};
+}
+
 std::vector<std::vector<std::string> > Reader::read_tsv_safe(
     const std::string& filename, bool skip_errors) {
     std::vector<std::vector<std::string> > data;
@@ -114,14 +510,9 @@ std::vector<std::vector<std::string> > Reader::read_tsv_safe(
         if (line.empty()) continue;
 
         try {
-            std::stringstream ss(line);
-            std::string value;
             std::vector<std::string> row;
-
-            while (std::getline(ss, value, '\t')) {
-                row.push_back(value);
-            }
-            data.push_back(row);
+            split_tsv_line(line, row);
+            data.push_back(std::move(row));
         } catch (const std::exception& e) {
             if (!skip_errors) {
                 throw std::runtime_error(
@@ -176,12 +567,271 @@ std::vector<std::vector<int> > Reader::read_tsv_as_int(
     return result;
 }
 
+// 逐行读取文本文件。gzopen 对未压缩文件是透明的，
+// 因此 .gz 压缩的 TSV 与普通 TSV 走同一条路径（磁盘读取量按压缩后计算）
+class LineReader {
+public:
+    explicit LineReader(const std::string& filename) {
+        gz_ = gzopen(filename.c_str(), "rb");
+        if (!gz_) {
+            throw std::runtime_error("Cannot open file: " + filename);
+        }
+        gzbuffer(gz_, 1 << 20);
+    }
+    ~LineReader() { gzclose(gz_); }
+
+    LineReader(const LineReader&) = delete;
+    LineReader& operator=(const LineReader&) = delete;
+
+    // 与 std::getline 一致：去掉行尾 '\n'，文件结束返回 false
+    bool getline(std::string& line) {
+        line.clear();
+        char buf[65536];
+        while (gzgets(gz_, buf, sizeof(buf))) {
+            std::size_t n = std::strlen(buf);
+            if (n > 0 && buf[n - 1] == '\n') {
+                line.append(buf, n - 1);
+                return true;
+            }
+            line.append(buf, n);
+        }
+        return !line.empty();
+    }
+
+private:
+    gzFile gz_;
+};
+
+// 读取第一行非空行作为表头（与 read_tsv_file 的切分规则一致）
+static std::vector<std::string> read_tsv_header(const std::string& filename) {
+    LineReader file(filename);
+
+    std::string line;
+    while (file.getline(line)) {
+        if (line.empty()) continue;
+
+        std::vector<std::string> row;
+        split_tsv_line(line, row);
+        return row;
+    }
+    return {};
+}
+
+// 把一行 TSV 转成 COPY text 格式追加到 out：
+//   - 反斜杠 / 回车转义
+//   - 行尾的一个 '\t' 视为没有最后一列（与 getline 切分一致）
+//   - 不足的列补 \N（NULL）；列数多于 ncols 时返回 false，out 内容不完整
+static bool append_copy_line(const std::string& line, std::size_t ncols,
+                             std::string& out) {
+    std::size_t end = line.size();
+    if (end > 0 && line[end - 1] == '\t') --end;
+
+    // 普通字节整段拷贝，只在 '\t' / '\\' / '\r' 处停下处理
+    const char* data = line.data();
+    std::size_t field = 1;
+    std::size_t i = 0;
+    while (i < end) {
+        std::size_t k = i + find_any3(data + i, end - i, '\t', '\\', '\r');
+        out.append(data + i, k - i);
+        if (k >= end) break;
+
+        char c = data[k];
+        if (c == '\t') {
+            if (++field > ncols) return false;
+            out += '\t';
+        } else if (c == '\\') {
+            out += "\\\\";
+        } else {
+            out += "\\r";
+        }
+        i = k + 1;
+    }
+    for (; field < ncols; ++field) out += "\t\\N";
+    out += '\n';
+    return true;
+}
+
+// 流式读取一个 TSV 文件（跳过表头），逐行写入 COPY；
+// 不切分成 vector<vector<string>>，整个文件也不会驻留内存
+static void copy_tsv_file(const std::string& filename, std::size_t ncols,
+                          PgCopyIn& copy) {
+    LineReader file(filename);
+
+    std::string line, out;
+    bool header = true;
+    std::size_t lineno = 0;
+    while (file.getline(line)) {
+        ++lineno;
+        if (line.empty()) continue; // 跳过空行
+        if (header) { header = false; continue; }
+
+        out.clear();
+        if (!append_copy_line(line, ncols, out)) {
+            // 与 read_multi_tsv_columns 一致：列数超出表头直接报错，不静默丢列
+            std::size_t nfields = std::count(line.begin(), line.end(), '\t') +
+                                  (line.back() == '\t' ? 0 : 1);
+            throw std::runtime_error(
+                std::to_string(ncols) + " columns passed, " + filename + " line " +
+                std::to_string(lineno) + " has " + std::to_string(nfields) + " columns");
+        }
+        copy.write(out);
+    }
+}
+
+// 原地删除 [p, p+n) 中的所有反斜杠（等价于 sed 's/\\//g'），返回剩余长度。
+// 输出永远不长于输入，写指针不会越过读指针，可直接在解压缓冲区上做。
+static std::size_t strip_backslashes_scalar(char* p, std::size_t n) {
+    std::size_t w = 0, i = 0;
+    while (i < n) {
+        const void* hit = std::memchr(p + i, '\\', n - i);
+        std::size_t k = hit ? static_cast<const char*>(hit) - p : n;
+        if (w != i) std::memmove(p + w, p + i, k - i);
+        w += k - i;
+        i = k + 1;
+    }
+    return w;
+}
+
+#ifdef PMCAD_HAVE_X86
+// 每 32 字节一次 cmpeq + movemask：无反斜杠时整块搬移；
+// 否则按 8 字节一组用 pext 把保留的字节压紧后写出。
+// 整块先读入寄存器，各组写出的 8 字节不超出本块末尾，所以原地操作是安全的。
+__attribute__((target("avx2,bmi2")))
+static std::size_t strip_backslashes_avx2(char* p, std::size_t n) {
+    // 第一个反斜杠之前的部分原样保留，交给 glibc 的 memchr 快速跳过
+    const void* first = std::memchr(p, '\\', n);
+    if (!first) return n;
+    const __m256i vbs = _mm256_set1_epi8('\\');
+    std::size_t i =
+        static_cast<std::size_t>(static_cast<const char*>(first) - p) & ~std::size_t(31);
+    std::size_t w = i;
+    for (; i + 32 <= n; i += 32) {
+        __m256i v = _mm256_loadu_si256(reinterpret_cast<const __m256i*>(p + i));
+        unsigned hit = static_cast<unsigned>(
+            _mm256_movemask_epi8(_mm256_cmpeq_epi8(v, vbs)));
+        if (!hit) {
+            // 尚未删过字节时读写位置重合，无需回写
+            if (w != i) _mm256_storeu_si256(reinterpret_cast<__m256i*>(p + w), v);
+            w += 32;
+            continue;
+        }
+        alignas(32) uint64_t lanes[4];
+        _mm256_store_si256(reinterpret_cast<__m256i*>(lanes), v);
+        for (int k = 0; k < 4; ++k) {
+            unsigned keep = ~(hit >> (8 * k)) & 0xffu;
+            // 每个保留位展开成一个 0xff 字节掩码
+            uint64_t bytes = _pdep_u64(keep, 0x0101010101010101ULL) * 0xff;
+            uint64_t packed = _pext_u64(lanes[k], bytes);
+            std::memcpy(p + w, &packed, 8);
+            w += __builtin_popcount(keep);
+        }
+    }
+    if (i < n) {
+        std::size_t tail = strip_backslashes_scalar(p + i, n - i);
+        std::memmove(p + w, p + i, tail);
+        w += tail;
+    }
+    return w;
+}
+#endif
+
+// 运行时检测 AVX2 + BMI2，不支持时退回 memchr 逐段搬移
+static std::size_t strip_backslashes(char* p, std::size_t n) {
+#ifdef PMCAD_HAVE_X86
+    static const bool has_simd =
+        __builtin_cpu_supports("avx2") && __builtin_cpu_supports("bmi2");
+    if (has_simd) return strip_backslashes_avx2(p, n);
+#endif
+    return strip_backslashes_scalar(p, n);
+}
+
+// 单字符分隔符 → SQL 的 E'...' 字面量
+static std::string sql_escape_delimiter(const std::string& delimiter) {
+    std::string lit = "E'";
+    for (char c : delimiter) {
+        if (c == '\t') lit += "\\t";
+        else if (c == '\\') lit += "\\\\";
+        else if (c == '\'') lit += "''";
+        else lit += c;
+    }
+    lit += '\'';
+    return lit;
+}
+
+void Reader::copy_gz_table(
+    const std::string& gz_file, const std::string& table_name,
+    const std::string& dbname, const std::string& user,
+    const std::string& password, const std::string& host,
+    const std::string& port, const std::string& delimiter,
+    bool skip_header, bool verbose) {
+    std::string conn_str =
+        "dbname=" + dbname + " user=" + user +
+        " password=" + password + " host=" + host +
+        " port=" + port;
+
+    gzFile gz = gzopen(gz_file.c_str(), "rb");
+    if (!gz) {
+        throw std::runtime_error("Cannot open file: " + gz_file);
+    }
+    struct GzCloser {
+        gzFile gz;
+        ~GzCloser() { gzclose(gz); }
+    } closer{gz};
+    gzbuffer(gz, 1 << 20);
+
+    std::error_code ec;
+    const auto total_bytes = fs::file_size(gz_file, ec);
+
+    PooledConnection conn(conn_str);
+    PgCopyIn copy(conn->get(), "COPY " + table_name +
+                                   " FROM STDIN WITH (FORMAT text, DELIMITER " +
+                                   sql_escape_delimiter(delimiter) + ")");
+
+    // 整块解压（1 MiB），跳过表头、去掉反斜杠后直接交给 COPY，
+    // 代替原来的 gunzip | tail | sed | psql 四进程管道
+    std::vector<char> buf(1 << 20);
+    bool skipping = skip_header;
+    int n;
+    while ((n = gzread(gz, buf.data(), static_cast<unsigned>(buf.size()))) > 0) {
+        char* p = buf.data();
+        std::size_t len = static_cast<std::size_t>(n);
+        if (skipping) {
+            const void* nl = std::memchr(p, '\n', len);
+            if (!nl) continue;
+            std::size_t off = static_cast<const char*>(nl) - p + 1;
+            p += off;
+            len -= off;
+            skipping = false;
+        }
+
+        copy.write(std::string_view(p, strip_backslashes(p, len)));
+
+        if (verbose && !ec && total_bytes > 0) {
+            double done = static_cast<double>(gzoffset(gz));
+            std::cout << "\rImporting " << gz_file << ": " << std::fixed
+                      << std::setprecision(1) << done / (1 << 20) << " / "
+                      << static_cast<double>(total_bytes) / (1 << 20) << " MiB ("
+                      << std::setw(3) << int(100.0 * done / total_bytes) << "%)"
+                      << std::flush;
+        }
+    }
+    if (n < 0) {
+        int errnum = 0;
+        throw std::runtime_error("Failed to decompress " + gz_file + ": " +
+                                 gzerror(gz, &errnum));
+    }
+    copy.finish();
+
+    if (verbose) std::cout << std::endl;
+}
+
 void Reader::insert_files_to_pgdb(
     const std::vector<std::string>& filelist,
     const std::string& table_name, const std::string& dbname,
     const std::string& user, const std::string& password,
     const std::string& host = "localhost",
-    const std::string& port = "5432", bool verbose = false) 
+    const std::string& port = "5432", bool verbose = false,
+    bool staging = false) 
 {
     try {
         // 构建连接字符串
@@ -190,15 +840,11 @@ void Reader::insert_files_to_pgdb(
             " password=" + password + " host=" + host +
             " port=" + port;
 
-        pqxx::connection conn(conn_str);
-        if (!conn.is_open()) {
-            throw std::runtime_error("Failed to connect to the database!");
-        }
-
-        pqxx::work txn(conn);
+        PooledConnection conn(conn_str);
 
         size_t total_files = filelist.size();
         bool first_file = true;
+        std::vector<std::string> columns;
 
         for (size_t current = 0; current < total_files; ++current) {
             const auto& file = filelist[current];
@@ -225,45 +871,64 @@ void Reader::insert_files_to_pgdb(
                 std::cout << std::flush;
             }
 
-            auto all_data = read_tsv_file(file);
-            if (all_data.empty()) continue;
-
             if (first_file) {
                 // 建表：只用第一个文件的表头
-                const auto& header = all_data[0];
+                columns = read_tsv_header(file);
+                if (columns.empty()) continue;
+
                 std::string create_sql = "CREATE TABLE IF NOT EXISTS " + table_name + " (";
-                for (size_t i = 0; i < header.size(); i++) {
-                    create_sql += "\"" + header[i] + "\" TEXT";
-                    if (i != header.size() - 1) create_sql += ", ";
+                for (size_t i = 0; i < columns.size(); i++) {
+                    create_sql += "\"" + columns[i] + "\" TEXT";
+                    if (i != columns.size() - 1) create_sql += ", ";
                 }
                 create_sql += ");";
-                txn.exec(create_sql);
+                conn->exec(create_sql);
                 first_file = false;
             }
 
-            // 插入数据（跳过表头）
-            for (size_t r = 1; r < all_data.size(); r++) {
-                const auto& row = all_data[r];
-
-                // 使用 txn.esc 拼接 SQL，避免 exec_params 不支持迭代器的问题
-                std::string insert_sql = "INSERT INTO " + table_name + " VALUES (";
-                for (size_t i = 0; i < row.size(); ++i) {
-                    insert_sql += "'" + txn.esc(row[i]) + "'";
-                    if (i != row.size() - 1) insert_sql += ",";
+            // 每个文件一个事务：原始行直接以 COPY text 格式流入，1 MiB 一块
+            // 多个 worker 并发 COPY 同一张表时，死锁/序列化失败可以整文件重试
+            //
+            // staging=true 时先 COPY 进 TEMP 表（不写 WAL，不触碰目标表的索引/锁），
+            // 整个文件写完后再 INSERT ... SELECT 一次性并入目标表
+            const std::string copy_target = staging ? "pmcad_stage" : table_name;
+            const int max_attempts = 3;
+            for (int attempt = 1;; ++attempt) {
+                try {
+                    conn->exec("BEGIN");
+                    if (staging) {
+                        conn->exec("CREATE TEMP TABLE " + copy_target + " (LIKE " +
+                                  table_name + " INCLUDING DEFAULTS) ON COMMIT DROP");
+                    }
+                    PgCopyIn copy(conn->get(), "COPY " + copy_target + " FROM STDIN");
+                    copy_tsv_file(file, columns.size(), copy);
+                    copy.finish();
+                    if (staging) {
+                        conn->exec("INSERT INTO " + table_name +
+                                  " SELECT * FROM " + copy_target);
+                    }
+                    conn->exec("COMMIT");
+                    break;
+                } catch (const PgError& e) {
+                    conn->exec("ROLLBACK");
+                    // deadlock_detected / serialization_failure 等瞬时错误
+                    if (!e.is_transient() || attempt >= max_attempts) throw;
+                    std::cerr << "\nRetrying " << file << " (" << e.what() << ")" << std::endl;
+                } catch (...) {
+                    conn->exec("ROLLBACK");
+                    throw;
                 }
-                insert_sql += ")";
-                txn.exec(insert_sql);
             }
         }
 
-        txn.commit();
-
         if (verbose) {
             std::cout << "\nAll files imported successfully into table: " << table_name << std::endl;
         }
 
     } catch (const std::exception& e) {
-        std::cerr << "Error importing data into database: " << e.what() << std::endl;
+        // 记录后继续抛出：由 pybind11 转成 Python 的 RuntimeError，调用方才能感知失败
+        std::cerr << "\nError importing data into database: " << e.what() << std::endl;
+        throw;
     }
 }
 
@@ -1,5 +1,7 @@
 #pragma once
+#include <optional>
 #include <string>
+#include <utility>
 #include <vector>
 
 namespace pmcad {
@@ -11,6 +13,12 @@ public:
     static std::vector<std::vector<std::string> >
     read_multi_tsv(const std::vector<std::string>& filelist);
 
+    // 按列读取多个 TSV：返回 (表头, 每列的值)，读取时直接写入列向量，
+    // 不构造逐行的中间结果。行比表头短时缺失的格子为 nullopt（Python 侧为 None）
+    static std::pair<std::vector<std::string>,
+                     std::vector<std::vector<std::optional<std::string> > > >
+    read_multi_tsv_columns(const std::vector<std::string>& filelist);
+
     // 新增功能：带错误处理的读取
     static std::vector<std::vector<std::string> > read_tsv_safe(
         const std::string& filename, bool skip_errors = true);
@@ -22,9 +30,21 @@ public:
         const std::string& filename);
 
     // 新增功能：根据前缀查找文件夹下的所有子文件夹中文件名以给定前缀开头的文件
+    // threads <= 0 时取 CPU 核数；threads == 1 时单线程递归遍历（保持原顺序）
     static std::vector<std::string> find_files(
         const std::string& foldername,
-        const std::string& pattern);
+        const std::string& pattern,
+        int threads = 1);
+
+    // 一次遍历目录树同时匹配多个模式；返回值与 patterns 一一对应
+    static std::vector<std::vector<std::string> > find_files_many(
+        const std::string& foldername,
+        const std::vector<std::string>& patterns,
+        int threads = 1);
+
+    // 提取正则中必须出现的字面前缀/后缀（find_files 的快速预过滤）
+    static void literal_affixes(const std::string& pattern,
+                                std::string& prefix, std::string& suffix);
 
     static void insert_files_to_pgdb(
         const std::vector<std::string>& filelist,
@@ -32,7 +52,20 @@ public:
         const std::string& dbname, const std::string& user,
         const std::string& password,
         const std::string& host,
-        const std::string& port, bool verbose);
+        const std::string& port, bool verbose,
+        bool staging);
+
+    // 把（gzip 压缩的）文本表格流式 COPY 进已存在的表：
+    // 进程内解压、可选跳过首行、删除所有反斜杠，出错时抛异常
+    static void copy_gz_table(
+        const std::string& gz_file,
+        const std::string& table_name,
+        const std::string& dbname, const std::string& user,
+        const std::string& password,
+        const std::string& host,
+        const std::string& port,
+        const std::string& delimiter,
+        bool skip_header, bool verbose);
 };
 
 } // namespace pmcad
\ No newline at end of file
@@ -1,6 +1,9 @@
 // src/cpp/uniprot_importer.cpp
-#include <pqxx/pqxx>
+#include "pg_copy.h"
 #include <zlib.h>
+#include <algorithm>
+#include <cstring>
+#include <memory>
 #include <iostream>
 #include <sstream>
 #include <regex>
@@ -13,10 +16,9 @@
 
 namespace pmcad {
 
-static void ensure_table_ft(pqxx::connection& conn, const std::string& table) {
-    pqxx::work t(conn);
-    t.exec(
-        "CREATE TABLE IF NOT EXISTS " + t.esc(table) + " ("
+static void ensure_table_ft(PgConnection& conn, const std::string& table) {
+    conn.exec(
+        "CREATE TABLE IF NOT EXISTS " + table + " ("
         "  id SERIAL PRIMARY KEY,"
         "  accession TEXT,"
         "  feature_type TEXT,"
@@ -26,13 +28,11 @@ static void ensure_table_ft(pqxx::connection& conn, const std::string& table) {
         "  evidence TEXT"
         ");"
     );
-    t.commit();
 }
 
-static void ensure_table_dr(pqxx::connection& conn, const std::string& table) {
-    pqxx::work t(conn);
-    t.exec(
-        "CREATE TABLE IF NOT EXISTS " + t.esc(table) + " ("
+static void ensure_table_dr(PgConnection& conn, const std::string& table) {
+    conn.exec(
+        "CREATE TABLE IF NOT EXISTS " + table + " ("
         "  id SERIAL PRIMARY KEY,"
         "  accession TEXT,"
         "  db_name TEXT,"
@@ -41,7 +41,6 @@ static void ensure_table_dr(pqxx::connection& conn, const std::string& table) {
         "  evidence TEXT"
         ");"
     );
-    t.commit();
 }
 
 /**
@@ -100,11 +99,9 @@ void UniprotImporter::ft_stream_parse_and_copy(
     std::string conn_str =
         "dbname=" + dbname + " user=" + user + " password=" + password +
         " host=" + host + " port=" + port;
-    pqxx::connection conn(conn_str);
-    if (!conn.is_open())
-        throw std::runtime_error("❌ Cannot connect to PostgreSQL");
+    PooledConnection conn(conn_str);
 
-    ensure_table_ft(conn, table_name);
+    ensure_table_ft(*conn, table_name);
 
     // ---------- 打开 gzip ----------
     gzFile gzfile = gzopen(gz_path.c_str(), "rb");
@@ -129,28 +126,29 @@ void UniprotImporter::ft_stream_parse_and_copy(
     std::regex note_regex(R"REGEX(/note="([^"]+)")REGEX");
     std::regex evi_regex(R"REGEX(/evidence="([^"]+)")REGEX");
 
-    std::unique_ptr<pqxx::work> tx;
-    std::unique_ptr<pqxx::stream_to> writer;
-
-    auto open_stream = [&](std::unique_ptr<pqxx::work>& tx,
-                           std::unique_ptr<pqxx::stream_to>& writer) {
-        tx = std::make_unique<pqxx::work>(conn);
-        pqxx::table_path path{table_name};
-        writer = std::make_unique<pqxx::stream_to>(
-            pqxx::stream_to::table(
-                *tx, path,
-                {"accession", "feature_type", "start_pos", "end_pos", "note", "evidence"}
-            )
-        );
+    // 二进制 COPY：每个批次是一条独立的 COPY 语句（自动提交）
+    const std::vector<std::string> columns = {"accession", "feature_type", "start_pos", "end_pos", "note", "evidence"};
+    std::unique_ptr<PgBinaryCopy> writer;
+
+    auto open_stream = [&]() {
+        writer = std::make_unique<PgBinaryCopy>(conn->get(), table_name, columns);
     };
 
-    auto close_stream = [&](std::unique_ptr<pqxx::work>& tx,
-                            std::unique_ptr<pqxx::stream_to>& writer) {
-        if (writer) { writer->complete(); writer.reset(); }
-        if (tx)     { tx->commit(); tx.reset(); }
+    auto close_stream = [&]() {
+        if (writer) { writer->finish(); writer.reset(); }
     };
 
-    open_stream(tx, writer);
+    open_stream();
+
+    auto write_ft = [&]() {
+        writer->begin_row(6);
+        writer->field_text(accession);
+        writer->field_text(f_type);
+        writer->field_int4(static_cast<int32_t>(std::stol(f_start)));
+        writer->field_int4(static_cast<int32_t>(std::stol(f_end)));
+        writer->field_text(f_note);
+        writer->field_text(f_evi);
+    };
 
     // ---------- 时间统计 ----------
     auto start_time = std::chrono::steady_clock::now();
@@ -173,7 +171,7 @@ void UniprotImporter::ft_stream_parse_and_copy(
             std::smatch m;
             if (std::regex_search(line, m, ft_regex)) {
                 if (in_feature) {
-                    writer->write_values(accession, f_type, f_start, f_end, f_note, f_evi);
+                    write_ft();
                     written++;
                     f_type.clear(); f_start.clear(); f_end.clear(); f_note.clear(); f_evi.clear();
                 }
@@ -190,7 +188,7 @@ void UniprotImporter::ft_stream_parse_and_copy(
 
         if (line.rfind("//", 0) == 0) {
             if (in_feature) {
-                writer->write_values(accession, f_type, f_start, f_end, f_note, f_evi);
+                write_ft();
                 written++;
                 in_feature = false;
                 f_type.clear(); f_start.clear(); f_end.clear(); f_note.clear(); f_evi.clear();
@@ -219,8 +217,8 @@ void UniprotImporter::ft_stream_parse_and_copy(
             }
 
             if (written >= batch_commit) {
-                close_stream(tx, writer);
-                open_stream(tx, writer);
+                close_stream();
+                open_stream();
                 written = 0;
             }
 
@@ -230,11 +228,11 @@ void UniprotImporter::ft_stream_parse_and_copy(
     }
 
     if (in_feature) {
-        writer->write_values(accession, f_type, f_start, f_end, f_note, f_evi);
+        write_ft();
         written++;
     }
 
-    close_stream(tx, writer);
+    close_stream();
     gzclose(gzfile);
 
     auto end_time = std::chrono::steady_clock::now();
@@ -259,11 +257,9 @@ void UniprotImporter::dr_stream_parse_and_copy(
     std::string conn_str =
         "dbname=" + dbname + " user=" + user + " password=" + password +
         " host=" + host + " port=" + port;
-    pqxx::connection conn(conn_str);
-    if (!conn.is_open())
-        throw std::runtime_error("❌ Cannot connect to PostgreSQL");
+    PooledConnection conn(conn_str);
 
-    ensure_table_dr(conn, table_name);
+    ensure_table_dr(*conn, table_name);
 
     // ---------- 打开 gzip ----------
     gzFile gzfile = gzopen(gz_path.c_str(), "rb");
@@ -284,28 +280,19 @@ void UniprotImporter::dr_stream_parse_and_copy(
     std::regex ac_regex(R"(([A-Z0-9]+);)");
     std::regex dr_regex(R"(^DR\s+(\S+);\s*([^;]+)(?:;\s*([^;]+))?(?:;\s*(.*))?)");
 
-    std::unique_ptr<pqxx::work> tx;
-    std::unique_ptr<pqxx::stream_to> writer;
-
-    auto open_stream = [&](std::unique_ptr<pqxx::work>& tx,
-                           std::unique_ptr<pqxx::stream_to>& writer) {
-        tx = std::make_unique<pqxx::work>(conn);
-        pqxx::table_path path{table_name};
-        writer = std::make_unique<pqxx::stream_to>(
-            pqxx::stream_to::table(
-                *tx, path,
-                {"accession", "db_name", "db_id", "description", "evidence"}
-            )
-        );
+    // 二进制 COPY：每个批次是一条独立的 COPY 语句（自动提交）
+    const std::vector<std::string> columns = {"accession", "db_name", "db_id", "description", "evidence"};
+    std::unique_ptr<PgBinaryCopy> writer;
+
+    auto open_stream = [&]() {
+        writer = std::make_unique<PgBinaryCopy>(conn->get(), table_name, columns);
     };
 
-    auto close_stream = [&](std::unique_ptr<pqxx::work>& tx,
-                            std::unique_ptr<pqxx::stream_to>& writer) {
-        if (writer) { writer->complete(); writer.reset(); }
-        if (tx)     { tx->commit(); tx.reset(); }
+    auto close_stream = [&]() {
+        if (writer) { writer->finish(); writer.reset(); }
     };
 
-    open_stream(tx, writer);
+    open_stream();
 
     auto start_time = std::chrono::steady_clock::now();
     std::vector<std::string> accessions;
@@ -339,14 +326,19 @@ void UniprotImporter::dr_stream_parse_and_copy(
 
             if (!db_name.empty() && !accessions.empty()) {
                 for (const auto &acc : accessions) {
-                    writer->write_values(acc, db_name, db_id, desc, evidence);
+                    writer->begin_row(5);
+                    writer->field_text(acc);
+                    writer->field_text(db_name);
+                    writer->field_text(db_id);
+                    writer->field_text(desc);
+                    writer->field_text(evidence);
                     written++;
                 }
             }
 
             if (written % batch_commit == 0) {
-                close_stream(tx, writer);
-                open_stream(tx, writer);
+                close_stream();
+                open_stream();
             }
         }
 
@@ -376,7 +368,7 @@ void UniprotImporter::dr_stream_parse_and_copy(
         }
     }
 
-    close_stream(tx, writer);
+    close_stream();
     gzclose(gzfile);
 
     auto end_time = std::chrono::steady_clock::now();
@@ -401,25 +393,19 @@ void UniprotImporter::sq_stream_parse_and_copy(
     std::string conn_str =
         "dbname=" + dbname + " user=" + user + " password=" + password +
         " host=" + host + " port=" + port;
-    pqxx::connection conn(conn_str);
-    if (!conn.is_open())
-        throw std::runtime_error("❌ Cannot connect to PostgreSQL");
+    PooledConnection conn(conn_str);
 
     // ---------- 建表 ----------
-    {
-        pqxx::work t(conn);
-        t.exec(
-            "CREATE TABLE IF NOT EXISTS " + t.esc(table_name) + " ("
-            "  id SERIAL PRIMARY KEY,"
-            "  accession TEXT,"
-            "  length INT,"
-            "  mol_weight INT,"
-            "  crc64 TEXT,"
-            "  sequence TEXT"
-            ");"
-        );
-        t.commit();
-    }
+    conn->exec(
+        "CREATE TABLE IF NOT EXISTS " + table_name + " ("
+        "  id SERIAL PRIMARY KEY,"
+        "  accession TEXT,"
+        "  length INT,"
+        "  mol_weight INT,"
+        "  crc64 TEXT,"
+        "  sequence TEXT"
+        ");"
+    );
 
     // ---------- 打开 gzip ----------
     gzFile gzfile = gzopen(gz_path.c_str(), "rb");
@@ -442,26 +428,19 @@ void UniprotImporter::sq_stream_parse_and_copy(
     std::regex sq_header_regex(R"(SQ\s+SEQUENCE\s+(\d+)\s+AA;\s+(\d+)\s+MW;\s+([A-F0-9]+)\s+CRC64;)");
     std::regex seq_line_regex(R"(^\s{5}([A-Z\s]+))");
 
-    std::unique_ptr<pqxx::work> tx;
-    std::unique_ptr<pqxx::stream_to> writer;
-
-    auto open_stream = [&](std::unique_ptr<pqxx::work>& tx,
-                           std::unique_ptr<pqxx::stream_to>& writer) {
-        tx = std::make_unique<pqxx::work>(conn);
-        pqxx::table_path path{table_name};
-        writer = std::make_unique<pqxx::stream_to>(
-            pqxx::stream_to::table(*tx, path,
-                {"accession", "length", "mol_weight", "crc64", "sequence"})
-        );
+    // 二进制 COPY：每个批次是一条独立的 COPY 语句（自动提交）
+    const std::vector<std::string> columns = {"accession", "length", "mol_weight", "crc64", "sequence"};
+    std::unique_ptr<PgBinaryCopy> writer;
+
+    auto open_stream = [&]() {
+        writer = std::make_unique<PgBinaryCopy>(conn->get(), table_name, columns);
     };
 
-    auto close_stream = [&](std::unique_ptr<pqxx::work>& tx,
-                            std::unique_ptr<pqxx::stream_to>& writer) {
-        if (writer) { writer->complete(); writer.reset(); }
-        if (tx)     { tx->commit(); tx.reset(); }
+    auto close_stream = [&]() {
+        if (writer) { writer->finish(); writer.reset(); }
     };
 
-    open_stream(tx, writer);
+    open_stream();
 
     size_t written = 0;
     size_t processed_bytes = 0;
@@ -508,7 +487,12 @@ void UniprotImporter::sq_stream_parse_and_copy(
         // 条目结束
         if (line.rfind("//", 0) == 0) {
             if (in_seq && !accession.empty()) {
-                writer->write_values(accession, length, mw, crc64, seq);
+                writer->begin_row(5);
+                writer->field_text(accession);
+                writer->field_int4(length);
+                writer->field_int4(mw);
+                writer->field_text(crc64);
+                writer->field_text(seq);
                 written++;
             }
             in_seq = false;
@@ -520,8 +504,8 @@ void UniprotImporter::sq_stream_parse_and_copy(
 
         // 定期提交批次
         if (written % batch_commit == 0 && written > 0) {
-            close_stream(tx, writer);
-            open_stream(tx, writer);
+            close_stream();
+            open_stream();
         }
 
         // ---------- 实时进度 ----------
@@ -540,7 +524,7 @@ void UniprotImporter::sq_stream_parse_and_copy(
         }
     }
 
-    close_stream(tx, writer);
+    close_stream();
     gzclose(gzfile);
 
     auto end_time = std::chrono::steady_clock::now();
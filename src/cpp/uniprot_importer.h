@@ -10,7 +10,7 @@ namespace pmcad {
  * @class UniprotImporter
  * @brief 边解压边解析 UniProt .dat.gz，并以 COPY 模式写入 PostgreSQL。
  *
- * 通过 libpqxx::stream_to 实现高速流式导入，内存占用恒定。
+ * 通过 libpq 二进制 COPY（PgBinaryCopy）实现高速流式导入，内存占用恒定。
  *
  * 可选参数 verbose 用于打印进度条（百分比、速率、ETA）。
  */
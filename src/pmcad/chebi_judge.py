@@ -1,5 +1,8 @@
 import os
-import json
+
+from src.pmcad.jsonio import read_json, write_json
+from src.pmcad.llm_cache import query_many
+from src.pmcad.judge_utils import QUOTE_TABLE, numbered_output_complete, parse_numbered_output
 
 
 def build_chebi_selection_prompt(original_name: str, hits: list, abstract: str) -> str:
@@ -42,21 +45,120 @@ Your answer:
 """
 
 
+def build_chebi_batch_selection_prompt(items: list, abstract: str) -> str:
+    """
+    把同一篇摘要中的多个化学实体合并到一个 prompt 中，一次调用完成选择。
+
+    items: [(original_name, hits), ...]
+    要求 LLM 按编号逐行输出："1. CHEBI:xxx" / "2. None"。
+    """
+
+    blocks = []
+    for i, (original_name, hits) in enumerate(items, 1):
+        hits_text = "\n".join(
+            [f"   - {h['id']}: {h.get('description', '')}" for h in hits]
+        )
+        blocks.append(f'{i}. ENTITY="{original_name}"\n   CANDIDATES:\n{hits_text}')
+    entities_text = "\n\n".join(blocks)
+
+    return f"""
+You are an expert in chemical entity normalization using ChEBI.
+
+Below are {len(items)} CHEMICAL ENTITIES mentioned in the same biomedical context.
+Each entity is followed by its own CANDIDATE ChEBI entries.
+
+Your task:
+- For EACH entity, select **ONE best ChEBI ID** from ITS OWN candidate list.
+- The correct choice must match the chemical meaning of the entity.
+- If none of the candidates is correct, answer "None" for that entity.
+
+RULES:
+- Reason based on the chemical name and the biological context.
+- Prefer exact chemical entities over classes if applicable.
+- If multiple candidates are plausible, choose the most specific one.
+
+OUTPUT FORMAT:
+- Output EXACTLY {len(items)} lines, one per entity, in the same order.
+- Each line: the entity number, a period, then ONE ChEBI ID from that entity's
+  candidate list, OR "None". For example:
+1. CHEBI:15377
+2. None
+No explanations.
+
+ABSTRACT:
+\"\"\"{abstract}\"\"\"
+
+ENTITIES:
+{entities_text}
+
+Your answer:
+"""
+
+
 def normalize_chebi(s: str):
-    return s.strip().upper().replace('"', "").replace("'", "")
+    return s.strip().translate(QUOTE_TABLE).upper()
+
+
+def build_chebi_hit_index(hits: list) -> dict:
+    """
+    {normalized_id: hit}，同一 ID 保留第一次出现的 hit。
+    """
+    index = {}
+    for h in hits:
+        index.setdefault(normalize_chebi(h["id"]), h)
+    return index
+
+
+def _chebi_hit_names(hit: dict) -> list:
+    """
+    从 extract_chebi_info 生成的 description（"label | ALIASES: a; b"）中取出 label 与同义词。
+    """
+    desc = hit.get("description", "") or ""
+    label, _, rest = desc.partition(" | ")
+    names = [label] if label else []
+    if rest.startswith("ALIASES: "):
+        names.extend(rest[len("ALIASES: ") :].split("; "))
+    return names
+
+
+def exact_name_match(original_name: str, hits: list):
+    """
+    原始名称（规范化后）恰好只与一个 ChEBI ID 的 label / 同义词完全一致时返回该 hit，
+    否则返回 None（无匹配或多个 ID 同名，仍需 LLM 判断）。
+    """
+    name = normalize_chebi(original_name or "")
+    if not name:
+        return None
+
+    matched = {}
+    for h in hits:
+        if any(normalize_chebi(n) == name for n in _chebi_hit_names(h)):
+            matched.setdefault(normalize_chebi(h["id"]), h)
+    if len(matched) != 1:
+        return None
+    return next(iter(matched.values()))
 
 
 def match_llm_output_to_chebi(llm_output: str, hits: list):
     """
     匹配 LLM 返回的 ChEBI ID 到 hits。
+
+    hits 只规范化一次建成 ID 表，先精确查表；
+    输出中夹带其他文字时再退回到子串匹配。
     """
     out = normalize_chebi(llm_output)
 
     if out == "NONE":
         return None
 
-    for h in hits:
-        if normalize_chebi(h["id"]) in out:
+    index = build_chebi_hit_index(hits)
+
+    hit = index.get(out)
+    if hit is not None:
+        return hit
+
+    for norm_id, h in index.items():
+        if norm_id in out:
             return h
 
     return None
@@ -67,6 +169,8 @@ def process_one_folder_judge_chebi_id(
     input_name: str,
     output_name: str,
     llm=None,
+    batch_size: int = 20,
+    concurrency: int = 8,
 ):
     pmid = os.path.basename(folder)
     path = os.path.join(folder, input_name)
@@ -76,8 +180,7 @@ def process_one_folder_judge_chebi_id(
 
     # === load JSON ===
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        data = read_json(path)
     except Exception as e:
         return None, [
             {"type": "status", "name": f"load fail pmid {pmid}"},
@@ -90,47 +193,90 @@ def process_one_folder_judge_chebi_id(
     total = 0
     correct = 0
     total_errors = 0
+    skipped = 0
 
+    pending = []
     for entry in chebi_list:
-        original_name = entry.get("name", "")
-        hits = entry.get("hits", [])
-
-        if not hits:
+        if not entry.get("hits", []):
             entry["llm_best_match"] = None
             continue
 
-        prompt = build_chebi_selection_prompt(
-            original_name=original_name,
-            hits=hits,
-            abstract=abstract,
-        )
+        # 名称与唯一一个候选的 label / 同义词完全一致 → 无需 LLM
+        hit = exact_name_match(entry.get("name", ""), entry["hits"])
+        if hit is not None:
+            entry["llm_raw_output"] = None
+            entry["llm_best_match"] = hit
+            skipped += 1
+            correct += 1
+            total += 1
+            continue
 
-        try:
-            llm_output = llm.query(prompt).strip()
-        except Exception as e:
-            llm_output = f"ERROR: {e}"
-            total_errors += 1
-            entry["llm_raw_output"] = llm_output
-            entry["llm_best_match"] = None
+        pending.append(entry)
+
+    # === 按 batch_size 分组，一个 batch 只调用一次 LLM ===
+    batch_size = max(1, batch_size)
+    batches = []
+    prompts = []
+    validators = []
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start : start + batch_size]
+
+        if len(batch) == 1:
+            entry = batch[0]
+            prompt = build_chebi_selection_prompt(
+                original_name=entry.get("name", ""),
+                hits=entry["hits"],
+                abstract=abstract,
+            )
+        else:
+            prompt = build_chebi_batch_selection_prompt(
+                [(e.get("name", ""), e["hits"]) for e in batch],
+                abstract=abstract,
+            )
+        batches.append(batch)
+        prompts.append(prompt)
+        validators.append(None if len(batch) == 1 else numbered_output_complete(len(batch)))
+
+    # === 各 batch 相互独立，并发请求；缺编号的批量回复不写入缓存，重跑时会重新请求 ===
+    outputs = query_many(llm, prompts, concurrency=concurrency, validate=validators)
+
+    for batch, llm_output in zip(batches, outputs):
+        if isinstance(llm_output, Exception):
+            llm_output = f"ERROR: {llm_output}"
+            total_errors += len(batch)
+            for entry in batch:
+                entry["llm_raw_output"] = llm_output
+                entry["llm_best_match"] = None
             continue
 
-        best_hit = match_llm_output_to_chebi(llm_output, hits)
+        llm_output = llm_output.strip()
+        if len(batch) == 1:
+            answers = [llm_output]
+        else:
+            answers = parse_numbered_output(llm_output, len(batch))
 
-        entry["llm_raw_output"] = llm_output
-        entry["llm_best_match"] = best_hit
+        for entry, answer in zip(batch, answers):
+            best_hit = (
+                match_llm_output_to_chebi(answer, entry["hits"])
+                if answer is not None
+                else None
+            )
 
-        if best_hit is not None:
-            correct += 1
-        total += 1
+            entry["llm_raw_output"] = answer
+            entry["llm_best_match"] = best_hit
+
+            if best_hit is not None:
+                correct += 1
+            total += 1
 
     data["chebi_map"] = chebi_list
 
     out_path = os.path.join(folder, output_name)
-    with open(out_path, "w", encoding="utf-8") as fw:
-        json.dump(data, fw, ensure_ascii=False, indent=2)
+    write_json(out_path, data)
 
     return data, [
         {"type": "status", "name": f"ok pmid {pmid}"},
         {"type": "metric", "name": "judge", "correct": correct, "total": total},
         {"type": "metric", "name": "error", "correct": total_errors, "total": total},
+        {"type": "metric", "name": "skipped", "correct": skipped, "total": total},
     ]
@@ -1,3 +1,39 @@
+# CPR class inventory (ChemProt). CPR:10 is "NOT" (no relation).
+_CPR_DEFS = (
+    ("CPR:1",  "PART_OF",
+     "PART_OF: the chemical is part of / belongs to the protein/gene entity (not usually evaluated)."),
+    ("CPR:2",  "REGULATOR",
+     "REGULATOR (DIRECT/INDIRECT): the chemical regulates the protein/gene (not usually evaluated)."),
+    ("CPR:3",  "UPREGULATOR",
+     "UPREGULATOR (includes ACTIVATOR / INDIRECT_UPREGULATOR): the chemical increases activity/expression/function of the protein/gene."),
+    ("CPR:4",  "DOWNREGULATOR",
+     "DOWNREGULATOR (includes INHIBITOR / INDIRECT_DOWNREGULATOR): the chemical decreases activity/expression/function of the protein/gene."),
+    ("CPR:5",  "AGONIST",
+     "AGONIST (incl. AGONIST-ACTIVATOR / AGONIST-INHIBITOR): the chemical is an agonist of the protein/gene target."),
+    ("CPR:6",  "ANTAGONIST",
+     "ANTAGONIST: the chemical is an antagonist of the protein/gene target."),
+    ("CPR:7",  "MODULATOR",
+     "MODULATOR (incl. MODULATOR-ACTIVATOR / MODULATOR-INHIBITOR): the chemical modulates the protein/gene target (not usually evaluated)."),
+    ("CPR:8",  "COFACTOR",
+     "COFACTOR: the chemical acts as a cofactor for the protein/gene (not usually evaluated)."),
+    ("CPR:9",  "SUBSTRATE_OR_PRODUCT",
+     "SUBSTRATE/PRODUCT_OF/SUBSTRATE_PRODUCT_OF: the chemical is a substrate and/or product of the protein/gene (enzyme) reaction."),
+    ("CPR:10", "NOT",
+     "NOT: explicitly no relation / negative instance between the chemical and protein/gene."),
+)
+
+# search_cpr 的结果与 query 无关，导入时构造一次；各次调用共享这些 dict（只读）
+_CPR_OUT = tuple(
+    {
+        "id": cid,
+        "name": cname,
+        "description": cdesc,
+        "rank": i,         # fixed
+    }
+    for i, (cid, cname, cdesc) in enumerate(_CPR_DEFS, start=1)
+)
+
+
 def search_cpr(
     query=None,
     k=10,
@@ -15,45 +51,10 @@ def search_cpr(
     - No retrieval/reranking; ranks are fixed in CPR order.
     - k controls how many classes you want returned (default 10 => CPR:1..CPR:10)
     - query is accepted for API symmetry but unused.
+    - The returned dicts are shared module-level constants; do not mutate them.
     """
 
-    # CPR class inventory (ChemProt). CPR:10 is "NOT" (no relation).
-    cpr_defs = [
-        ("CPR:1",  "PART_OF",
-         "PART_OF: the chemical is part of / belongs to the protein/gene entity (not usually evaluated)."),
-        ("CPR:2",  "REGULATOR",
-         "REGULATOR (DIRECT/INDIRECT): the chemical regulates the protein/gene (not usually evaluated)."),
-        ("CPR:3",  "UPREGULATOR",
-         "UPREGULATOR (includes ACTIVATOR / INDIRECT_UPREGULATOR): the chemical increases activity/expression/function of the protein/gene."),
-        ("CPR:4",  "DOWNREGULATOR",
-         "DOWNREGULATOR (includes INHIBITOR / INDIRECT_DOWNREGULATOR): the chemical decreases activity/expression/function of the protein/gene."),
-        ("CPR:5",  "AGONIST",
-         "AGONIST (incl. AGONIST-ACTIVATOR / AGONIST-INHIBITOR): the chemical is an agonist of the protein/gene target."),
-        ("CPR:6",  "ANTAGONIST",
-         "ANTAGONIST: the chemical is an antagonist of the protein/gene target."),
-        ("CPR:7",  "MODULATOR",
-         "MODULATOR (incl. MODULATOR-ACTIVATOR / MODULATOR-INHIBITOR): the chemical modulates the protein/gene target (not usually evaluated)."),
-        ("CPR:8",  "COFACTOR",
-         "COFACTOR: the chemical acts as a cofactor for the protein/gene (not usually evaluated)."),
-        ("CPR:9",  "SUBSTRATE_OR_PRODUCT",
-         "SUBSTRATE/PRODUCT_OF/SUBSTRATE_PRODUCT_OF: the chemical is a substrate and/or product of the protein/gene (enzyme) reaction."),
-        ("CPR:10", "NOT",
-         "NOT: explicitly no relation / negative instance between the chemical and protein/gene."),
-    ]
-
-    # slice by k (keep deterministic order)
-    cpr_defs = cpr_defs[: max(0, int(k))]
-
-    out = []
-    for i, (cid, cname, cdesc) in enumerate(cpr_defs, start=1):
-        out.append(
-            {
-                "id": cid,
-                "name": cname,
-                "description": cdesc,
-                "rank": i,         # fixed
-            }
-        )
+    out = list(_CPR_OUT[: max(0, int(k))])
 
     if verbose:
         print("=== CPR CLASSES (Fixed order) ===")
@@ -1,5 +1,8 @@
 import os
-import json
+
+from src.pmcad.jsonio import read_json, write_json
+from src.pmcad.llm_cache import query_many
+from src.pmcad.judge_utils import QUOTE_TABLE, numbered_output_complete, parse_numbered_output
 
 
 def build_cl_selection_prompt(query_name: str, query_desc: str, hits: list) -> str:
@@ -50,8 +53,102 @@ Your answer:
 """
 
 
+def build_cl_batch_selection_prompt(items: list) -> str:
+    """
+    把多个 (query_name, query_desc, hits) 合并到一个 prompt 中，一次调用完成选择。
+
+    要求 LLM 按编号逐行输出："1. CL:xxxxxxx" / "2. None"。
+    """
+
+    blocks = []
+    for i, (query_name, query_desc, hits) in enumerate(items, 1):
+        hits_text = "\n".join(
+            [
+                f"   - {h.get('id', 'NA')} | {h.get('name', 'NA')} | {h.get('description', 'NA')} | score={h.get('score', 'N/A')}"
+                for h in hits
+            ]
+        )
+        blocks.append(
+            f'{i}. QUERY Name: "{query_name}"\n'
+            f'   Description: "{query_desc}"\n'
+            f"   CANDIDATES:\n{hits_text}"
+        )
+    queries_text = "\n\n".join(blocks)
+
+    return f"""
+You are an expert in Cell Ontology (CL).
+
+Below are {len(items)} QUERY CELL TYPE TERMS with their DESCRIPTIONS.
+Each query is followed by its own CANDIDATE CL TERMS.
+
+Your task:
+- For EACH query, select the **single most relevant CL term** from ITS OWN candidates.
+- You MUST select one candidate if any are provided.
+- Only answer "None" if that query's candidate list is empty.
+
+SELECTION CRITERIA:
+- Choose the CL term that is most closely related in meaning to the query.
+- Exact semantic equivalence is NOT required.
+- Functional, developmental, or lineage-level relevance is acceptable.
+- If multiple candidates are plausible, choose the most specific cell type.
+
+OUTPUT FORMAT:
+- Output EXACTLY {len(items)} lines, one per query, in the same order.
+- Each line: the query number, a period, then a CL ID that MUST be one of
+  that query's candidate IDs (or "None"). For example:
+1. CL:0000540
+2. CL:0000236
+- Do NOT output explanations, extra text, or quotes.
+
+QUERIES:
+{queries_text}
+
+Your answer:
+"""
+
+
 def normalize(s: str):
-    return s.strip().lower().replace('"', "").replace("'", "")
+    return s.strip().translate(QUOTE_TABLE).lower()
+
+
+def build_hit_index(hits: list):
+    """
+    预先规范化一次 hits，返回 (hits_by_id, hits_by_name)。
+    同一 key 保留第一次出现的 hit，与逐个遍历的语义一致。
+    """
+    by_id = {}
+    by_name = {}
+    for h in hits:
+        cl_id = h.get("id")
+        if cl_id:
+            by_id.setdefault(normalize(cl_id), h)
+        name = h.get("name")
+        if name:
+            by_name.setdefault(normalize(name), h)
+    return by_id, by_name
+
+
+def select_without_llm(query_name: str, hits: list):
+    """
+    无需 LLM 即可确定答案的情形：
+      1. 只有一个候选（prompt 要求有候选时必须选一个）
+      2. query_name 规范化后恰好只与一个候选 ID 的 name 完全一致
+    其余情况返回 None。
+    """
+    if len(hits) == 1:
+        return hits[0]
+
+    name = normalize(query_name or "")
+    if not name:
+        return None
+
+    matched = {}
+    for h in hits:
+        if h.get("name") and normalize(h["name"]) == name:
+            matched.setdefault(normalize(h.get("id") or ""), h)
+    if len(matched) != 1:
+        return None
+    return next(iter(matched.values()))
 
 
 def match_llm_output_to_hit(llm_output: str, hits: list):
@@ -69,23 +166,22 @@ def match_llm_output_to_hit(llm_output: str, hits: list):
     if out == "none":
         return None
 
-    # 先尝试按 cl_ID 匹配
-    for h in hits:
-        cl_id = h.get("id")
-        if cl_id and normalize(cl_id) == out:
-            return h
-
-    # 再尝试按 name 匹配（兜底）
-    for h in hits:
-        name = h.get("name")
-        if name and normalize(name) == out:
-            return h
+    by_id, by_name = build_hit_index(hits)
 
-    return None
+    # 先尝试按 cl_ID 匹配，再尝试按 name 匹配（兜底）
+    hit = by_id.get(out)
+    if hit is None:
+        hit = by_name.get(out)
+    return hit
 
 
 def process_one_folder_judge_cl_id(
-    folder: str, input_name: str, output_name: str, llm=None
+    folder: str,
+    input_name: str,
+    output_name: str,
+    llm=None,
+    batch_size: int = 20,
+    concurrency: int = 8,
 ):
 
     pmid = os.path.basename(folder)
@@ -96,8 +192,7 @@ def process_one_folder_judge_cl_id(
 
     # === 读取 JSON ===
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        data = read_json(path)
     except Exception as e:
         return None, [
             {"type": "status", "name": f"load fail pmid {pmid}"},
@@ -109,41 +204,82 @@ def process_one_folder_judge_cl_id(
     # === 处理每个 mapping ===
     n_total = 0
     n_selected = 0
-    for entry in cl_list:
+    n_skipped = 0
 
-        query_name = entry.get("name", "")
-        query_desc = entry.get("description", "")
-        hits = entry.get("hits", [])
-
-        if not hits or llm is None:
+    pending = []
+    for entry in cl_list:
+        if not entry.get("hits", []) or llm is None:
             entry["llm_raw_output"] = None
             entry["llm_best_match"] = None
             continue
 
-        # ---- 构建 prompt ----
-        prompt = build_cl_selection_prompt(query_name, query_desc, hits)
+        hit = select_without_llm(entry.get("name", ""), entry["hits"])
+        if hit is not None:
+            entry["llm_raw_output"] = None
+            entry["llm_best_match"] = hit
+            n_skipped += 1
+            n_selected += 1
+            n_total += 1
+            continue
 
-        try:
-            llm_output = llm.query(prompt).strip()
-        except Exception as e:
-            llm_output = f"ERROR: {e}"
+        pending.append(entry)
 
-        # ---- 匹配 LLM 输出 ----
-        best_hit = match_llm_output_to_hit(llm_output, hits)
+    # === 按 batch_size 分组，一个 batch 只调用一次 LLM ===
+    batch_size = max(1, batch_size)
+    batches = []
+    prompts = []
+    validators = []
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start : start + batch_size]
 
-        entry["llm_raw_output"] = llm_output
-        entry["llm_best_match"] = best_hit  # 若失败则为 None
-        n_total += 1
-        if best_hit is not None:
-            n_selected += 1
+        # ---- 构建 prompt ----
+        if len(batch) == 1:
+            entry = batch[0]
+            prompt = build_cl_selection_prompt(
+                entry.get("name", ""), entry.get("description", ""), entry["hits"]
+            )
+        else:
+            prompt = build_cl_batch_selection_prompt(
+                [(e.get("name", ""), e.get("description", ""), e["hits"]) for e in batch]
+            )
+        batches.append(batch)
+        prompts.append(prompt)
+        validators.append(None if len(batch) == 1 else numbered_output_complete(len(batch)))
+
+    # === 各 batch 相互独立，并发请求；缺编号的批量回复不写入缓存，重跑时会重新请求 ===
+    outputs = query_many(llm, prompts, concurrency=concurrency, validate=validators)
+
+    for batch, llm_output in zip(batches, outputs):
+        if isinstance(llm_output, Exception):
+            llm_output = f"ERROR: {llm_output}"
+        else:
+            llm_output = llm_output.strip()
+
+        if len(batch) == 1 or llm_output.startswith("ERROR: "):
+            answers = [llm_output] * len(batch)
+        else:
+            answers = parse_numbered_output(llm_output, len(batch))
+
+        # ---- 匹配 LLM 输出 ----
+        for entry, answer in zip(batch, answers):
+            best_hit = (
+                match_llm_output_to_hit(answer, entry["hits"])
+                if answer is not None
+                else None
+            )
+
+            entry["llm_raw_output"] = answer
+            entry["llm_best_match"] = best_hit  # 若失败则为 None
+            n_total += 1
+            if best_hit is not None:
+                n_selected += 1
 
     data["cl_map"] = cl_list
 
     # === 写回 JSON ===
     out_path = os.path.join(folder, output_name)
     try:
-        with open(out_path, "w", encoding="utf-8") as fw:
-            json.dump(data, fw, ensure_ascii=False, indent=2)
+        write_json(out_path, data)
     except Exception as e:
         return None, [
             {"type": "status", "name": f"write fail pmid {pmid}"},
@@ -153,4 +289,5 @@ def process_one_folder_judge_cl_id(
     return data, [
         {"type": "status", "name": f"ok pmid {pmid}"},
         {"type": "metric", "correct": n_selected, "total": n_total},
+        {"type": "metric", "name": "skipped", "correct": n_skipped, "total": n_total},
     ]
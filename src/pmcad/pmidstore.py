@@ -2,7 +2,9 @@
 import sqlite3
 import json
 import time
-from typing import Optional, Any, Union
+from typing import Optional, Any, Union, Callable
+
+from src.pmcad.jsonio import dumps, loads
 
 
 class PMIDStore:
@@ -170,11 +172,40 @@ class PMIDStore:
         if not row:
             return None
 
-        content = row[0]
-        try:
-            return json.loads(content)
-        except Exception:
-            return content
+        return self._decode(row[0])
+
+    def get_many(self, pmid: Union[int, str], names: list[str]) -> dict:
+        """
+        Get several names under one pmid with a single query.
+        Returns {name: value} in the order of names; missing names map to None.
+        """
+        pmid = int(pmid)
+        names = list(dict.fromkeys(names))
+        out = dict.fromkeys(names)
+
+        # SQLite 单条语句的参数个数有上限，名字很多时分批
+        for chunk in self._chunked(names, 500):
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT name, content FROM files WHERE pmid=? AND name IN ({placeholders})",
+                (pmid, *chunk),
+            ).fetchall()
+            for name, content in rows:
+                out[name] = self._decode(content)
+        return out
+
+    def get_or_compute(self, pmid: Union[int, str], name: str, compute: Callable[[], Any]) -> Any:
+        """
+        Return the stored value under (pmid, name); if missing, call compute(),
+        store its result (unless readonly) and return it.
+        """
+        value = self.get(pmid, name)
+        if value is not None:
+            return value
+        value = compute()
+        if not self.readonly:
+            self.put(pmid, name, value)
+        return value
 
     def put(
         self,
@@ -182,27 +213,52 @@ class PMIDStore:
         name: str,
         value: Union[str, dict, list],
     ):
+        self.put_many(pmid, {name: value})
+
+    def put_many(self, pmid: Union[int, str], items: dict):
+        """
+        Write several {name: value} under one pmid in a single transaction
+        (all or nothing).
+        """
         if self.readonly:
             raise RuntimeError("PMIDStore opened readonly")
 
         pmid = int(pmid)
-
-        if isinstance(value, (dict, list)):
-            content = json.dumps(value, ensure_ascii=False)
-        else:
-            content = str(value)
+        rows = [(pmid, name, self._encode(value)) for name, value in items.items()]
 
         self.conn.execute("BEGIN;")
         try:
-            self.conn.execute(
+            self.conn.executemany(
                 "INSERT OR REPLACE INTO files(pmid, name, content) VALUES (?, ?, ?)",
-                (pmid, name, content),
+                rows,
             )
             self.conn.execute("COMMIT;")
         except Exception:
             self.conn.execute("ROLLBACK;")
             raise
 
+    @staticmethod
+    def _decode(content: str) -> Any:
+        try:
+            return loads(content)
+        except Exception:
+            pass
+        # orjson 不接受 NaN / Infinity；旧数据由标准库 json 写入时可能含有
+        try:
+            return json.loads(content)
+        except Exception:
+            return content
+
+    @staticmethod
+    def _encode(value: Union[str, dict, list]) -> str:
+        if isinstance(value, (dict, list)):
+            try:
+                return dumps(value)
+            except TypeError:
+                # orjson 不支持的值（如超过 64 位的整数）退回标准库
+                return json.dumps(value, ensure_ascii=False)
+        return str(value)
+
     # --------------------------
     # helpers
     # --------------------------
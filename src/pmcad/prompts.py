@@ -2,12 +2,16 @@ import importlib.resources as pkg_resources
 import resources.prompts
 
 
+import functools
 from importlib import resources
 
 
+@functools.lru_cache(maxsize=128)
 def get_prompt(prompt_filename: str) -> str:
     """
     支持多层路径: "summary_attention_dag/initial_prompt.txt"
+
+    模板在进程内只读取一次（按文件名缓存）；运行中修改模板文件需重启进程才生效。
     """
     parts = prompt_filename.split("/")
     if len(parts) == 1:
@@ -1,8 +1,11 @@
+import os
 import yaml
 from pathlib import Path
 import subprocess
 import json
 import tempfile
+import functools
+import threading
 import requests
 from typing import Optional, Dict, Any
 
@@ -236,12 +239,39 @@ def bulk_insert(
     return res
 
 
+@functools.lru_cache(maxsize=8)
+def _load_es_yaml_cached(path, mtime_ns):
+    return load_es_yaml(path)
+
+
+def _es_config(config_path):
+    """
+    读取 ES 配置（按文件 mtime 缓存，配置文件被修改后自动重新加载）。
+    """
+    path = os.path.abspath(config_path)
+    return _load_es_yaml_cached(path, os.stat(path).st_mtime_ns)["elasticsearch"]
+
+
+_session_local = threading.local()
+
+
+def _es_session():
+    """
+    每个线程一个 requests.Session：复用 TCP/TLS 连接（keep-alive），
+    避免每次查询都重新握手。Session 本身不保证线程安全，所以按线程隔离。
+    """
+    session = getattr(_session_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        _session_local.session = session
+    return session
+
+
 def search_via_curl(config_path, index_name, query_json):
-    cfg = load_es_yaml(config_path)
-    es = cfg["elasticsearch"]
+    es = _es_config(config_path)
     es_url = es["url"]
 
-    r_knn = requests.post(
+    r_knn = _es_session().post(
         f"{es_url}/{index_name}/_search",
         auth=(es["user"], es["password"]),
         verify=es["ca_cert"],
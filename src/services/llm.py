@@ -2,15 +2,36 @@
 import requests
 import json
 import os
+import threading
+import time
 
 # 你之前的设置，为了避免 requests 被系统代理干扰
 os.environ["NO_PROXY"] = "*"
 
 
+_session_local = threading.local()
+
+
+def _llm_session():
+    """
+    每个线程一个 requests.Session：复用到 LLM 服务的 TCP/TLS 连接（keep-alive），
+    避免并发 worker 每次请求都重新握手。Session 不保证线程安全，所以按线程隔离。
+    """
+    session = getattr(_session_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        _session_local.session = session
+    return session
+
+
 class LLM:
     """
     Minimal LLM interface for querying a local or remote chat model endpoint.
-    Supports Ollama / OpenAI-like formats.
+    Supports Ollama / OpenAI-like / Anthropic Messages formats.
+
+    system_prompt 适合放跨请求不变的长前缀（指令、候选列表等）：
+      - Anthropic：system 块带 cache_control=ephemeral，命中后按缓存读计费
+      - Ollama / OpenAI-like：静态前缀在前，服务端的前缀缓存（KV cache）可复用
     """
 
     def __init__(
@@ -22,13 +43,17 @@ class LLM:
         remove_think: bool = True,
         temperature: float | None = None,
         proxy_url: str = None,  # 如 "http://127.0.0.1:7897"
+        keep_alive=-1,  # Ollama: -1 表示模型常驻，不因空闲被卸载
+        max_tokens: int = 4096,  # Anthropic 必填
     ):
         self.api_key = api_key
         self.llm_url = llm_url
         self.model_name = model_name
-        self.format = format  # "ollama" or "openai"
+        self.format = format  # "ollama" / "openai" / "qwen" / "anthropic"
         self.remove_think_enabled = remove_think
         self.temperature = temperature
+        self.keep_alive = keep_alive
+        self.max_tokens = max_tokens
         if proxy_url:
             self.proxies = {
                 "http": proxy_url,
@@ -46,41 +71,27 @@ class LLM:
             text = text[:start] + text[end + len(end_tag):]
         return text.strip()
 
-    def query(self, prompt: str, system_prompt: str = "", verbose: bool = False) -> str:
+    def query(
+        self, prompt: str, system_prompt: str = "", verbose: bool = False, json_schema: dict | None = None
+    ) -> str:
         """
         Send a prompt to the model and return its textual response.
+        json_schema: 约束输出为符合该 JSON Schema 的 JSON（见 _openai_request）
         """
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-        }
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": prompt + " /no_think"},
-        ]
-        if self.temperature is None:
-            payload = {
-                "model": self.model_name,
-                "messages": messages,
-                "stream": False,
-            }
+        if self.format == "anthropic":
+            headers, payload = self._anthropic_request(prompt, system_prompt)
         else:
-            payload = {
-                "model": self.model_name,
-                "messages": messages,
-                "stream": False,
-                "temperature": self.temperature,
-            }
+            headers, payload = self._openai_request(prompt, system_prompt, json_schema)
 
         # ========= 关键点：加入 proxies = self.proxies =========
         if self.proxies is None:
-            response = requests.post(
+            response = _llm_session().post(
                 self.llm_url,
                 headers=headers,
                 json=payload,
             )
         else:
-            response = requests.post(
+            response = _llm_session().post(
                 self.llm_url,
                 headers=headers,
                 json=payload,
@@ -88,19 +99,312 @@ class LLM:
             )
 
         response.raise_for_status()
-        data = response.json()
+        text = self._response_text(response.json())
 
+        if verbose:
+            print(f"\n[Prompt]\n{prompt}\n\n[Response]\n{text}\n")
+
+        return text
+
+    def query_stream(
+        self,
+        prompt: str,
+        system_prompt: str = "",
+        should_stop=None,
+        verbose: bool = False,
+        json_schema: dict | None = None,
+    ) -> str:
+        """
+        流式版本的 query：边接收边拼接文本。
+        should_stop(delta) 每收到一段增量文本调用一次，返回 True 时立即断开连接
+        （例如输出里需要的 JSON 已经完整，不必再等模型写完后面的解释）。
+        """
+        if self.format == "anthropic":
+            headers, payload = self._anthropic_request(prompt, system_prompt)
+        else:
+            headers, payload = self._openai_request(prompt, system_prompt, json_schema)
+        payload["stream"] = True
+
+        kwargs = {"headers": headers, "json": payload, "stream": True}
+        if self.proxies is not None:
+            kwargs["proxies"] = self.proxies
+
+        parts = []
+        with _llm_session().post(self.llm_url, **kwargs) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                delta = self._stream_delta(line)
+                if not delta:
+                    continue
+                parts.append(delta)
+                if should_stop is not None and should_stop(delta):
+                    break
+
+        text = "".join(parts)
+        if self.remove_think_enabled:
+            text = self.remove_think(text)
+
+        if verbose:
+            print(f"\n[Prompt]\n{prompt}\n\n[Response]\n{text}\n")
+
+        return text
+
+    def _stream_delta(self, line: bytes) -> str:
+        """
+        解析流式响应的一行，返回其中的增量文本（没有则返回 ""）：
+          - Ollama：每行一个 JSON（NDJSON）
+          - OpenAI-like / Anthropic：SSE，"data: {...}" 行
+        """
+        if not line:
+            return ""
+        if self.format == "ollama":
+            return json.loads(line).get("message", {}).get("content", "")
+        if not line.startswith(b"data:"):
+            return ""
+        data = line[5:].strip()
+        if data == b"[DONE]":
+            return ""
+        event = json.loads(data)
+        if self.format == "anthropic":
+            if event.get("type") == "content_block_delta":
+                return event.get("delta", {}).get("text", "")
+            return ""
+        choices = event.get("choices") or [{}]
+        return choices[0].get("delta", {}).get("content") or ""
+
+    def _response_text(self, data: dict) -> str:
+        """从各格式的响应体中取出文本（按需去掉 <think>）。"""
         if self.format == "ollama":
             text = data.get("message", {}).get("content", "")
         elif self.format in ["openai", "qwen"]:
             text = data["choices"][0]["message"]["content"]
+        elif self.format == "anthropic":
+            text = "".join(
+                b.get("text", "") for b in data.get("content", []) if b.get("type") == "text"
+            )
         else:
             text = str(data)
 
         if self.remove_think_enabled:
             text = self.remove_think(text)
+        return text
 
-        if verbose:
-            print(f"\n[Prompt]\n{prompt}\n\n[Response]\n{text}\n")
+    def _openai_request(self, prompt: str, system_prompt: str, json_schema: dict | None = None):
+        """
+        Ollama / OpenAI-like chat 请求。
+        json_schema 给出时由服务端做受约束解码（Ollama: format；OpenAI / vLLM: response_format），
+        输出必然是合法 JSON。Anthropic Messages API 没有对应参数，忽略。
+        """
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+        }
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt + " /no_think"},
+        ]
+        if self.temperature is None:
+            payload = {
+                "model": self.model_name,
+                "messages": messages,
+                "stream": False,
+            }
+        else:
+            payload = {
+                "model": self.model_name,
+                "messages": messages,
+                "stream": False,
+                "temperature": self.temperature,
+            }
+
+        if self.format == "ollama" and self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+
+        if json_schema is not None:
+            if self.format == "ollama":
+                payload["format"] = json_schema
+            else:
+                payload["response_format"] = {
+                    "type": "json_schema",
+                    "json_schema": {"name": "output", "schema": json_schema},
+                }
+        return headers, payload
+
+    def _anthropic_request(self, prompt: str, system_prompt: str):
+        """
+        Anthropic Messages API：system 作为可缓存前缀（cache_control=ephemeral），
+        同一前缀 5 分钟内的后续请求只对 user 部分按全价计费。
+        """
+        headers = self._anthropic_headers()
+        payload = {
+            "model": self.model_name,
+            "max_tokens": self.max_tokens,
+            "messages": [{"role": "user", "content": prompt}],
+        }
+        if system_prompt:
+            payload["system"] = [
+                {
+                    "type": "text",
+                    "text": system_prompt,
+                    "cache_control": {"type": "ephemeral"},
+                }
+            ]
+        if self.temperature is not None:
+            payload["temperature"] = self.temperature
+        return headers, payload
+
+    def _anthropic_headers(self) -> dict:
+        return {
+            "x-api-key": self.api_key,
+            "anthropic-version": "2023-06-01",
+            "Content-Type": "application/json",
+        }
+
+    def warmup(self):
+        """
+        发送一次极短的请求，让服务端提前加载模型（Ollama 冷启动需要十几秒）。
+        失败时只打印提示，不抛出。
+        """
+        try:
+            self.query("ping")
+        except Exception as e:
+            print(f"[LLM] warmup failed: {e}")
+
+    # --------------------------
+    # Batch API（离线大批量：服务端排队执行，按半价计费，24h 内完成）
+    # --------------------------
+    def _http(self, method: str, url: str, **kwargs):
+        if self.proxies is not None:
+            kwargs["proxies"] = self.proxies
+        response = _llm_session().request(method, url, **kwargs)
+        response.raise_for_status()
+        return response
+
+    def _batch_base(self) -> str:
+        """
+        由 llm_url 推出 Batch API 的根地址：
+          - Anthropic：.../v1/messages → .../v1/messages/batches
+          - OpenAI-like：.../v1/chat/completions → .../v1
+        """
+        if self.format == "anthropic":
+            return self.llm_url.rstrip("/") + "/batches"
+        if self.format in ["openai", "qwen"]:
+            return self.llm_url.rstrip("/").removesuffix("/chat/completions")
+        raise ValueError(f"Batch API not supported for format={self.format!r}")
+
+    def submit_batch(self, requests_: list[tuple[str, str]], system_prompt: str = "") -> str:
+        """
+        提交一批请求，返回 batch_id。
+        requests_: [(custom_id, prompt), ...]；custom_id 需唯一，且只含字母数字、- 和 _
+                   （Anthropic 的限制，OpenAI 更宽松）
+        """
+        base = self._batch_base()
+
+        if self.format == "anthropic":
+            reqs = []
+            for custom_id, prompt in requests_:
+                _, payload = self._anthropic_request(prompt, system_prompt)
+                reqs.append({"custom_id": custom_id, "params": payload})
+            headers = self._anthropic_headers()
+            data = self._http("POST", base, headers=headers, json={"requests": reqs}).json()
+            return data["id"]
+
+        lines = []
+        for custom_id, prompt in requests_:
+            _, payload = self._openai_request(prompt, system_prompt)
+            payload.pop("stream", None)
+            lines.append(json.dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": payload,
+            }, ensure_ascii=False))
+        auth = {"Authorization": f"Bearer {self.api_key}"}
+
+        upload = self._http(
+            "POST",
+            f"{base}/files",
+            headers=auth,
+            data={"purpose": "batch"},
+            files={"file": ("batch.jsonl", ("\n".join(lines) + "\n").encode("utf-8"))},
+        ).json()
+        data = self._http(
+            "POST",
+            f"{base}/batches",
+            headers=auth,
+            json={
+                "input_file_id": upload["id"],
+                "endpoint": "/v1/chat/completions",
+                "completion_window": "24h",
+            },
+        ).json()
+        return data["id"]
+
+    def batch_status(self, batch_id: str) -> str:
+        """
+        返回统一后的状态："in_progress" / "ended"（可取结果）/ "failed"
+        """
+        base = self._batch_base()
+        if self.format == "anthropic":
+            headers = self._anthropic_headers()
+            data = self._http("GET", f"{base}/{batch_id}", headers=headers).json()
+            return "ended" if data.get("processing_status") == "ended" else "in_progress"
+
+        auth = {"Authorization": f"Bearer {self.api_key}"}
+        status = self._http("GET", f"{base}/batches/{batch_id}", headers=auth).json().get("status")
+        if status in ("completed", "expired", "cancelled"):
+            # expired / cancelled 的 batch 已完成的部分仍可下载
+            return "ended"
+        if status == "failed":
+            return "failed"
+        return "in_progress"
+
+    def wait_batch(self, batch_id: str, poll_interval: float = 60.0) -> str:
+        """轮询直到 batch 结束，返回最终状态。"""
+        while True:
+            status = self.batch_status(batch_id)
+            if status != "in_progress":
+                return status
+            time.sleep(poll_interval)
+
+    def batch_results(self, batch_id: str) -> dict:
+        """
+        下载已结束 batch 的结果：{custom_id: text}；
+        单条失败时值为 Exception（与 query_many 一致），未出现的 custom_id 视为未完成。
+        """
+        base = self._batch_base()
+        results = {}
+
+        if self.format == "anthropic":
+            headers = self._anthropic_headers()
+            meta = self._http("GET", f"{base}/{batch_id}", headers=headers).json()
+            body = self._http("GET", meta["results_url"], headers=headers).text
+            for line in body.splitlines():
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                result = item.get("result", {})
+                if result.get("type") == "succeeded":
+                    results[item["custom_id"]] = self._response_text(result["message"])
+                else:
+                    results[item["custom_id"]] = RuntimeError(json.dumps(result, ensure_ascii=False))
+            return results
 
-        return text
\ No newline at end of file
+        auth = {"Authorization": f"Bearer {self.api_key}"}
+        meta = self._http("GET", f"{base}/batches/{batch_id}", headers=auth).json()
+        for key in ("output_file_id", "error_file_id"):
+            file_id = meta.get(key)
+            if not file_id:
+                continue
+            body = self._http("GET", f"{base}/files/{file_id}/content", headers=auth).text
+            for line in body.splitlines():
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                response = item.get("response") or {}
+                if item.get("error") is None and response.get("status_code") == 200:
+                    results[item["custom_id"]] = self._response_text(response["body"])
+                else:
+                    err = item.get("error") or response.get("body")
+                    results[item["custom_id"]] = RuntimeError(json.dumps(err, ensure_ascii=False))
+        return results